@@ -0,0 +1,109 @@
+"""Latency and debouncing of the edge-triggered buttons, with the fake GPIO (no Pi needed).
+
+Simulates bouncing button presses on buttons.FakeGPIO and measures the time from the
+falling edge to the action running on an event loop thread (a queue, like Tk's after()).
+The contact bounces open right after the first edge, so the pin reads HIGH at that point,
+and a short glitch follows each press. Every press has to run its action exactly once,
+no glitch may run it, and every bounce has to show up in the report. The latency includes
+the 10 ms settle time; for comparison, the old 50 ms polling loop added 25 ms on average
+and up to 50 ms.
+
+    python3 Benchmarks/button_benchmark.py [--presses N] [--bounces N]
+"""
+import os
+import sys
+import time
+import queue
+import random
+import threading
+
+import numpy as np
+
+# The shared modules live in the project root, one folder up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from buttons import ButtonHandler, FakeGPIO
+
+PIN = 27
+
+
+def event_loop(events, stop):
+    """Runs the dispatched actions one after the other, like the Tk main loop."""
+    while not stop.is_set():
+        try:
+            action = events.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        action()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    presses = 200
+    bounces = 5
+    while args:
+        arg = args.pop(0)
+        if arg == '--presses':
+            presses = int(args.pop(0))
+        elif arg == '--bounces':
+            bounces = int(args.pop(0))
+        else:
+            print(__doc__)
+            sys.exit(1)
+
+    events = queue.Queue()
+    stop = threading.Event()
+    loop = threading.Thread(target=event_loop, args=(events, stop), daemon=True)
+    loop.start()
+
+    gpio = FakeGPIO()
+    gpio.setmode(gpio.BCM)
+    handler = ButtonHandler(gpio, events.put, bouncetime_ms=50)
+
+    pressed_at = []
+    latencies = []
+    handled = threading.Event()
+
+    def action():
+        latencies.append(time.perf_counter() - pressed_at[-1])
+        handled.set()
+
+    handler.add(PIN, action)
+
+    rng = random.Random(0)
+    for _ in range(presses):
+        handled.clear()
+        pressed_at.append(time.perf_counter())
+        gpio.press(PIN)
+        for _ in range(bounces):  # contact bounce within the first milliseconds
+            gpio.release(PIN)
+            time.sleep(rng.uniform(0.0002, 0.001))
+            gpio.press(PIN)
+        handled.wait(1.0)
+        time.sleep(0.01)
+        gpio.release(PIN)
+        time.sleep(0.06)  # longer than the bouncetime, the next press is a new one
+        gpio.press(PIN)  # glitch, gone before the settle time
+        time.sleep(0.0005)
+        gpio.release(PIN)
+        time.sleep(0.06)
+
+    stop.set()
+    loop.join()
+    handler.close()
+
+    latencies_ms = np.array(latencies) * 1000
+    print(f"{presses} presses with {bounces} bounces each: {len(latencies)} actions run")
+    print(handler.report())
+    if len(latencies_ms):
+        p50, p99 = np.percentile(latencies_ms, [50, 99])
+        print(f"Edge to action: p50 {p50:.3f} ms, p99 {p99:.3f} ms, max {latencies_ms.max():.3f} ms (polling: ~25 ms, up to 50 ms)")
+    if len(latencies) != presses:
+        print("FAIL: every press has to run its action exactly once")
+        sys.exit(1)
+    if handler.rejected != presses:
+        print("FAIL: every glitch has to be ignored")
+        sys.exit(1)
+    if handler.bounces + gpio.suppressed != presses * bounces:
+        print("FAIL: every bounce has to be counted")
+        sys.exit(1)
+    print("OK")
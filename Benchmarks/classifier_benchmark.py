@@ -0,0 +1,131 @@
+"""Compares the .eim runner with the in-process NumPy classifier on recorded data.
+
+Checks that both give the same results (same top class, scores within --tolerance) and
+measures single-sample latency and throughput, plus batched throughput of the in-process
+classifier. model.npz comes from edge_impulse_model.py (float32 export of the same impulse).
+
+The tolerance depends on the .eim: built with the float32 model the scores match to 1e-4.
+Edge Impulse builds the int8 (quantized) model by default, its scores come in steps of 1/256
+and the quantized weights shift them further, so for those .eim files the default tolerance is
+QUANTIZED_TOLERANCE and a different top class only counts where it is not a near tie.
+
+    python3 Benchmarks/classifier_benchmark.py model.npz [model.eim] [--data folder] [--limit N] [--tolerance T]
+    python3 Benchmarks/classifier_benchmark.py --synthetic    # random weights, no model files needed
+"""
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+# The shared modules live in the project root, one folder up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from batch_inference import load_samples, DEFAULT_DATA_DIR
+from classifier_backends import DenseNetworkClassifier, EimClassifier
+
+FLOAT_TOLERANCE = 1e-4
+QUANTIZED_TOLERANCE = 0.05  # int8 .eim against the float32 weights
+
+
+def write_synthetic_weights(path, labels=('blueberry', 'chocolateicecream', 'cinnamon', 'empty', 'mango'),
+                            inputs=15, hidden=(20, 10), seed=0):
+    """Random dense network in the .npz format of DenseNetworkClassifier."""
+    rng = np.random.default_rng(seed)
+    arrays = {'labels': np.array(labels), 'input_scale': np.float32(1.0 / 60000)}
+    sizes = (inputs,) + tuple(hidden) + (len(labels),)
+    for i in range(len(sizes) - 1):
+        arrays[f'layer{i}_weights'] = rng.normal(0, 1, (sizes[i], sizes[i + 1])).astype(np.float32)
+        arrays[f'layer{i}_bias'] = rng.normal(0, 0.1, sizes[i + 1]).astype(np.float32)
+    np.savez(path, **arrays)
+
+
+def time_single(classifier, features):
+    """Returns (results, per-call latencies in seconds)."""
+    results = []
+    latencies = []
+    for f in features:
+        start = time.perf_counter()
+        results.append(classifier.classify(f))
+        latencies.append(time.perf_counter() - start)
+    return results, np.array(latencies)
+
+
+def print_timing(name, latencies):
+    p50, p99 = np.percentile(latencies * 1000, [50, 99])
+    print(f"{name:<22} {len(latencies) / latencies.sum():10.0f} /s   p50 {p50:8.3f} ms   p99 {p99:8.3f} ms")
+
+
+def compare(reference, other, labels, tolerance):
+    """Number of samples where the top class differs (beyond a tie within `tolerance`) and the largest score difference."""
+    top_mismatches = 0
+    max_difference = 0.0
+    for a, b in zip(reference, other):
+        scores_a = a['result']['classification']
+        scores_b = b['result']['classification']
+        top_a = max(scores_a, key=scores_a.get)
+        top_b = max(scores_b, key=scores_b.get)
+        if top_a != top_b and scores_b[top_b] - scores_b[top_a] > tolerance:
+            top_mismatches += 1
+        max_difference = max(max_difference, max(abs(scores_a[label] - scores_b[label]) for label in labels))
+    return top_mismatches, max_difference, max_difference <= tolerance
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    data_dir = DEFAULT_DATA_DIR
+    limit = 2000
+    tolerance = None
+    models = []
+    while args:
+        arg = args.pop(0)
+        if arg == '--data':
+            data_dir = args.pop(0)
+        elif arg == '--limit':
+            limit = int(args.pop(0))
+        elif arg == '--tolerance':
+            tolerance = float(args.pop(0))
+        else:
+            models.append(arg)
+
+    if not models:
+        print(__doc__)
+        sys.exit(1)
+
+    if models[0] == '--synthetic':
+        models[0] = os.path.join(tempfile.mkdtemp(), 'synthetic.npz')
+        write_synthetic_weights(models[0])
+
+    features = [f for f, _ in load_samples(data_dir, limit)]
+    print(f"{len(features)} feature vectors from {data_dir}\n")
+
+    dense = DenseNetworkClassifier(models[0])
+    dense_results, dense_latencies = time_single(dense, features)
+    print_timing('in-process (single)', dense_latencies)
+
+    for batch_size in (32, 256):
+        start = time.perf_counter()
+        for i in range(0, len(features), batch_size):
+            dense.classify_batch(features[i:i + batch_size])
+        elapsed = time.perf_counter() - start
+        print(f"{'in-process (batch ' + str(batch_size) + ')':<22} {len(features) / elapsed:10.0f} /s")
+
+    if len(models) > 1:
+        eim = EimClassifier(os.path.abspath(models[1]))
+        quantized = eim.model_info['model_parameters'].get('model_type') == 'int8'
+        if tolerance is None:
+            tolerance = QUANTIZED_TOLERANCE if quantized else FLOAT_TOLERANCE
+        try:
+            eim_results, eim_latencies = time_single(eim, features)
+        finally:
+            eim.close()
+        print_timing('.eim runner (single)', eim_latencies)
+        print(f"\nSpeed-up of the in-process classifier: {eim_latencies.sum() / dense_latencies.sum():.1f}x")
+
+        mismatches, difference, ok = compare(eim_results, dense_results, dense.labels, tolerance)
+        print(f"Top class differs for {mismatches} of {len(features)} samples, largest score difference {difference:.2e} "
+              f"(tolerance {tolerance:g}{', quantized .eim' if quantized else ''})")
+        if mismatches or not ok:
+            print("FAIL: the in-process classifier does not match the .eim model")
+            sys.exit(1)
+        print("OK: both classifiers give the same results")
@@ -0,0 +1,254 @@
+"""Micro benchmarks of the sensor loop hot paths, with fake devices (runs on any Linux box).
+
+Measures one acquisition cycle with 10 fake SGP30 sensors and a fake BME680 (and a raw mode
+cycle with raw_measure() on SGP30_5 to SGP30_10), the feature
+vector, normalize(), the features stage (process_frame: direction, GUI state, LED frame),
+LED frame updates on a fake strip, the GUI redraw tick and classifier calls through a stub
+runner. Every path is timed with timeit (best and median of several repeats, per call).
+
+    python3 Benchmarks/hot_paths.py                                  # print the timings
+    python3 Benchmarks/hot_paths.py --save baseline.json             # store them as the baseline
+    python3 Benchmarks/hot_paths.py --compare baseline.json [--threshold 0.25]
+    python3 Benchmarks/hot_paths.py --only acquisition_cycle,led_update
+
+--compare exits with 1 if the best time of any path got slower than the baseline by more
+than --threshold (0.25 = 25 %). Only compare baselines taken on the same machine.
+"""
+import os
+import sys
+import json
+import time
+import timeit
+import random
+import asyncio
+import platform
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+# The shared modules live in the project root, one folder up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import eNose_Program
+from sensor_backends import HardwareSensorBackend, SGP30_COUNT, RAW_RATE
+from enose_functions import build_features, normalize
+from led_framebuffer import LedRenderer, rgb, single_pixel_frame, bearing_frame
+from gui_state import SnapshotRenderer
+from classifier_backends import StubClassifier, classify_async
+from direction_estimator import DirectionEstimator
+
+DEFAULT_THRESHOLD = 0.25
+REPEATS = 5
+
+
+class FakeSGP30:
+    """Answers like an Adafruit_SGP30 with noisy readings."""
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.eCO2 = 400
+        self.TVOC = 0
+
+    def iaq_init(self):
+        pass
+
+    def iaq_measure(self):
+        self.eCO2 = 400 + self.random.randrange(200)
+        self.TVOC = self.random.randrange(100)
+        return self.eCO2, self.TVOC
+
+    def raw_measure(self):
+        return [13000 + self.random.randrange(500), 18000 + self.random.randrange(500)]
+
+
+class FakeBME680:
+    class Data:
+        temperature = 23.5
+        humidity = 41.2
+        pressure = 1013.2
+        gas_resistance = 45000.0
+        heat_stable = True
+
+    def __init__(self):
+        self.data = self.Data()
+
+    def get_sensor_data(self):
+        return True
+
+
+class FakePixelStrip:
+    """Same methods as rpi_ws281x.PixelStrip, show() does nothing."""
+    def __init__(self, count):
+        self.pixels = [0] * count
+
+    def numPixels(self):
+        return len(self.pixels)
+
+    def setPixelColor(self, index, color):
+        self.pixels[index] = color
+
+    def show(self):
+        pass
+
+
+class FakeLabel:
+    def config(self, **options):
+        self.options = options
+
+
+class FakeWindow:
+    def after(self, interval_ms, callback):
+        pass
+
+
+def fake_hardware_backend(raw=False):
+    """HardwareSensorBackend on fake SGP30 and BME680 sensors instead of the ones on the I2C muxes."""
+    backend = HardwareSensorBackend(raw_rate=RAW_RATE if raw else None,
+                                    sgp30_sensors=[FakeSGP30(i) for i in range(SGP30_COUNT)],
+                                    bme680_sensor=FakeBME680())
+    backend.init()
+    if raw:
+        backend.read_frame()  # the IAQ frame that the raw cycles hold
+    return backend
+
+
+def setup_program():
+    """The globals process_frame() needs, with a fake LED strip (the render thread is not started)."""
+    eNose_Program.create_pipeline()
+    eNose_Program.led_renderer = LedRenderer(FakePixelStrip(eNose_Program.COUNT), max_fps=1000000)
+    eNose_Program.direction_estimator = DirectionEstimator(
+        [eNose_Program.sensor_to_led_map[i] for i in range(4)], eNose_Program.COUNT)
+
+
+def measure(func):
+    """(best, median) seconds per call of func()."""
+    timer = timeit.Timer(func)
+    loops, _ = timer.autorange()
+    runs = [total / loops for total in timer.repeat(REPEATS, loops)]
+    return min(runs), statistics.median(runs)
+
+
+def benchmarks():
+    """name -> function that runs the path once."""
+    backend = fake_hardware_backend()
+    raw_backend = fake_hardware_backend(raw=True)
+    frame = backend.read_frame()
+    features = build_features(frame)
+    setup_program()
+
+    renderer = LedRenderer(FakePixelStrip(20), max_fps=1000000)
+    frames = [single_pixel_frame(20, 1, rgb(255, 0, 0)), bearing_frame(20, 7.4, 255, 0, 0, 0.8)]
+    led_state = {'n': 0}
+
+    def led_update():  # a changed frame every call, so every call pushes
+        led_state['n'] += 1
+        renderer.set_frame(frames[led_state['n'] & 1])
+        renderer._show(renderer._base)
+
+    gui_renderer = SnapshotRenderer(FakeWindow(), eNose_Program.gui_state,
+                                    {'direction': FakeLabel(), 'smell': FakeLabel(), 'error': FakeLabel()})
+    gui_state = {'n': 0}
+
+    def gui_dispatch():  # one published change and the redraw tick that picks it up
+        gui_state['n'] += 1
+        eNose_Program.gui_state.publish(smell=(f"Smell: {gui_state['n'] & 1}", "black"))
+        gui_renderer._tick()
+
+    classifier = StubClassifier(['blueberry', 'chocolateicecream', 'cinnamon', 'empty', 'mango'])
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    def classify_async_call():  # event loop -> executor thread -> event loop round trip
+        loop.run_until_complete(classify_async(classifier, features, executor, 5.0))
+
+    def full_cycle():
+        f = backend.read_frame()
+        eNose_Program.process_frame(f)
+        classifier.classify(build_features(f))
+
+    return {
+        'acquisition_cycle': backend.read_frame,
+        'raw_cycle': lambda: raw_backend.read_raw_frame(time.monotonic_ns()),
+        'build_features': lambda: build_features(frame),
+        'normalize': lambda: normalize(1234, 400, 60000),
+        'process_frame': lambda: eNose_Program.process_frame(frame),
+        'led_update': led_update,
+        'gui_dispatch': gui_dispatch,
+        'classify_stub': lambda: classifier.classify(features),
+        'classify_async': classify_async_call,
+        'full_cycle': full_cycle,
+    }, (loop, executor)
+
+
+def run(only=None):
+    paths, (loop, executor) = benchmarks()
+    results = {}
+    try:
+        for name, func in paths.items():
+            if only and name not in only:
+                continue
+            best, median = measure(func)
+            results[name] = {'best_us': best * 1e6, 'median_us': median * 1e6}
+            print(f"{name:<18} best {best * 1e6:10.2f} us   median {median * 1e6:10.2f} us")
+    finally:
+        executor.shutdown()
+        loop.close()
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': platform.machine(),
+        'node': platform.node(),
+        'python': platform.python_version(),
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """Print the change of every path, returns the names of the paths that regressed."""
+    regressions = []
+    print(f"\nCompared with the baseline of {baseline.get('time')} ({baseline.get('node')}, Python {baseline.get('python')}):")
+    for name, result in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            print(f"{name:<18} new path, no baseline")
+            continue
+        change = result['best_us'] / old['best_us'] - 1
+        regressed = change > threshold
+        print(f"{name:<18} {old['best_us']:10.2f} -> {result['best_us']:10.2f} us  {change:+7.1%}"
+              + ("  REGRESSION" if regressed else ""))
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    save_path = None
+    compare_path = None
+    threshold = DEFAULT_THRESHOLD
+    only = None
+    while args:
+        arg = args.pop(0)
+        if arg == '--save':
+            save_path = args.pop(0)
+        elif arg == '--compare':
+            compare_path = args.pop(0)
+        elif arg == '--threshold':
+            threshold = float(args.pop(0))
+        elif arg == '--only':
+            only = set(args.pop(0).split(','))
+        else:
+            print(__doc__)
+            sys.exit(1)
+
+    current = run(only)
+
+    if save_path is not None:
+        with open(save_path, 'w') as f:
+            json.dump(current, f, indent=1)
+        print(f"\nSaved the baseline to {save_path}")
+
+    if compare_path is not None:
+        with open(compare_path) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, threshold)
+        if regressions:
+            print(f"FAIL: {', '.join(regressions)} slower than the baseline by more than {threshold:.0%}")
+            sys.exit(1)
+        print(f"OK: no path slower than the baseline by more than {threshold:.0%}")
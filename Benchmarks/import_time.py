@@ -0,0 +1,137 @@
+"""Import time of the program modules, measured with python -X importtime.
+
+Each module is imported in a fresh interpreter --repeat times, the report shows the median
+total import time and the slowest imports. It also fails if importing one of the
+IMPORT_SAFE_MODULES pulls in a heavy library that should only load when it is used
+(HEAVY_MODULES).
+
+    python3 Benchmarks/import_time.py [module ...] [--repeat N] [--top N]
+    python3 Benchmarks/import_time.py --save import_baseline.json
+    python3 Benchmarks/import_time.py --compare import_baseline.json [--threshold 0.25]
+
+--compare fails (exit code 1) if a module got slower than its baseline by more than the
+threshold (a fraction, 0.25 = 25 %).
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = ['eNose_Program']
+
+# Modules that have to import without side effects and without the heavy libraries
+IMPORT_SAFE_MODULES = ['eNose_Program', 'sensor_backends', 'sgp30_baselines', 'classifier_backends', 'scheduler',
+                       'pipeline', 'gui_state', 'led_framebuffer', 'rolling_features', 'startup', 'buttons', 'metrics',
+                       'enose_logging', 'sensor_health', 'acquisition_daemon',
+                       'frame_alignment']
+
+# Only imported on the code paths that need them
+HEAVY_MODULES = ['tkinter', 'PIL', 'RPi', 'rpi_ws281x', 'grove', 'edge_impulse_linux', 'numpy',
+                 'board', 'adafruit_sgp30', 'bme680']
+
+
+def measure(module):
+    '''
+    Import `module` in a fresh interpreter.
+
+    Returns:
+        dict imported module name -> (self us, cumulative us), in import order
+    '''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    imports = {}
+    for line in result.stderr.splitlines():
+        # "import time:       288 |       1967 |   pipeline"
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports[name.strip()] = (int(self_us), int(cumulative_us))
+    return imports
+
+
+def profile(module, repeat=5):
+    """Median total (ms) over `repeat` runs, plus the per-import timings of the last run."""
+    totals = []
+    for _ in range(repeat):
+        imports = measure(module)
+        totals.append(imports[module][1] / 1000.0)
+    return statistics.median(totals), imports
+
+
+def heavy_imports(imports):
+    return sorted({name.split('.')[0] for name in imports if name.split('.')[0] in HEAVY_MODULES})
+
+
+def report(module, total_ms, imports, top=10):
+    lines = [f"{module}: {total_ms:.1f} ms, {len(imports)} modules imported"]
+    slowest = sorted(imports.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    for name, (self_us, cumulative_us) in slowest:
+        lines.append(f"  {self_us / 1000.0:8.2f} ms self  {cumulative_us / 1000.0:8.2f} ms cumulative  {name}")
+    heavy = heavy_imports(imports)
+    if heavy:
+        lines.append(f"  Heavy modules imported: {', '.join(heavy)}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    modules = []
+    repeat = 5
+    top = 10
+    save_path = None
+    compare_path = None
+    threshold = 0.25
+    while args:
+        arg = args.pop(0)
+        if arg == '--repeat':
+            repeat = int(args.pop(0))
+        elif arg == '--top':
+            top = int(args.pop(0))
+        elif arg == '--save':
+            save_path = args.pop(0)
+        elif arg == '--compare':
+            compare_path = args.pop(0)
+        elif arg == '--threshold':
+            threshold = float(args.pop(0))
+        elif arg in ('-h', '--help'):
+            print(__doc__)
+            sys.exit(0)
+        else:
+            modules.append(arg)
+    modules = modules or DEFAULT_MODULES
+
+    baseline = {}
+    if compare_path is not None:
+        with open(compare_path) as f:
+            baseline = json.load(f)
+
+    results = {}
+    failed = False
+    for module in modules:
+        total_ms, imports = profile(module, repeat)
+        results[module] = round(total_ms, 2)
+        print(report(module, total_ms, imports, top))
+        if module in IMPORT_SAFE_MODULES and heavy_imports(imports):
+            print(f"FAIL: importing {module} loads heavy modules")
+            failed = True
+        if module in baseline:
+            limit = baseline[module] * (1 + threshold)
+            change = total_ms / baseline[module] - 1
+            print(f"  Baseline {baseline[module]:.1f} ms ({change:+.0%})")
+            if total_ms > limit:
+                print(f"FAIL: {module} imports {change:.0%} slower than the baseline (threshold {threshold:.0%})")
+                failed = True
+        print()
+
+    if save_path is not None:
+        with open(save_path, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f"Saved the import times to {save_path}")
+
+    sys.exit(1 if failed else 0)
@@ -1,13 +1,20 @@
 import os
 import time
 import csv
-import board
 import sys
+import queue
+import logging
 import threading
 from datetime import datetime
-import adafruit_tca9548a
-import adafruit_sgp30
-import bme680
+
+# The shared modules (e.g. sensor_backends.py) live in the project root, one folder up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensor_backends import backend_from_args
+from scheduler import FixedRateScheduler
+from frame_alignment import FrameAligner
+
+# The shared modules log their messages (e.g. the restored SGP30 baselines), show them like the prints below
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 
 # Make sure to navigate to the correct environment with all needed packages installed.
 # run script with "/home/pablo/appenv/bin/python /home/pablo/OneNose_Project/Data_Collection/csv_datacollecting.py"
@@ -30,58 +37,64 @@ def input_listener():
             stop_requested = True
             break
 
+def command_listener(commands):
+    """Continuous mode: one thread for the whole session, every entered line goes to `commands`."""
+    while True:
+        try:
+            line = input().strip()
+        except EOFError: # stdin closed, e.g. running in the background
+            commands.put('exit')
+            return
+        if line:
+            commands.put(line)
+        if line.lower() == 'exit':
+            return
+
+def label_problem(label):
+    """Why `label` can not be used, None if it is fine."""
+    if not label:
+        return "Label cannot be empty."
+    if '.' in label: # The file names are label.YYYYMMDD_HHMMSS.csv, the label ends at the first dot
+        return "Label cannot contain '.'."
+    return None
+
 # ----------------------------
 # Sensor Initialization
 # ----------------------------
-print("Initializing I2C and multiplexers...")
-i2c = board.I2C()
-mux1 = adafruit_tca9548a.TCA9548A(i2c, address=0x70)
-mux2 = adafruit_tca9548a.TCA9548A(i2c, address=0x71)
-
-print("Initializing SGP30 sensors...")
-sgp30_sensors = [
-    adafruit_sgp30.Adafruit_SGP30(mux1[0]),  # Index 0 = SGP30_1
-    adafruit_sgp30.Adafruit_SGP30(mux1[1]),
-    adafruit_sgp30.Adafruit_SGP30(mux1[2]),
-    adafruit_sgp30.Adafruit_SGP30(mux1[3]),
-    adafruit_sgp30.Adafruit_SGP30(mux1[4]),
-    adafruit_sgp30.Adafruit_SGP30(mux1[5]),
-    adafruit_sgp30.Adafruit_SGP30(mux1[6]),
-    adafruit_sgp30.Adafruit_SGP30(mux1[7]),
-    adafruit_sgp30.Adafruit_SGP30(mux2[0]),
-    adafruit_sgp30.Adafruit_SGP30(mux2[1]),
-]
-
 # Only use SGP30 sensors 5 to 10 (index 4 to 9)
-used_sgp_sensors = sgp30_sensors[4:10]
-for sensor in used_sgp_sensors:
-    sensor.iaq_init()
-
-print("Initializing BME680...")
-# BME680 setup
-try:
-    bme680_sensor = bme680.BME680(bme680.I2C_ADDR_PRIMARY)
-except (RuntimeError, IOError):
-    bme680_sensor = bme680.BME680(bme680.I2C_ADDR_SECONDARY)
-
-bme680_sensor.set_humidity_oversample(bme680.OS_2X)
-bme680_sensor.set_temperature_oversample(bme680.OS_8X)
-bme680_sensor.set_filter(bme680.FILTER_SIZE_3)
-bme680_sensor.set_gas_status(bme680.ENABLE_GAS_MEAS)
-bme680_sensor.set_gas_heater_temperature(320)
-bme680_sensor.set_gas_heater_duration(150)
-bme680_sensor.select_gas_heater_profile(0)
+# Pass "--replay <path> [--speed N]" to collect from recorded CSVs instead of the hardware,
+# or "--daemon" to record from a running acquisition_daemon.py (e.g. while eNose_Program.py runs too).
+# "--raw" (or "--raw-rate N") also reads the raw H2/ethanol signals several times per second
+print("Initializing I2C, multiplexers and sensors...")
+sensor_backend, args = backend_from_args(sys.argv[1:], used_sgp30=range(4, 10))
+sensor_backend.init()
+
+# "--binary" appends everything to one binary recording (see recorder.py) instead of a new CSV file every 10 readings
+binary_mode = '--binary' in args
+# "--continuous" also records into one binary recording, but never stops sampling: label changes are only
+# markers in its index.json, the 10 reading windows are cut out afterwards (python3 recorder.py ...)
+continuous_mode = '--continuous' in args
+# Raw mode (here or in the daemon) records the raw signals too, they only fit in a binary recording
+raw_mode = bool(sensor_backend.raw_sgp30)
+binary_mode = binary_mode or continuous_mode or raw_mode
+# "--align" resamples every reading onto the cycle time, so all values of a row belong to its timestamp
+# (the sensors are read one after the other, see frame_alignment.py)
+frame_aligner = FrameAligner() if '--align' in args else None
 
 # ----------------------------
 # Ask user for label interactively
 # ----------------------------
 label = input("Enter label: ").strip()
-if not label:
-    print("Label cannot be empty.")
+if label_problem(label):
+    print(label_problem(label))
     sys.exit(1)
 
-# Start background thread to watch for 'stop'
-threading.Thread(target=input_listener, daemon=True).start()
+# Start background thread to watch for 'stop' (or for the commands in continuous mode)
+commands = queue.Queue()
+if continuous_mode:
+    threading.Thread(target=command_listener, args=(commands,), daemon=True).start()
+else:
+    threading.Thread(target=input_listener, daemon=True).start()
 
 # ----------------------------
 # CSV header
@@ -95,65 +108,133 @@ for i in range(5, 11):
     headers.append(f'SGP30_{i}_CO2')
     headers.append(f'SGP30_{i}_TVOC')
 
+recorder = None
+if binary_mode:
+    from recorder import Recorder, CHANNELS, RAW_CHANNELS
+    recording_dir = os.path.join(data_dir, "recording." + datetime.now().strftime("%Y%m%d_%H%M%S"))
+    recorder = Recorder(recording_dir, channels=CHANNELS + RAW_CHANNELS if raw_mode else CHANNELS)
+    recorder.set_label(label)
+    print(f"[INFO] Recording to '{recording_dir}'. Export to CSV with: python3 recorder.py {recording_dir} <folder>")
+
 # ----------------------------
 # Main Loop
 # ----------------------------
-print("[INFO] Starting data collection. Type 'stop' and press Enter to change label, or 'exit' to quit.")
+if not continuous_mode:
+    print("[INFO] Starting data collection. Type 'stop' and press Enter to change label, or 'exit' to quit.")
+
+# One reading per period on a fixed grid, so the cadence does not drift between files
+scheduler = FixedRateScheduler(sensor_backend.period)
+scheduler.start()
 
 try:
-    while not exit_requested:
-        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = os.path.join(data_dir, f"{label}.{timestamp_str}.csv")
-        with open(filename, mode='w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(headers)
-
-            file_start_time = time.time() # Track file start time
-            for _ in range(10):
-                loop_start = time.time()
-                elapsed_ms = round((loop_start - file_start_time) * 1000)
-                row = [elapsed_ms]
-
-                # BME680
-                if bme680_sensor.get_sensor_data():
-                    temp = round(bme680_sensor.data.temperature, 2)
-                    hum = round(bme680_sensor.data.humidity, 2)
-                    gas = round(bme680_sensor.data.gas_resistance, 2) if bme680_sensor.data.heat_stable else None
-                else:
-                    temp = hum = gas = None
-
-                row += [temp, hum, gas]
-
-                # SGP30 sensors 5 to 10
-                for sensor in used_sgp_sensors:
-                    try:
-                        sensor.iaq_measure()
-                        row += [sensor.eCO2, sensor.TVOC]
-                    except Exception:
-                        row += [None, None]
-
-                writer.writerow(row)
-
-                elapsed = time.time() - loop_start
-                if elapsed < 1.0:
-                    time.sleep(1.0 - elapsed)
-
-        # Check if we need to ask for a new label or exit
-        if stop_requested and not exit_requested:
-            print(f"[INFO] File '{filename}' completed.")
-            print("[INFO] Enter new label for next measurements:")
-            label = input("Enter label: ").strip()
-            if not label:
-                print("[INFO] Label cannot be empty. Exiting...")
+    if continuous_mode:
+        print("[INFO] Continuous capture. Type a new label and press Enter to switch, 'pause' (or 'stop') for unlabelled readings, or 'exit' to quit.")
+        while not exit_requested:
+            frame = sensor_backend.read_frame()
+            if frame is None: # Replay ran out of recorded data
                 break
+            if frame_aligner is not None:
+                frame = frame_aligner.align(frame)
+            now = time.time()
+
+            # Commands typed since the last reading, applied between two readings (the sampling never waits)
+            while not commands.empty():
+                command = commands.get_nowait()
+                if command.lower() == 'exit':
+                    exit_requested = True
+                elif command.lower() in ('pause', 'stop'): # 'stop' is the label change of the normal mode
+                    label = None
+                    recorder.set_label(None, now)
+                    print("[INFO] Paused labelling, the readings are still recorded (unlabelled). Type the next label to continue.")
+                elif label_problem(command):
+                    print(f"[INFO] {label_problem(command)} " + (f"Label stays '{label}'." if label else "Still paused."))
+                else:
+                    label = command
+                    recorder.set_label(label, now)
+                    print(f"[INFO] Label changed to '{label}' at reading {recorder.total_records}.")
+
+            recorder.append_frame(frame, now)
+            if scheduler.cycles % 60 == 0:
+                print(f"[INFO] {recorder.total_records} readings, {scheduler.report()}")
+            scheduler.wait()
+    else:
+        while not exit_requested:
+            if recorder is not None:
+                filename = recorder.path # The recorder appends to its segment files, there is no file per batch
+                f = writer = None
+            else:
+                timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+                filename = os.path.join(data_dir, f"{label}.{timestamp_str}.csv")
+                f = open(filename, mode='w', newline='')
+                writer = csv.writer(f)
+                writer.writerow(headers)
+
+            try:
+                file_start_time = None # Cycle time of the first reading in the file
+                for _ in range(10):
+                    frame = sensor_backend.read_frame()
+                    if frame is None: # Replay ran out of recorded data
+                        exit_requested = True
+                        break
+                    if frame_aligner is not None:
+                        frame = frame_aligner.align(frame)
+
+                    # The frame's own cycle time, not when this loop got it (e.g. from the daemon)
+                    if file_start_time is None:
+                        file_start_time = frame.timestamp
+                    elapsed_ms = round((frame.timestamp - file_start_time) * 1000)
+                    row = [elapsed_ms]
+
+                    # BME680
+                    bme680_data = frame.bme680
+                    if bme680_data is not None:
+                        temp = round(bme680_data['temperature'], 2)
+                        hum = round(bme680_data['humidity'], 2)
+                        gas = round(bme680_data['gas_resistance'], 2) if bme680_data['heat_stable'] else None
+                    else:
+                        temp = hum = gas = None
+
+                    row += [temp, hum, gas]
+
+                    # SGP30 sensors 5 to 10
+                    for i in range(4, 10): # Same columns as the header, also when the daemon reads all 10 sensors
+                        row += [frame.co2[i], frame.tvoc[i]]
+
+                    if recorder is not None:
+                        recorder.append_frame(frame)
+                    else:
+                        writer.writerow(row)
+
+                    scheduler.wait()
+            finally:
+                if f is not None:
+                    f.close()
+
+            # Check if we need to ask for a new label or exit
+            if stop_requested and not exit_requested:
+                print(f"[INFO] File '{filename}' completed.")
+                print(f"[INFO] {scheduler.report()}")
+                print("[INFO] Enter new label for next measurements:")
+                label = input("Enter label: ").strip()
+                if label_problem(label):
+                    print(f"[INFO] {label_problem(label)} Exiting...")
+                    break
             
-            # Reset stop flag and restart input listener
-            stop_requested = False
-            threading.Thread(target=input_listener, daemon=True).start()
-            print(f"[INFO] Label changed to '{label}'. Continuing data collection...")
-            print("[INFO] Type 'stop' to change label again, or 'exit' to quit.")
+                if recorder is not None:
+                    recorder.set_label(label)
+
+                # Reset stop flag and restart input listener
+                stop_requested = False
+                threading.Thread(target=input_listener, daemon=True).start()
+                scheduler.start() # Waiting for the label is not a timing problem, restart the grid
+                print(f"[INFO] Label changed to '{label}'. Continuing data collection...")
+                print("[INFO] Type 'stop' to change label again, or 'exit' to quit.")
 
 except KeyboardInterrupt:
     print("\n[INFO] Ctrl+C detected. Finishing current file and exiting...")
 
+if recorder is not None:
+    recorder.close()
+sensor_backend.close() # Saves the SGP30 baselines
+print(f"[INFO] {scheduler.report()}")
 print("[INFO] Data collection stopped.")
@@ -0,0 +1,289 @@
+"""Acquisition daemon: owns the sensor array and serves its frames to local clients.
+
+Only one program can own the I2C bus and the two muxes. The daemon reads the sensors (or a
+replay) on the usual fixed 1 s grid and sends every frame to all clients connected to a Unix
+domain socket, so the GUI program and the data collection can run at the same time without
+any extra I2C traffic:
+
+    sudo python3 acquisition_daemon.py [--socket PATH] [--raw | --raw-rate N] [--replay PATH [--speed N] [--loop]] [--log-level LEVEL]
+    sudo python3 eNose_Program.py --daemon model.eim
+    python3 Data_Collection/csv_data_collecting.py --daemon
+
+Clients use DaemonSensorBackend (sensor_backends.py, "--daemon" and "--socket PATH").
+
+Protocol: every message is a little endian uint16 length followed by the payload. The first
+message after connecting is the hello, a JSON object with the protocol version, the sensor
+period, the used SGP30 indexes and the ones read in raw mode. All further messages are frames
+packed by encode_frame() (about 400 bytes). A client that does not keep up loses frames
+instead of slowing down the daemon or the other clients, only a few seconds of frames are
+buffered for it.
+"""
+import os
+import sys
+import json
+import math
+import time
+import socket
+import struct
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from sensor_backends import SensorFrame, SGP30_COUNT
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = os.environ.get('ENOSE_SOCKET', '/tmp/enose_sensors.sock')
+PROTOCOL_VERSION = 3
+CLIENT_BUFFER_LIMIT = 4 * 1024  # bytes waiting for a client before its frames are dropped (about 10 frames)
+CLIENT_SOCKET_BUFFER = 8 * 1024  # kernel send buffer per client, keeps the backlog of a client that pauses short
+
+_LENGTH = struct.Struct('<H')
+# sequence, backend timestamp, unix time, eCO2 x 10, TVOC x 10, BME680 temperature, humidity, pressure,
+# gas resistance, flags (bit 0 = BME680 read, bit 1 = heat stable, bit 2 = sample times included, bit 3 = raw
+# signals included, bit 4 = eCO2/TVOC/BME680 held from the last IAQ cycle), error bit mask,
+# sample times in monotonic ns x 10 + BME680 (0 = not read), raw H2 x 10, raw ethanol x 10, raw sample times x 10
+_FRAME = struct.Struct(f'<Idd{SGP30_COUNT}i{SGP30_COUNT}i4dBH{SGP30_COUNT + 1}q'
+                       f'{SGP30_COUNT}i{SGP30_COUNT}i{SGP30_COUNT}q')
+_NO_VALUE = -1  # eCO2, TVOC and the raw signals are never negative
+
+CLIENTS = METRICS.gauge('enose_daemon_clients', 'Clients connected to the acquisition daemon')
+DROPPED = METRICS.counter('enose_daemon_dropped_frames_total', 'Frames not sent to a client that was too slow')
+
+
+def _text(value):
+    data = (value or '').encode('utf-8')[:255]
+    return bytes((len(data),)) + data
+
+
+def encode_frame(frame, sequence=0, wall_time=None):
+    """Pack a SensorFrame, followed by the error messages and the label (one length byte each)."""
+    bme680 = frame.bme680
+    flags = 0
+    values = [math.nan] * 4
+    if bme680 is not None:
+        flags |= 1
+        if bme680['heat_stable']:
+            flags |= 2
+        pressure = bme680.get('pressure')
+        values = [bme680['temperature'], bme680['humidity'], math.nan if pressure is None else pressure,
+                  bme680['gas_resistance']]
+    error_mask = 0
+    for i in frame.errors:
+        error_mask |= 1 << i
+    sample_times = [0] * (SGP30_COUNT + 1)
+    if frame.sample_times is not None:
+        flags |= 4
+        sample_times = [t or 0 for t in frame.sample_times] + [frame.bme680_time or 0]
+    raw = [_NO_VALUE] * (2 * SGP30_COUNT) + [0] * SGP30_COUNT
+    if frame.h2 is not None:
+        flags |= 8
+        raw = ([_NO_VALUE if value is None else value for value in frame.h2]
+               + [_NO_VALUE if value is None else value for value in frame.ethanol]
+               + [t or 0 for t in frame.raw_times or [None] * SGP30_COUNT])
+    if not frame.iaq_fresh:
+        flags |= 16
+    payload = _FRAME.pack(
+        sequence, frame.timestamp, time.time() if wall_time is None else wall_time,
+        *[_NO_VALUE if value is None else value for value in frame.co2],
+        *[_NO_VALUE if value is None else value for value in frame.tvoc],
+        *values, flags, error_mask, *sample_times, *raw)
+    parts = [payload] + [_text(frame.errors[i]) for i in sorted(frame.errors)] + [_text(frame.label)]
+    return b''.join(parts)
+
+
+def decode_frame(payload):
+    """Inverse of encode_frame(). Returns (sequence, unix time, SensorFrame)."""
+    fields = _FRAME.unpack_from(payload)
+    sequence, timestamp, wall_time = fields[:3]
+    co2 = [None if value == _NO_VALUE else value for value in fields[3:3 + SGP30_COUNT]]
+    tvoc = [None if value == _NO_VALUE else value for value in fields[3 + SGP30_COUNT:3 + 2 * SGP30_COUNT]]
+    temperature, humidity, pressure, gas = fields[3 + 2 * SGP30_COUNT:7 + 2 * SGP30_COUNT]
+    flags, error_mask = fields[7 + 2 * SGP30_COUNT:9 + 2 * SGP30_COUNT]
+    sample_times = bme680_time = None
+    field = 9 + 2 * SGP30_COUNT
+    if flags & 4:
+        times = [t or None for t in fields[field:field + SGP30_COUNT + 1]]
+        sample_times, bme680_time = times[:SGP30_COUNT], times[SGP30_COUNT]
+    h2 = ethanol = raw_times = None
+    if flags & 8:
+        field += SGP30_COUNT + 1
+        h2 = [None if value == _NO_VALUE else value for value in fields[field:field + SGP30_COUNT]]
+        ethanol = [None if value == _NO_VALUE else value for value in fields[field + SGP30_COUNT:field + 2 * SGP30_COUNT]]
+        raw_times = [t or None for t in fields[field + 2 * SGP30_COUNT:]]
+
+    bme680 = None
+    if flags & 1:
+        bme680 = {
+            'temperature': temperature,
+            'humidity': humidity,
+            'pressure': None if math.isnan(pressure) else pressure,
+            'gas_resistance': gas,
+            'heat_stable': bool(flags & 2),
+        }
+
+    offset = _FRAME.size
+    texts = []
+    while offset < len(payload):
+        length = payload[offset]
+        texts.append(payload[offset + 1:offset + 1 + length].decode('utf-8'))
+        offset += 1 + length
+    errors = {i: texts.pop(0) for i in range(SGP30_COUNT) if error_mask & (1 << i)}
+    label = texts[0] if texts and texts[0] else None
+    return sequence, wall_time, SensorFrame(timestamp, co2, tvoc, bme680, errors, label, sample_times, bme680_time,
+                                            h2, ethanol, raw_times, not flags & 16)
+
+
+def pack_message(payload):
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def read_message(sock):
+    """Read one message from a blocking socket, None when the connection is closed."""
+    header = _recv_exactly(sock, _LENGTH.size)
+    if header is None:
+        return None
+    return _recv_exactly(sock, _LENGTH.unpack(header)[0])
+
+
+def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+class FrameServer:
+    '''
+    Sends the frames to the clients of a Unix domain socket (asyncio, on the daemon's event loop).
+
+    Args:
+        path(str): socket path, an old socket file there is replaced
+        hello(dict): sent as JSON to every new client
+    '''
+    def __init__(self, path, hello):
+        self.path = path
+        self.hello = pack_message(json.dumps(dict(hello, version=PROTOCOL_VERSION)).encode())
+        self.clients = set()
+        self.sequence = 0
+        self.server = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._handle, self.path)
+        os.chmod(self.path, 0o666)  # The daemon runs as root, the clients may not
+        log.info("Serving sensor frames on %s", self.path)
+
+    async def _handle(self, reader, writer):
+        writer.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, CLIENT_SOCKET_BUFFER)
+        writer.write(self.hello)
+        self.clients.add(writer)
+        CLIENTS.set(len(self.clients))
+        log.info("Client connected (%d connected)", len(self.clients))
+        try:
+            await reader.read()  # Clients do not send anything, this returns when they disconnect
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(writer)
+            CLIENTS.set(len(self.clients))
+            writer.close()
+            log.info("Client disconnected (%d connected)", len(self.clients))
+
+    def publish(self, frame):
+        """Send a frame to every client, never waits: slow clients lose the frame."""
+        self.sequence += 1
+        message = pack_message(encode_frame(frame, self.sequence))
+        for writer in list(self.clients):
+            if writer.is_closing():
+                self.clients.discard(writer)
+            elif writer.transport.get_write_buffer_size() > CLIENT_BUFFER_LIMIT:
+                DROPPED.inc()
+            else:
+                writer.write(message)
+
+    async def close(self):
+        for writer in list(self.clients):
+            writer.close()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+async def run_daemon(backend, path=DEFAULT_SOCKET, report_every=60):
+    """Read `backend` on its fixed rate and publish the frames until cancelled or the replay ends."""
+    from scheduler import FixedRateScheduler
+
+    loop = asyncio.get_running_loop()
+    i2c_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='i2c')
+    try:
+        await loop.run_in_executor(i2c_executor, backend.init)
+        server = FrameServer(path, {'period': backend.period, 'used_sgp30': list(backend.used_sgp30),
+                                    'raw_sgp30': list(getattr(backend, 'raw_sgp30', []))})
+        await server.start()
+        scheduler = FixedRateScheduler(backend.period)
+        scheduler.start()
+        try:
+            while True:
+                frame = await loop.run_in_executor(i2c_executor, backend.read_frame)
+                if frame is None:
+                    log.info("No more sensor data. Stopping the daemon.")
+                    break
+                server.publish(frame)
+                if scheduler.cycles % report_every == 0:
+                    log.info(scheduler.report())
+                await scheduler.wait_async()
+        finally:
+            await server.close()
+            log.info(scheduler.report())
+    finally:
+        await loop.run_in_executor(i2c_executor, backend.close)  # Saves the SGP30 baselines
+        i2c_executor.shutdown()
+        if getattr(backend, 'health', None) is not None:
+            log.info(backend.health.report())
+
+
+def main(argv=None):
+    import signal
+    from enose_logging import setup_logging, logging_args
+    from sensor_backends import backend_from_args
+
+    argv = sys.argv[1:] if argv is None else argv
+    log_options, argv = logging_args(argv)
+    logging_setup = setup_logging(**log_options)
+    path = DEFAULT_SOCKET
+    if '--socket' in argv:
+        index = argv.index('--socket')
+        path = argv[index + 1]
+        del argv[index:index + 2]
+    backend, remaining = backend_from_args(argv)
+    if remaining:
+        log.warning("Ignoring unknown arguments: %s", ' '.join(remaining))
+
+    async def run():
+        task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):  # systemd stops the daemon with SIGTERM
+            loop.add_signal_handler(sig, task.cancel)
+        try:
+            await run_daemon(backend, path)
+        except asyncio.CancelledError:
+            pass
+
+    try:
+        asyncio.run(run())
+    finally:
+        logging_setup.close()
+
+
+if __name__ == '__main__':
+    main()
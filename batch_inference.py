@@ -0,0 +1,148 @@
+"""Offline batch inference over recorded data.
+
+Replays recorded CSVs, builds the exact feature vector the live sensor loop sends to the
+model (enose_functions.build_features) and classifies every frame on a pool of worker
+processes, each with its own classifier. Prints the throughput, the p50/p95/p99 latency
+of the classify() calls and a confusion matrix of recorded label vs. predicted label.
+
+    python3 batch_inference.py <model.eim | model.npz | --stub> [folder] [--workers N] [--limit N]
+
+Any object with a classify(features) method works, see run_batch().
+"""
+import os
+import sys
+import time
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from enose_functions import build_features, top_class
+from sensor_backends import ReplaySensorBackend
+from classifier_backends import StubClassifier, load_classifier
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Assets", "Collected_Data")
+
+_worker_classifier = None  # one classifier per worker process
+
+
+def _init_worker(factory):
+    global _worker_classifier
+    _worker_classifier = factory()
+
+
+def _classify_one(features, classifier=None):
+    classifier = classifier if classifier is not None else _worker_classifier
+    start = time.perf_counter()
+    try:
+        predicted = top_class(classifier.classify(features))
+    except Exception:
+        predicted = None
+    return predicted, time.perf_counter() - start
+
+
+def load_samples(path, limit=None):
+    """(features, recorded label) of every replayed frame."""
+    backend = ReplaySensorBackend(path, speed=0)
+    samples = []
+    while limit is None or len(samples) < limit:
+        frame = backend.read_frame()
+        if frame is None:
+            break
+        samples.append((build_features(frame), frame.label))
+    backend.close()
+    return samples
+
+
+def run_batch(samples, factory, workers=None, chunksize=16):
+    '''
+    Classify all samples and collect the statistics.
+
+    Args:
+        samples(list): (features, label) tuples
+        factory: picklable callable that returns an object with classify(features), called once per worker
+        workers(int): number of processes, 0 runs everything in this process
+    Returns:
+        dict with predictions, latencies (seconds), wall time and throughput
+    '''
+    features = [f for f, _ in samples]
+    start = time.perf_counter()
+    if workers == 0:
+        classifier = factory()
+        results = [_classify_one(f, classifier) for f in features]
+        if hasattr(classifier, 'close'):
+            classifier.close()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(factory,)) as pool:
+            results = list(pool.map(_classify_one, features, chunksize=chunksize))
+    wall = time.perf_counter() - start
+
+    latencies = np.array([latency for _, latency in results])
+    return {
+        'labels': [label for _, label in samples],
+        'predictions': [predicted for predicted, _ in results],
+        'latencies': latencies,
+        'wall_s': wall,
+        'throughput': len(samples) / wall if wall > 0 else 0.0,
+    }
+
+
+def confusion_matrix(labels, predictions):
+    """Returns (class names, matrix) with rows = recorded label, columns = predicted label."""
+    names = sorted(set(labels) | {p for p in predictions if p is not None})
+    if None in predictions:
+        names.append('(failed)')
+    position = {name: i for i, name in enumerate(names)}
+    matrix = np.zeros((len(names), len(names)), dtype=np.int64)
+    for label, predicted in zip(labels, predictions):
+        matrix[position[label], position[predicted if predicted is not None else '(failed)']] += 1
+    return names, matrix
+
+
+def report(results):
+    latencies_ms = results['latencies'] * 1000
+    lines = [
+        f"{len(latencies_ms)} classifications in {results['wall_s']:.2f} s ({results['throughput']:.1f} classifications/s)",
+        "Latency p50 {:.2f} ms, p95 {:.2f} ms, p99 {:.2f} ms".format(*np.percentile(latencies_ms, [50, 95, 99]))
+        if len(latencies_ms) else "No samples",
+        "",
+        "Confusion matrix (rows = recorded label, columns = predicted):",
+    ]
+    names, matrix = confusion_matrix(results['labels'], results['predictions'])
+    width = max([len(name) for name in names] + [6])
+    lines.append(' ' * width + ' ' + ' '.join(name[:width].rjust(width) for name in names))
+    for name, row in zip(names, matrix):
+        lines.append(name.rjust(width) + ' ' + ' '.join(str(count).rjust(width) for count in row))
+    correct = int(np.trace(matrix))
+    lines.append(f"Accuracy: {correct}/{matrix.sum()} ({100.0 * correct / max(1, matrix.sum()):.1f} %)")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    workers = None
+    limit = None
+    positional = []
+    while args:
+        arg = args.pop(0)
+        if arg == '--workers':
+            workers = int(args.pop(0))
+        elif arg == '--limit':
+            limit = int(args.pop(0))
+        else:
+            positional.append(arg)
+
+    if not positional:
+        print("Usage: python3 batch_inference.py <model.eim | model.npz | --stub> [folder] [--workers N] [--limit N]")
+        sys.exit(1)
+
+    data_dir = positional[1] if len(positional) > 1 else DEFAULT_DATA_DIR
+    samples = load_samples(data_dir, limit)
+    print(f"Loaded {len(samples)} samples from {data_dir}")
+
+    if positional[0] == '--stub':
+        factory = functools.partial(StubClassifier, sorted({label for _, label in samples}))
+    else:
+        factory = functools.partial(load_classifier, os.path.abspath(positional[0]))
+
+    print(report(run_batch(samples, factory, workers)))
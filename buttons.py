@@ -0,0 +1,175 @@
+"""Edge-triggered buttons on the GPIO header.
+
+Instead of polling the pins, ButtonHandler registers a falling-edge callback per button
+(GPIO.add_event_detect with the bouncetime against repeated presses). The edge only starts a
+short settle timer: when it runs out the pin is read again and the press counts if the button
+is held down; a pin that is still HIGH gets up to SETTLE_CHECKS settle times. A glitch triggers
+nothing, and a contact that bounces right at the edge (which the bouncetime then hides) does
+not lose the press either. The action is not run on the GPIO callback thread but handed to `dispatch`, e.g. Tk's after(),
+so it runs on the app's event loop.
+
+FakeGPIO has the part of the RPi.GPIO interface used here and press() / release() methods,
+so the button actions and the shutdown path can be tested and benchmarked off the Pi.
+"""
+import time
+import threading
+
+SETTLE_CHECKS = 3  # reads of the pin after an edge before it counts as a glitch
+
+
+class FakeGPIO:
+    '''
+    Stand-in for the RPi.GPIO module. Pins are pulled up (HIGH) until press() pulls them LOW.
+    Edge callbacks run on the thread that calls press()/release(), with the same bouncetime
+    filtering as RPi.GPIO. Unlike RPi.GPIO it counts the edges the bouncetime swallowed (`suppressed`).
+    '''
+    BCM = 11
+    BOARD = 10
+    IN = 1
+    OUT = 0
+    PUD_UP = 22
+    PUD_DOWN = 21
+    HIGH = 1
+    LOW = 0
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self.mode = None
+        self.levels = {}      # pin -> level
+        self.detects = {}     # pin -> (edge, callback, bouncetime in seconds)
+        self._last_event = {}
+        self._lock = threading.Lock()
+        self.suppressed = 0  # detected edges dropped by the bouncetime
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        self.levels[pin] = self.LOW if pull_up_down == self.PUD_DOWN else self.HIGH
+
+    def input(self, pin):
+        return self.levels[pin]
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=0):
+        self.detects[pin] = (edge, callback, bouncetime / 1000.0)
+
+    def remove_event_detect(self, pin):
+        self.detects.pop(pin, None)
+
+    def cleanup(self, pins=None):
+        if pins is None:
+            pins = list(self.levels)
+        elif isinstance(pins, int):
+            pins = [pins]
+        for pin in pins:
+            self.levels.pop(pin, None)
+            self.detects.pop(pin, None)
+
+    def set_level(self, pin, level):
+        """Drive the pin and fire the edge callback like the hardware would."""
+        with self._lock:
+            previous = self.levels[pin]
+            self.levels[pin] = level
+            detect = self.detects.get(pin)
+            if detect is None or previous == level:
+                return
+            edge, callback, bouncetime = detect
+            if edge != self.BOTH and edge != (self.FALLING if level == self.LOW else self.RISING):
+                return
+            now = time.monotonic()
+            if now - self._last_event.get(pin, -bouncetime - 1) < bouncetime:
+                self.suppressed += 1
+                return
+            self._last_event[pin] = now
+        if callback is not None:
+            callback(pin)
+
+    def press(self, pin):
+        self.set_level(pin, self.LOW)
+
+    def release(self, pin):
+        self.set_level(pin, self.HIGH)
+
+
+class ButtonHandler:
+    '''
+    Runs an action when a button (to GND, with the internal pull-up) is pressed.
+
+    Args:
+        gpio: the RPi.GPIO module or a FakeGPIO
+        dispatch: called with the action, has to run it on the app's event loop
+            (e.g. lambda action: window.after(0, action)); default runs it right away
+        bouncetime_ms(int): presses closer together than this are ignored
+        settle_ms(float): time after the edge at which the button has to be still held down
+    '''
+    def __init__(self, gpio, dispatch=None, bouncetime_ms=200, settle_ms=10):
+        self.gpio = gpio
+        self.dispatch = dispatch if dispatch is not None else (lambda action: action())
+        self.bouncetime_ms = bouncetime_ms
+        self.settle = settle_ms / 1000.0
+        self.actions = {}  # pin -> action
+        self._pending = {}  # pin -> settle timer that is still running
+        self._lock = threading.Lock()
+        self.presses = 0
+        self.rejected = 0  # edges where the button was not held down after the settle time (glitches)
+        self.bounces = 0   # further edges while a settle timer was running
+
+    def add(self, pin, action):
+        self.gpio.setup(pin, self.gpio.IN, pull_up_down=self.gpio.PUD_UP)
+        self.actions[pin] = action
+        self.gpio.add_event_detect(pin, self.gpio.FALLING, callback=self._on_edge, bouncetime=self.bouncetime_ms)
+
+    def _on_edge(self, pin):
+        # Runs on the GPIO callback thread, keep it short: the pin is read when the contact has settled
+        with self._lock:
+            if pin in self._pending:
+                self.bounces += 1
+                return
+            timer = threading.Timer(self.settle, self._settled, args=(pin,))
+            timer.daemon = True
+            self._pending[pin] = timer
+        timer.start()
+
+    def _settled(self, pin, checks=1):
+        held = self.gpio.input(pin) == self.gpio.LOW
+        with self._lock:
+            if pin not in self._pending:  # closed meanwhile
+                return
+            if not held and checks < SETTLE_CHECKS:
+                # Still bouncing or let go, give it another settle time before calling it a glitch
+                timer = threading.Timer(self.settle, self._settled, args=(pin, checks + 1))
+                timer.daemon = True
+                self._pending[pin] = timer
+                timer.start()
+                return
+            del self._pending[pin]
+        if not held:
+            self.rejected += 1
+            return
+        self.presses += 1
+        self.dispatch(self.actions[pin])
+
+    def close(self):
+        with self._lock:
+            for timer in self._pending.values():
+                timer.cancel()
+            self._pending.clear()
+        for pin in self.actions:
+            self.gpio.remove_event_detect(pin)
+
+    def report(self):
+        text = f"Buttons: {self.presses} presses, {self.bounces} bounces and {self.rejected} glitches ignored"
+        suppressed = getattr(self.gpio, 'suppressed', None)  # only FakeGPIO counts them, RPi.GPIO does not tell
+        if suppressed is not None:
+            text += f", {suppressed} edges filtered by the bouncetime"
+        return text
+
+
+def load_gpio(fake=False):
+    """The RPi.GPIO module, or a FakeGPIO for running off the Pi."""
+    if fake:
+        return FakeGPIO()
+    import RPi.GPIO as GPIO
+    return GPIO
@@ -0,0 +1,139 @@
+"""Classifier backends with the same classify(features) interface as ImpulseRunner.
+
+Every backend returns the Edge Impulse result format
+{'result': {'classification': {label: score, ...}}} so the callers do not care
+which one is used. load_classifier() picks the backend from the model file:
+
+- model.eim: EimClassifier, the Edge Impulse runner in a separate process (one socket
+  round trip with JSON per classification)
+- model.npz: DenseNetworkClassifier, the same dense network evaluated in-process with
+  NumPy, also on whole batches of feature vectors at once
+
+The .npz file holds the weights of the Edge Impulse classifier block:
+    labels             class names, in the order of the output layer
+    input_scale        optional, the "scale axes" of the raw data block (scalar or one per feature)
+    input_mean/std     optional, standardization applied after the scaling
+    layer0_weights     (inputs, units) kernel of the first dense layer, layer0_bias (units,)
+    layer1_weights ... and so on. Hidden layers use ReLU, the last one softmax.
+edge_impulse_model.py writes it from the float32 classifier exported from Edge Impulse.
+"""
+import os
+import asyncio
+
+
+class EimClassifier:
+    '''
+    The exported .eim model, run through Edge Impulse's ImpulseRunner (separate process).
+
+    Args:
+        model_path(str): path to the .eim file (has to be executable)
+    '''
+    def __init__(self, model_path):
+        from edge_impulse_linux.runner import ImpulseRunner  # only needed when a model is used
+
+        self.runner = ImpulseRunner(model_path)
+        self.model_info = self.runner.init()
+
+    def classify(self, features):
+        return self.runner.classify(features)
+
+    def close(self):
+        self.runner.stop()
+
+
+class StubClassifier:
+    '''
+    Stand-in for a model, e.g. for tests and benchmarks without the .eim file.
+
+    Always gives the first label the highest score.
+
+    Args:
+        labels(list): class names
+    '''
+    def __init__(self, labels=('empty',)):
+        self.labels = list(labels)
+
+    def classify(self, features):
+        scores = {label: 0.0 for label in self.labels}
+        scores[self.labels[0]] = 1.0
+        return {'result': {'classification': scores}}
+
+    def close(self):
+        pass
+
+
+class DenseNetworkClassifier:
+    '''
+    In-process NumPy version of the Edge Impulse dense network (float32 export).
+
+    Args:
+        weights_path(str): .npz file, see the module docstring
+    '''
+    def __init__(self, weights_path):
+        import numpy as np  # only needed for .npz models
+
+        with np.load(weights_path) as data:
+            self.labels = [str(label) for label in data['labels']]
+            self.input_scale = data['input_scale'].astype(np.float32) if 'input_scale' in data else None
+            self.input_mean = data['input_mean'].astype(np.float32) if 'input_mean' in data else None
+            self.input_std = data['input_std'].astype(np.float32) if 'input_std' in data else None
+            self.layers = []
+            while f'layer{len(self.layers)}_weights' in data:
+                i = len(self.layers)
+                self.layers.append((data[f'layer{i}_weights'].astype(np.float32),
+                                    data[f'layer{i}_bias'].astype(np.float32)))
+        if not self.layers:
+            raise ValueError(f"No layers found in {weights_path}")
+        if self.layers[-1][0].shape[1] != len(self.labels):
+            raise ValueError("The last layer does not match the number of labels")
+
+        self.input_features_count = self.layers[0][0].shape[0]
+        self.model_info = {
+            'project': {'owner': 'local', 'name': os.path.basename(weights_path)},
+            'model_parameters': {'input_features_count': self.input_features_count, 'labels': self.labels},
+        }
+
+    def classify_batch(self, features):
+        """Scores for a (samples, features) batch, returns a (samples, labels) array."""
+        import numpy as np
+        x = np.asarray(features, dtype=np.float32).reshape(-1, self.input_features_count)
+        if self.input_scale is not None:
+            x = x * self.input_scale
+        if self.input_mean is not None:
+            x = x - self.input_mean
+        if self.input_std is not None:
+            x = x / self.input_std
+
+        for i, (weights, bias) in enumerate(self.layers):
+            x = x @ weights + bias
+            if i < len(self.layers) - 1:
+                np.maximum(x, 0.0, out=x)  # ReLU
+
+        x = x - x.max(axis=1, keepdims=True)  # softmax
+        np.exp(x, out=x)
+        x /= x.sum(axis=1, keepdims=True)
+        return x
+
+    def classify(self, features):
+        scores = self.classify_batch([features])[0]
+        return {'result': {'classification': {label: float(score) for label, score in zip(self.labels, scores)}}}
+
+    def close(self):
+        pass
+
+
+async def classify_async(classifier, features, executor=None, timeout=None):
+    """
+    Awaitable classify(): the call runs on `executor` (None = the loop's default executor) so
+    the event loop keeps running. Raises asyncio.TimeoutError after `timeout` seconds, the
+    call itself cannot be interrupted and finishes in the background.
+    """
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(loop.run_in_executor(executor, classifier.classify, features), timeout)
+
+
+def load_classifier(model_path):
+    """EimClassifier for .eim files, DenseNetworkClassifier for .npz weight files."""
+    if model_path.endswith('.npz'):
+        return DenseNetworkClassifier(model_path)
+    return EimClassifier(model_path)
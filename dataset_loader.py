@@ -0,0 +1,221 @@
+"""Loads the collected label.YYYYMMDD_HHMMSS.csv files into labelled NumPy arrays.
+
+The files are parsed in parallel (one process per CPU core) and both CSV schemas are mapped
+onto the same channel order (recorder.CHANNELS, BME680_pressure is NaN where it was not
+recorded). The result is cached as .npy files next to a manifest of the file sizes and
+mtimes, later loads memory-map the cache and only parse files that are new or changed.
+
+    python3 dataset_loader.py [folder]    # prints a summary, default Assets/Collected_Data
+"""
+import os
+import sys
+import csv
+import glob
+import json
+import time
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from recorder import CHANNELS, write_json_atomic
+from sensor_backends import recording_label
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Assets", "Collected_Data")
+CACHE_DIR_NAME = ".dataset_cache"
+CACHE_VERSION = 1
+
+
+def parse_csv(path):
+    """Return (rows x channels float32 array, row times in seconds since the file start) of one CSV file."""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        rows = [row for row in reader if row]
+    if header is None or not rows:
+        return np.zeros((0, len(CHANNELS)), dtype=np.float32), np.zeros(0)
+
+    # Empty cells (failed readings) become NaN
+    table = np.array([[float(value) if value.strip() else np.nan for value in row] for row in rows], dtype=np.float64)
+
+    # Put every known column at its place in CHANNELS, missing columns stay NaN
+    data = np.full((len(rows), len(CHANNELS)), np.nan, dtype=np.float32)
+    for column, name in enumerate(header):
+        if name in CHANNELS:
+            data[:, CHANNELS.index(name)] = table[:, column]
+    offsets = table[:, header.index('timestamp')] / 1000.0 if 'timestamp' in header else np.arange(len(rows), dtype=np.float64)
+    return data, offsets
+
+
+def file_start_time(path):
+    """Unix time from the file name, 0 if the name has no YYYYMMDD_HHMMSS part (or YYYYMMDD_HHMMSS_mmm, see recorder.py)."""
+    try:
+        part = os.path.basename(path).split('.')[-2]
+        if part.count('_') == 2:
+            part, milliseconds = part.rsplit('_', 1)
+            return datetime.strptime(part, "%Y%m%d_%H%M%S").timestamp() + int(milliseconds) / 1000
+        return datetime.strptime(part, "%Y%m%d_%H%M%S").timestamp()
+    except (ValueError, IndexError):
+        return 0.0
+
+
+class Dataset:
+    '''
+    All rows of the loaded files.
+
+    Attributes:
+        data: (rows, channels) float32, channel order in `channels`
+        times: (rows,) float64 unix time of every row
+        labels: (rows,) int32 index into `label_names`
+        file_index: (rows,) int32 index into `files`
+    '''
+    def __init__(self, data, times, labels, file_index, label_names, files):
+        self.data = data
+        self.times = times
+        self.labels = labels
+        self.file_index = file_index
+        self.label_names = label_names
+        self.files = files
+        self.channels = CHANNELS
+
+    def __len__(self):
+        return len(self.data)
+
+    def channel(self, name):
+        return self.data[:, CHANNELS.index(name)]
+
+    def select(self, channels):
+        """(rows, len(channels)) array with only these channels, in this order."""
+        return self.data[:, [CHANNELS.index(name) for name in channels]]
+
+    def window_starts(self, size, step=1):
+        """Start rows of all windows of `size` rows that stay inside one file."""
+        if len(self) < size:
+            return np.zeros(0, dtype=np.int64)
+        starts = np.arange(0, len(self) - size + 1, step)
+        same_file = self.file_index[starts] == self.file_index[starts + size - 1]
+        return starts[same_file]
+
+    def windows(self, size, step=1):
+        """
+        Returns (windows, labels): windows has shape (n, size, channels).
+        The sliding window itself is a view, only the selected windows are copied.
+        """
+        view = np.lib.stride_tricks.sliding_window_view(self.data, size, axis=0)  # (rows - size + 1, channels, size)
+        starts = self.window_starts(size, step)
+        return view[starts].transpose(0, 2, 1), self.labels[starts]
+
+    def summary(self):
+        lines = [f"{len(self)} rows from {len(self.files)} files"]
+        counts = np.bincount(self.labels, minlength=len(self.label_names)) if len(self) else []
+        for name, count in zip(self.label_names, counts):
+            lines.append(f"  {name}: {count} rows")
+        return '\n'.join(lines)
+
+
+def _manifest_entry(path, root):
+    stat = os.stat(path)
+    return {'file': os.path.relpath(path, root), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def _load_cache(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != CACHE_VERSION or manifest.get('channels') != CHANNELS:
+            return None
+        arrays = {name: np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode='r')
+                  for name in ('data', 'offsets')}
+        return manifest, arrays
+    except (OSError, ValueError):
+        return None
+
+
+def load_dataset(root=DEFAULT_DATA_DIR, cache=True, workers=None):
+    '''
+    Load every CSV below `root`.
+
+    Args:
+        root(str): folder that is searched recursively
+        cache(bool): use and update the cache in <root>/.dataset_cache
+        workers(int): number of parser processes, default one per CPU core
+    '''
+    files = sorted(glob.glob(os.path.join(root, '**', '*.csv'), recursive=True),
+                   key=lambda f: (file_start_time(f), f))
+    entries = [_manifest_entry(f, root) for f in files]
+    cache_dir = os.path.join(root, CACHE_DIR_NAME)
+
+    # Reuse the parsed rows of files that did not change since the cache was written
+    cached = _load_cache(cache_dir) if cache else None
+    reused = {}
+    if cached is not None:
+        manifest, arrays = cached
+        for old in manifest['files']:
+            reused[(old['file'], old['mtime_ns'], old['size'])] = (old['start'], old['rows'])
+
+    parts = [None] * len(files)
+    to_parse = []
+    for i, entry in enumerate(entries):
+        key = (entry['file'], entry['mtime_ns'], entry['size'])
+        if key in reused:
+            start, rows = reused[key]
+            parts[i] = (arrays['data'][start:start + rows], arrays['offsets'][start:start + rows])
+        else:
+            to_parse.append(i)
+
+    if to_parse:
+        if len(to_parse) > 1 and workers != 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parsed = pool.map(parse_csv, [files[i] for i in to_parse], chunksize=32)
+                for i, result in zip(to_parse, parsed):
+                    parts[i] = result
+        else:
+            for i in to_parse:
+                parts[i] = parse_csv(files[i])
+
+    unchanged = (cached is not None and not to_parse
+                 and [(e['file'], e['mtime_ns'], e['size']) for e in entries]
+                 == [(e['file'], e['mtime_ns'], e['size']) for e in cached[0]['files']])
+    if unchanged:
+        # Nothing to parse or reorder, hand out the memory-mapped cache itself
+        data, offsets = cached[1]['data'], cached[1]['offsets']
+    elif parts:
+        data = np.concatenate([p[0] for p in parts])
+        offsets = np.concatenate([p[1] for p in parts])
+    else:
+        data = np.zeros((0, len(CHANNELS)), dtype=np.float32)
+        offsets = np.zeros(0)
+    row_counts = np.array([len(p[0]) for p in parts], dtype=np.int64)
+
+    file_index = np.repeat(np.arange(len(files), dtype=np.int32), row_counts)
+    starts = np.array([file_start_time(f) for f in files], dtype=np.float64)
+    times = starts[file_index] + offsets if len(files) else np.zeros(0)
+
+    file_labels = [recording_label(f) for f in files]
+    label_names = sorted(set(file_labels))
+    label_codes = np.array([label_names.index(label) for label in file_labels], dtype=np.int32)
+    labels = label_codes[file_index] if len(files) else np.zeros(0, dtype=np.int32)
+
+    if cache and not unchanged:
+        os.makedirs(cache_dir, exist_ok=True)
+        for name, array in (('data', data), ('offsets', offsets)):
+            # Write next to the old file and swap, the old one may still be memory-mapped
+            tmp_path = os.path.join(cache_dir, name + '.tmp.npy')
+            np.save(tmp_path, array)
+            os.replace(tmp_path, os.path.join(cache_dir, name + '.npy'))
+        row_starts = np.concatenate([[0], np.cumsum(row_counts)[:-1]]) if len(files) else []
+        for entry, start, rows in zip(entries, row_starts, row_counts):
+            entry['start'] = int(start)
+            entry['rows'] = int(rows)
+        write_json_atomic(os.path.join(cache_dir, 'manifest.json'),
+                          {'version': CACHE_VERSION, 'channels': CHANNELS, 'files': entries})
+
+    return Dataset(data, times, labels, file_index, label_names, files)
+
+
+if __name__ == '__main__':
+    root = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATA_DIR
+    start = time.perf_counter()
+    dataset = load_dataset(root)
+    print(dataset.summary())
+    print(f"Loaded in {time.perf_counter() - start:.2f} s")
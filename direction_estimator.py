@@ -0,0 +1,121 @@
+"""Direction of a smell source from the outer SGP30 sensors.
+
+Picking the sensor with the highest absolute reading reacts late: the ambient level of a
+sensor easily hides a small rise on another one. DirectionEstimator instead tracks a
+baseline for every sensor (an EWMA that only creeps up while the sensor is rising) and scores
+each sensor by its rise above the baseline plus its current rate of change, both measured
+in units of that sensor's own noise. A rising sensor therefore stands out from the first
+or second sample of an onset.
+
+The scores are summed as vectors pointing at the sensors' positions on the LED ring, which
+gives a continuous bearing between the sensors and a confidence (how much the activity
+points one way).
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+
+DirectionResult = namedtuple('DirectionResult', [
+    'active',        # True if a sensor rises clearly above its noise
+    'sensor',        # index of the sensor closest to the bearing (or with the highest delta)
+    'bearing',       # degrees on the ring, 0 = LED 0, counted in LED order
+    'led_position',  # bearing as a fractional LED index (0 <= position < led_count)
+    'confidence',    # 0-1
+])
+
+
+class DirectionEstimator:
+    '''
+    Args:
+        led_positions(list): LED index in front of every sensor, e.g. [1, 5, 11, 15]
+        led_count(int): LEDs on the ring
+        quiet_alpha(float): how fast the baseline follows the ambient level while nothing is rising
+        rise_alpha(float): how fast the baseline follows an active (rising) sensor, slow so a source is not absorbed
+        fall_alpha(float): how fast the baseline follows falling readings
+        noise_alpha(float): smoothing of the per-sensor noise estimate
+        derivative_weight(float): weight of the rate of change against the rise above baseline
+        threshold(float): activity (in noise units) above which a direction is reported
+        warmup(int): readings per sensor before a direction is reported
+    '''
+    def __init__(self, led_positions, led_count=20, quiet_alpha=0.05, rise_alpha=0.01, fall_alpha=0.2,
+                 noise_alpha=0.05, derivative_weight=1.0, threshold=8.0, warmup=5, min_noise=1e-4):
+        self.led_positions = np.asarray(led_positions, dtype=np.float64)
+        self.led_count = led_count
+        angles = self.led_positions / led_count * 2 * math.pi
+        self.directions = np.stack([np.cos(angles), np.sin(angles)])  # (2, sensors)
+
+        self.quiet_alpha = quiet_alpha
+        self.rise_alpha = rise_alpha
+        self.fall_alpha = fall_alpha
+        self.noise_alpha = noise_alpha
+        self.derivative_weight = derivative_weight
+        self.threshold = threshold
+        self.warmup = warmup
+        self.min_noise = min_noise
+
+        n = len(led_positions)
+        self.baseline = np.full(n, np.nan)
+        self.previous = np.full(n, np.nan)
+        self.noise = np.full(n, min_noise)
+        self.samples = np.zeros(n)  # valid readings per sensor
+
+    def update(self, readings):
+        """
+        Add one reading per sensor (None for failed sensors) and return a DirectionResult.
+        The readings only need to be comparable between sensors, e.g. normalized CO2 + TVOC.
+        """
+        x = np.array([np.nan if r is None else r for r in readings], dtype=np.float64)
+        valid = ~np.isnan(x)
+
+        # First valid reading of a sensor starts its baseline
+        new = valid & np.isnan(self.baseline)
+        self.baseline[new] = x[new]
+        self.previous[new] = x[new]
+
+        delta = np.where(valid, x - self.baseline, 0.0)
+        derivative = np.where(valid, x - self.previous, 0.0)
+        derivative[np.isnan(derivative)] = 0.0
+
+        # Activity in units of each sensor's noise, only rises count
+        activity = (np.maximum(delta, 0.0) + self.derivative_weight * np.maximum(derivative, 0.0)) / self.noise
+        activity[~valid] = 0.0
+
+        # Update the trackers after scoring, so an onset is not partly absorbed by its own sample.
+        # While a sensor is active its baseline only creeps up, after a source it drops back quickly,
+        # otherwise it follows the ambient level.
+        rising = activity >= self.threshold
+        falling = delta < -self.threshold * self.noise
+        alpha = np.where(falling, self.fall_alpha, np.where(rising, self.rise_alpha, self.quiet_alpha))
+        self.baseline[valid] += alpha[valid] * delta[valid]
+
+        # Noise = average absolute change per sample, learned quickly during the warm-up and
+        # not from the samples of a source
+        self.samples[valid] += 1
+        noise_alpha = np.maximum(self.noise_alpha, 1.0 / np.maximum(self.samples, 1))
+        quiet = valid & (~rising | (self.samples <= self.warmup))
+        self.noise[quiet] += noise_alpha[quiet] * (np.abs(derivative[quiet]) - self.noise[quiet])
+        np.maximum(self.noise, self.min_noise, out=self.noise)
+        self.previous[valid] = x[valid]
+
+        total = activity.sum()
+        warming_up = self.samples[valid].min() <= self.warmup if valid.any() else True
+        if warming_up or total <= 0 or activity.max() < self.threshold:
+            # Nothing is rising, fall back to the sensor furthest above its baseline
+            sensor = int(np.argmax(np.where(valid, delta, -np.inf))) if valid.any() else 0
+            position = float(self.led_positions[sensor])
+            return DirectionResult(False, sensor, position / self.led_count * 360.0, position, 0.0)
+
+        vector = self.directions @ activity
+        bearing = math.degrees(math.atan2(vector[1], vector[0])) % 360.0
+        position = bearing / 360.0 * self.led_count
+
+        # Confidence: how aligned the activity is (1 = a single sensor), times how far above the threshold it is
+        alignment = float(np.hypot(vector[0], vector[1]) / total)
+        strength = 1.0 - math.exp(-(activity.max() - self.threshold) / self.threshold)
+        confidence = alignment * (0.5 + 0.5 * strength)
+
+        # Sensor closest to the bearing (circular distance on the ring)
+        distance = np.abs((self.led_positions - position + self.led_count / 2) % self.led_count - self.led_count / 2)
+        sensor = int(np.argmin(distance))
+        return DirectionResult(True, sensor, bearing, position, confidence)
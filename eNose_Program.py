@@ -1,59 +1,91 @@
+"""Directional eNose: reads the sensor array, shows the smell direction on the LED ring and GUI and
+classifies the smell with the Edge Impulse model.
+
+    sudo python3 eNose_Program.py [model.eim | model.npz] [--replay PATH [--speed N] [--loop]]
+                                  [--daemon [--socket PATH]] [--raw | --raw-rate N] [--align] [--log-level LEVEL] [--verbose] [--log-json]
+
+Importing this module has no side effects: the hardware, the model and the GUI are set up by
+main(), and the heavy libraries (tkinter, PIL, RPi.GPIO, rpi_ws281x, edge_impulse_linux, NumPy)
+are only imported on the code paths that use them. Benchmarks/import_time.py keeps track of it.
+"""
 import os
 import sys
-import subprocess
 import time
-import adafruit_sgp30
-import bme680
-import board
-import adafruit_tca9548a
-import tkinter as tk
+import asyncio
+import logging
+import subprocess
 import threading
-import RPi.GPIO as GPIO # For GPIO control
-from PIL import Image, ImageTk # For GUI image handling
-from grove.i2c import Bus # For Grove I2C communication
-from rpi_ws281x import PixelStrip, Color # For WS2813 RGB LED Strip control
-from grove_ws2813_rgb_led_strip import GroveWS2813RgbStrip # For Grove WS2813 RGB LED Strip control
-from edge_impulse_linux.runner import ImpulseRunner # Imports Edge Impulse's C++ model runner (runs the .eim model file)
-
-from enose_functions import normalize, colorWipe # Import utility functions (moved them to make the code cleaner)
+from concurrent.futures import ThreadPoolExecutor
+
+IMPORT_START = time.monotonic() # The startup timeline counts from here, so the module imports show up in it
+from startup import StartupTimeline # Startup timeline of the parallel init tasks (see startup.py)
+from classifier_backends import load_classifier, classify_async # Runs the .eim model file (or its weights exported to .npz, in-process)
+from enose_functions import normalize, build_features, build_raw_features, top_class, FEATURE_NAMES, RAW_FEATURE_NAMES # Import utility functions (moved them to make the code cleaner)
+from sensor_backends import backend_from_args # Real sensors or replayed recordings (see sensor_backends.py)
+from sensor_health import CIRCUIT_OPEN # Error of the SGP30 sensors that are skipped after repeated failures
+from frame_alignment import FrameAligner # Resamples the readings of a frame onto its cycle time ("--align")
+from scheduler import FixedRateScheduler # Keeps the sensor loop at a fixed rate
+from pipeline import AsyncDropOldestQueue, AsyncStage, pipeline_report # Runs the loop stages as asyncio tasks
+from gui_state import GuiState, StateStore, SnapshotRenderer, run_tk # What the GUI labels show, drawn on a fixed tick
+from rolling_features import RollingFeatureEngine # Window statistics of the features, for time-series models
+from metrics import METRICS, serve_metrics # Latency histograms and error counters, exported over HTTP and as JSON
+from enose_logging import CYCLE_LOG, setup_logging, logging_args # Batched, rate limited logging, per-cycle detail with --verbose
+from buttons import ButtonHandler, load_gpio # Edge-triggered buttons (or a fake GPIO off the Pi)
+from led_framebuffer import LedRenderer, BLACK, rgb, single_pixel_frame, bearing_frame, color_wipe_frames # Non-blocking LED ring updates
+IMPORT_END = time.monotonic()
+
+SCHEDULER_REPORT_EVERY = 60 # Print the loop timing statistics every 60 cycles
+GUI_REFRESH_MS = 100 # How often the GUI labels are redrawn from the latest state
+GUI_TICK_MS = 20 # How often Tk processes its events (window.update()) on the asyncio loop
+CLASSIFY_TIMEOUT = 5.0 # Seconds, a classification that takes longer is reported as failed
+ROLLING_WINDOW = 10 # Samples per feature window (10 s at 1 Hz, same as one collected CSV file)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+STARTUP_LOG = os.path.join(SCRIPT_DIR, "startup_timeline.log") # One JSON line with the startup timeline per boot
+METRICS_PORT = 9108 # Local HTTP endpoint for the metrics (http://127.0.0.1:9108/metrics), "--metrics-port 0" turns it off
+METRICS_FILE = os.path.join(SCRIPT_DIR, "metrics.json") # Metrics dump, rewritten every METRICS_DUMP_EVERY seconds
+METRICS_DUMP_EVERY = 60
+RECENT_LOG = os.path.join(SCRIPT_DIR, "recent_debug.log") # The last log records (DEBUG included), written on exit
+SENSOR_ERROR_LOG_EVERY = 30 # Seconds between two "Error reading SGP30_x" messages (the rest are counted)
+
+log = logging.getLogger('enose')
 
 # Define a bias to rotate LED direction to match sensor layout
 PIN   = 12  # connect Grove WS2813 RGB LED Strip SIG to pin 12(slot PWM)
 COUNT = 20  # For Grove - WS2813 RGB LED Ring - 20 LED total
 
-args = sys.argv[1:] # a list that contains the command-line arguments passed to the script (e.g. model.eim)
+args = [] # Command-line arguments left after the backend options (e.g. model.eim), set by main()
+logging_setup = None # Handlers installed by main(), see enose_logging.py
 
-stop_event = threading.Event() # thread-safe flag
+timeline = None # Startup timeline, created by main()
 
-shutdown = False  # Global shutdown flag
+# Everything runs on one asyncio event loop (see run()), blocking calls go to these executors
+i2c_executor = None # One thread, so the I2C bus is only used by one call at a time
+model_executor = None # One thread for loading the model and the classify() calls
+close_requested = None # asyncio Future, its result says if the Pi should be shut down (see request_close())
+metrics_port = METRICS_PORT # Set by main()
 
-co2_readings = []
-tvoc_readings = []
-combined_scores = []
+# Devices, created by main()
+gpio = None # RPi.GPIO, or buttons.FakeGPIO with "--fake-gpio"
+buttons = None # Runs the button actions on the event loop
+strip = None # Grove WS2813 RGB LED Strip
+led_renderer = None # Only this thread touches the strip: it pushes a frame only when it changed and plays the animations
+sensor_backend = None # The real I2C sensor array, or recorded CSVs with "--replay <path> [--speed N] [--loop]"
 
-# Grove WS2813 RGB LED Strip setup
-strip = GroveWS2813RgbStrip(PIN, COUNT)
+scheduler = None # Created by sensor_loop(), holds the loop timing statistics
 
-# Create I2C bus as normal
-i2c = board.I2C()  # uses board.SCL and board.SDA
+runner = None # The classifier, loaded in the background by load_model()
+model_ready = threading.Event() # Set once load_model() is done (with or without a model)
 
-# Create the TCA9548A object and give it the I2C bus
-mux1 = adafruit_tca9548a.TCA9548A(i2c, address=0x70)
-mux2 = adafruit_tca9548a.TCA9548A(i2c, address=0x71) # Note: remember to change address by shorting the two A0 pads on the module
+# Rolling window over the model features (only used by the feature stage)
+feature_engine = RollingFeatureEngine(FEATURE_NAMES, ROLLING_WINDOW)
+model_input_count = None # Number of inputs the loaded model expects, set in program_init()
 
-# For each sensor, create it using the TCA9548A channel instead of the I2C object
-sgp30_sensors = [
-    adafruit_sgp30.Adafruit_SGP30(mux1[0]),  # SGP30_1
-    adafruit_sgp30.Adafruit_SGP30(mux1[1]),  # SGP30_2
-    adafruit_sgp30.Adafruit_SGP30(mux1[2]),  # SGP30_3
-    adafruit_sgp30.Adafruit_SGP30(mux1[3]),  # SGP30_4
-    adafruit_sgp30.Adafruit_SGP30(mux1[4]),  # SGP30_5
-    adafruit_sgp30.Adafruit_SGP30(mux1[5]),  # SGP30_6
-    adafruit_sgp30.Adafruit_SGP30(mux1[6]),  # SGP30_7
-    adafruit_sgp30.Adafruit_SGP30(mux1[7]),  # SGP30_8
-    adafruit_sgp30.Adafruit_SGP30(mux2[0]),  # SGP30_9
-    adafruit_sgp30.Adafruit_SGP30(mux2[1])   # SGP30_10
-]
+# Latest text and color of the GUI labels, published by the pipeline stages and drawn on the Tk tick
+gui_state = StateStore(GuiState(
+    direction=("Awaiting sensor data...", "yellow"),
+    smell=("Bind smell to this label", "gray"),
+    error=("", "red"),
+))
 
 sensor_to_led_map = {
     0: 1,    # Sensor 0 → LED 1
@@ -62,180 +94,284 @@ sensor_to_led_map = {
     3: 15,   # Sensor 3 → LED 15
 }
 
-bme680_sensor = None # later initialized in program_init()
-
-# Reading sensor data and adjusting LED colors
-def sensor_loop():
-    while not stop_event.is_set():
-        co2_readings.clear()
-        tvoc_readings.clear()
-        combined_scores.clear()
-
-        # Read SGP30 sensor data
-        for i, sensor in enumerate(sgp30_sensors):
-            try:
-                sensor.iaq_measure()  # Must call this every second
-
-                co2 = sensor.eCO2
-                tvoc = sensor.TVOC
-
-                co2_readings.append(co2)
-                tvoc_readings.append(tvoc)
-
-                # Normalize (you can adjust these min/max bounds based on your expected range)
-                norm_co2 = normalize(co2, 400, 60000)  # Normalizing CO2 from 400ppm to 60000ppm
-                norm_tvoc = normalize(tvoc, 0, 60000)  # Normalizing TVOC from 0ppb to 60000ppb
-                score = norm_co2 + norm_tvoc  # Simple combined score
-
-                combined_scores.append(score)
-            except Exception as e:
-                print(f"Error reading SGP30_{i+1}: {e}")
-
-                errorlabel5.after(0, lambda: errorlabel5.config(
-                    text=f"error detected",
-                    foreground="red"
-                    ))
-
-                co2_readings.append(None)
-                tvoc_readings.append(None)
-                combined_scores.append(-1)  # Force it to be lowest
-
-        # Now find which sensor has the highest readings for determining the direction of the smell
-        # --- Only use outer 4 sensors (0 to 3) for scoring and LED ---
-        outer_scores = combined_scores[:4]  # only use first 4 sensor scores
-
-        # Find index of max score in outer sensors
-        highest_index = outer_scores.index(max(outer_scores))
-        print(f"Sensor with highest readings (outer 4 only): SGP30_{highest_index + 1}")
-
-        label3.after(0, lambda: label3.config(
-            text=f"Highest: SGP30_{highest_index + 1}",
-            foreground="red"
-        ))
-
-        highlight_led = sensor_to_led_map.get(highest_index)
-
-        # Turn off all LEDs
-        for i in range(strip.numPixels()):
-            strip.setPixelColor(i, Color(0, 0, 0))
-        strip.show()
-
-        # Highlight LED if it's valid
-        if highlight_led is not None:
-            strip.setPixelColor(highlight_led, Color(255, 0, 0))  # red highlight
-            strip.show()
-
-        # Print SGP30 sensor data
-        print("-" * 50)
-        errorlabel5.after(0, lambda: errorlabel5.config(
-                    text="",
-                    foreground="red"
-                    ))
+# Baselines of the outer sensors for the direction (only used by the feature stage), created by main()
+direction_estimator = None
+frame_aligner = None # With "--align", created by main()
+
+# Metrics of the loop and the model (the sensor and LED metrics are recorded in sensor_backends.py and led_framebuffer.py)
+LOOP_SECONDS = METRICS.histogram('enose_loop_duration_seconds', 'Work time of one sensor loop cycle')
+CLASSIFY_SECONDS = METRICS.histogram('enose_classify_seconds', 'Time of one classification')
+CLASSIFY_ERRORS = METRICS.counter('enose_classify_errors_total', 'Failed classifications', ('reason',))
+LOOP_GAUGES = METRICS.gauge('enose_loop', 'Sensor loop scheduler statistics (cycles, overruns, skipped ticks, jitter)', ('stat',))
+STAGE_GAUGES = METRICS.gauge('enose_stage', 'Pipeline stage statistics', ('stage', 'stat'))
+
+def collect_metrics():
+    """Copies the scheduler and pipeline counters into the gauges, called before every export."""
+    if scheduler is not None:
+        for key, value in scheduler.stats().items():
+            LOOP_GAUGES.set(value, (key,))
+    for stage in pipeline_stages:
+        for key, value in stage.stats().items():
+            STAGE_GAUGES.set(value, (stage.name, key))
+
+METRICS.add_collector(collect_metrics)
+
+async def dump_metrics():
+    """Rewrite the JSON metrics file every METRICS_DUMP_EVERY seconds (written on the default executor)."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(METRICS_DUMP_EVERY)
+        try:
+            await loop.run_in_executor(None, METRICS.write_json, METRICS_FILE)
+        except OSError as e:
+            log.warning("Could not write the metrics to %s: %s", METRICS_FILE, e)
+
+# Pipeline queues: acquisition -> features -> inference (the LEDs have their own thread, see led_renderer)
+# Each queue only holds the newest few items, a slow stage drops old work instead of blocking the one before it.
+# Created by create_pipeline() on the running event loop (asyncio objects made at import time are bound to
+# another loop on Python 3.9)
+frame_queue = None
+inference_queue = None
+pipeline_stages = []
+
+# Stage 1: reading sensor data (asyncio task, the I2C reads run on the I2C executor)
+async def sensor_loop():
+    global scheduler
+    # Deadline based timing on the monotonic clock, so the time spent on reading does not add up on top of
+    # the period (the SGP30 needs iaq_measure() once every second)
+    scheduler = FixedRateScheduler(sensor_backend.period)
+    scheduler.start()
+    loop = asyncio.get_running_loop()
+
+    while True:
+        frame = await loop.run_in_executor(i2c_executor, sensor_backend.read_frame)
+        if frame is None: # Only happens when a replay has run out of recorded data
+            log.info("No more sensor data. Stopping sensor loop.")
+            break
+
+        if scheduler.cycles == 0: # Startup is over with the first reading
+            timeline.mark('first reading')
+            log.info(timeline.report())
+            timeline.write(STARTUP_LOG)
+
+        frame_queue.put(frame) # Never blocks, the other stages are their own tasks
+
+        if scheduler.cycles % SCHEDULER_REPORT_EVERY == 0:
+            log.info(scheduler.report())
+            log.info(pipeline_report(pipeline_stages))
+            if getattr(sensor_backend, 'health', None) is not None and sensor_backend.health.open_keys():
+                log.info(sensor_backend.health.report())
+
+        await scheduler.wait_async() # Wait for the next 1 second tick (replays can run faster), cancelled on close
+        LOOP_SECONDS.observe(scheduler.recent_durations[-1])
+
+# Stage 2: direction scoring and the feature vector for the model
+def process_frame(frame):
+    # All readings at the cycle time instead of the moment each sensor was read (see frame_alignment.py)
+    if frame_aligner is not None:
+        frame = frame_aligner.align(frame)
+
+    # Raw mode (--raw): between the once per second IAQ cycles only the raw signals are new, the direction,
+    # GUI and LEDs keep the state of the last IAQ cycle. Only a model that takes the raw signals gets these frames
+    if not frame.iaq_fresh:
+        model_input = raw_model_input(frame)
+        if model_input is not None:
+            inference_queue.put(model_input)
+        return
+
+    co2_readings = []
+    tvoc_readings = []
+    combined_scores = []
+
+    for i in range(len(frame.co2)):
+        co2 = frame.co2[i]
+        tvoc = frame.tvoc[i]
+
+        if i not in frame.errors and co2 is not None and tvoc is not None:
+            co2_readings.append(co2)
+            tvoc_readings.append(tvoc)
+
+            # Normalize (you can adjust these min/max bounds based on your expected range)
+            norm_co2 = normalize(co2, 400, 60000)  # Normalizing CO2 from 400ppm to 60000ppm
+            norm_tvoc = normalize(tvoc, 0, 60000)  # Normalizing TVOC from 0ppb to 60000ppb
+            score = norm_co2 + norm_tvoc  # Simple combined score
+
+            combined_scores.append(score)
+        else:
+            # Sensors that are not read at all (e.g. SGP30_1-4 in replays) are not errors, skipped sensors
+            # were already reported when their circuit opened (see sensor_health.py)
+            if i in frame.errors and frame.errors[i] != CIRCUIT_OPEN:
+                log.warning("Error reading SGP30_%d: %s", i + 1, frame.errors[i],
+                            extra={'rate_limit': SENSOR_ERROR_LOG_EVERY})
+
+            co2_readings.append(None)
+            tvoc_readings.append(None)
+            combined_scores.append(-1)  # Force it to be lowest
+
+    # Now find which sensor has the highest readings for determining the direction of the smell
+    # --- Only use outer 4 sensors (0 to 3) for scoring and LED ---
+    outer_scores = combined_scores[:4]  # only use first 4 sensor scores
+
+    # Find index of max score in outer sensors
+    highest_index = outer_scores.index(max(outer_scores))
+
+    # Rising sensors (above their own baseline) show the direction much earlier than the absolute levels
+    direction = direction_estimator.update([score if score >= 0 else None for score in outer_scores])
+
+    # One short line per cycle (kept in the ring buffer, written with --log-level DEBUG)
+    if log.isEnabledFor(logging.DEBUG):
+        fields = {'highest': f'SGP30_{highest_index + 1}', 'errors': len(frame.errors)}
+        if direction.active:
+            fields.update(source=f'SGP30_{direction.sensor + 1}', bearing=round(direction.bearing),
+                          confidence=round(direction.confidence, 2))
+        log.debug("Cycle", extra={'fields': fields})
+
+    # Full SGP30 sensor data, only with --verbose
+    if CYCLE_LOG.isEnabledFor(logging.DEBUG):
+        lines = [f"Sensor with highest readings (outer 4 only): SGP30_{highest_index + 1}"]
+        if direction.active:
+            lines.append(f"Smell source towards SGP30_{direction.sensor + 1} (bearing {direction.bearing:.0f} deg, confidence {direction.confidence:.2f})")
         for i, (co2, tvoc) in enumerate(zip(co2_readings, tvoc_readings)):
             if co2 is not None and tvoc is not None:
-                print(f"SGP30_{i+1}: CO2={co2}ppm, TVOC={tvoc}ppb")
-            else:
-                print(f"SGP30_{i+1}: Error reading sensor")
-                errorlabel5.after(0, lambda: errorlabel5.config(
-                    text=f"Error reading SGP30_{i+1}",
-                    foreground="red"
-                    ))
-                time.sleep(0.5)
-        print("-" * 50)
-
-        # Read BME680 sensor data and collect features
-        features = []  # List to store all sensor readings as floats
-        
-        if bme680_sensor.get_sensor_data():
-            # Add BME680 readings to features list
-            features.append(float(bme680_sensor.data.temperature))
-            features.append(float(bme680_sensor.data.humidity))
-            
-            if bme680_sensor.data.heat_stable:
-                features.append(float(bme680_sensor.data.gas_resistance))
-                output = '{0:.2f} C,{1:.2f} %RH'.format(
-                    bme680_sensor.data.temperature,
-                    bme680_sensor.data.humidity)
-                print('{0},{1} Ohms'.format(
-                    output,
-                    bme680_sensor.data.gas_resistance))
-            else:
-                features.append(0.0)  # Add 0.0 if gas reading not stable
-                output = '{0:.2f} C,{1:.2f}%RH'.format(
-                    bme680_sensor.data.temperature,
-                    bme680_sensor.data.humidity)
-                print(output)
-        else:
-            # Add zeros if BME680 reading fails
-            features.extend([0.0, 0.0, 0.0])
-        
-        # Add SGP30 sensor readings (indexes 4-9) to features list
-        for i in range(4, 10):  # SGP30_5 to SGP30_10 (indexes 4-9)
-            if i < len(co2_readings) and co2_readings[i] is not None and tvoc_readings[i] is not None:
-                features.append(float(co2_readings[i]))
-                features.append(float(tvoc_readings[i]))
-            else:
-                # Add zeros if sensor reading fails
-                features.extend([0.0, 0.0])
-        
-        # Print features array for debugging
-        print(f"Features array: {features}")
-        print(f"Features count: {len(features)}")
-
-
-        if runner is not None:
-            try:
-                res = runner.classify(features)
-                print("Raw model output:", res)
-
-                if 'result' in res and 'classification' in res['result']:
-                    classifications = res['result']['classification']
-                    top_class = max(classifications, key=classifications.get)
-                    label4.after(0, lambda: label4.config(
-                        text=f"Smell: {top_class}",
-                        foreground="black"
-                    ))
-                else:
-                    label4.after(0, lambda: label4.config(
-                        text="Invalid model output.",
-                        foreground="red"
-                    ))
-            except Exception as e:
-                print(f"Classification error: {e}")
-                label4.after(0, lambda: label4.config(
-                    text="Classification failed.",
-                    foreground="red"
-                ))
-        else:
-            label4.after(0, lambda: label4.config(
-                text="No model loaded.",
-                foreground="gray"
-            ))
+                lines.append(f"SGP30_{i+1}: CO2={co2}ppm, TVOC={tvoc}ppb")
+            elif i in frame.errors:
+                lines.append(f"SGP30_{i+1}: Error reading sensor")
+        CYCLE_LOG.debug('\n'.join(lines))
+
+    # GUI labels: only the latest state is kept, the Tk thread picks it up on its next tick
+    failed_sensors = sorted(frame.errors)
+    if not failed_sensors:
+        error_text = ""
+    elif len(failed_sensors) == 1:
+        error_text = f"Error reading SGP30_{failed_sensors[0] + 1}"
+    else:
+        error_text = f"Error reading SGP30_{failed_sensors[0] + 1} (+{len(failed_sensors) - 1})"
+    if direction.active:
+        direction_text = f"Source: SGP30_{direction.sensor + 1} ({direction.confidence:.0%})"
+    else:
+        direction_text = f"Highest: SGP30_{highest_index + 1}"
+    gui_state.publish(
+        direction=(direction_text, "red"),
+        error=(error_text, "red"),
+    )
 
-        time.sleep(1) # Wait for 1 second before the next reading (this is the minimum required for SGP30)
+    # LED ring (pushed only if the frame changed): the estimated bearing between the LEDs while a source is
+    # detected, otherwise the LED of the sensor with the highest readings
+    if direction.active:
+        led_renderer.set_frame(bearing_frame(COUNT, direction.led_position, 255, 0, 0, 0.3 + 0.7 * direction.confidence))
+    else:
+        led_renderer.set_frame(single_pixel_frame(COUNT, sensor_to_led_map.get(highest_index), rgb(255, 0, 0)))
+
+    # Feature vector for the model (BME680 + SGP30_5 to SGP30_10, zeros for failed readings)
+    features = build_features(frame)
+
+    # BME680 sensor data and the features array, only with --verbose
+    if CYCLE_LOG.isEnabledFor(logging.DEBUG):
+        bme680_data = frame.bme680
+        if bme680_data is not None:
+            output = '{0:.2f} C,{1:.2f} %RH'.format(
+                bme680_data['temperature'],
+                bme680_data['humidity'])
+            if bme680_data['heat_stable']:
+                output = '{0},{1} Ohms'.format(
+                    output,
+                    bme680_data['gas_resistance'])
+            CYCLE_LOG.debug(output)
+        CYCLE_LOG.debug("Features array (%d): %s", len(features), features)
+
+    # Failed readings are held at their last value in the window instead of dropping to 0
+    feature_engine.push(build_features(frame, missing=None))
+
+    model_input = raw_model_input(frame) or select_model_input(features)
+    if model_input is not None:
+        inference_queue.put(model_input)
+
+def select_model_input(features):
+    """
+    Pick what the model gets from its input count: the 15 current values, the raw window
+    (time-series impulse) or the window statistics. None while the window is still filling up.
+    """
+    if model_input_count is None or model_input_count == len(features):
+        return features
+    if model_input_count == len(features) * ROLLING_WINDOW:
+        return feature_engine.timeseries_window() if feature_engine.ready() else None
+    if model_input_count == len(feature_engine.summary_names()):
+        return feature_engine.summary_features()
+    return features # Unknown layout, the model will report the mismatch
+
+def raw_model_input(frame):
+    """The 15 features followed by the 12 raw signals for a model trained on raw mode data, else None."""
+    if model_input_count != len(FEATURE_NAMES) + len(RAW_FEATURE_NAMES):
+        return None
+    return build_features(frame) + build_raw_features(frame)
+
+# Stage 3: smell classification with the Edge Impulse model (on the model executor)
+async def classify_features(features):
+    if not model_ready.is_set(): # The model is still starting, keep the initial label text
+        return
+    if runner is not None:
+        start = time.perf_counter()
+        try:
+            res = await classify_async(runner, features, model_executor, CLASSIFY_TIMEOUT)
+            CLASSIFY_SECONDS.observe(time.perf_counter() - start)
+            CYCLE_LOG.debug("Raw model output: %s", res)
 
-def start_gui():
+            smell = top_class(res)
+            if smell is not None:
+                gui_state.publish(smell=(f"Smell: {smell}", "black"))
+            else:
+                log.warning("Invalid model output: %s", res, extra={'rate_limit': 60})
+                gui_state.publish(smell=("Invalid model output.", "red"))
+        except asyncio.TimeoutError:
+            CLASSIFY_ERRORS.inc(('timeout',))
+            log.warning("Classification took longer than %s s.", CLASSIFY_TIMEOUT, extra={'rate_limit': 60})
+            gui_state.publish(smell=("Classification timed out.", "red"))
+        except Exception as e:
+            CLASSIFY_ERRORS.inc(('error',))
+            log.warning("Classification error: %s", e, extra={'rate_limit': 60})
+            gui_state.publish(smell=("Classification failed.", "red"))
+    else:
+        gui_state.publish(smell=("No model loaded.", "gray"))
+
+def create_pipeline():
+    """Create the pipeline queues and stages, call it on the event loop that runs them."""
+    global frame_queue, inference_queue, pipeline_stages
+    frame_queue = AsyncDropOldestQueue(2, 'frames')
+    inference_queue = AsyncDropOldestQueue(1, 'features')
+    pipeline_stages = [
+        AsyncStage('features', process_frame, frame_queue),
+        AsyncStage('inference', classify_features, inference_queue),
+    ]
+
+def create_window():
+    """Create the Tk window, its size is needed to prepare the background image."""
     global window
+    import tkinter as tk
+
     window = tk.Tk()
     window.title("Directional eNose GUI")
     window.protocol("WM_DELETE_WINDOW", on_closing) # Handle window close event
     window.attributes('-fullscreen', True) # Fullscreen mode
     window.config(cursor="none") # Hide mouse cursor
 
-    # Get screen width and height
-    screen_width = window.winfo_screenwidth()
-    screen_height = window.winfo_screenheight()
+def prepare_background(width, height):
+    """Load the background and resize it to fit the screen (plain PIL, so it can run on any thread)."""
+    from PIL import Image
 
-    script_dir = os.path.dirname(os.path.abspath(__file__))  # Get path to current script
-    image_path = os.path.join(script_dir, "Assets", "background.jpg")
-    # Resize image to fit screen
+    image_path = os.path.join(SCRIPT_DIR, "Assets", "background.jpg")
     bg_image = Image.open(image_path)
-    bg_image = bg_image.resize((screen_width, screen_height), Image.LANCZOS)
-    bg_photo = ImageTk.PhotoImage(bg_image)
+    return bg_image.resize((width, height), Image.LANCZOS)
+
+def start_gui(bg_image):
+    import tkinter as tk
+    from PIL import ImageTk
 
-    # Place the image as a Label behind everything
-    bg_label = tk.Label(window, image=bg_photo)
-    bg_label.place(x=0, y=0, relwidth=1, relheight=1)
+    # Place the image as a Label behind everything (PhotoImage has to be created on the event loop thread)
+    if bg_image is not None:
+        bg_photo = ImageTk.PhotoImage(bg_image)
+        bg_label = tk.Label(window, image=bg_photo)
+        bg_label.image = bg_photo # Keep a reference, Tk does not
+        bg_label.place(x=0, y=0, relwidth=1, relheight=1)
 
     # GUI widgets
     # Create a label at the top center of the window
@@ -300,140 +436,228 @@ def start_gui():
     )
     errorlabel5.pack(pady=(2, 0))  # Move expand=True to the second label
 
-    window.mainloop()  # Start the Tkinter main loop
+    # Redraw the labels from the latest published state on a fixed tick (only the ones that changed)
+    gui_renderer = SnapshotRenderer(window, gui_state, {
+        'direction': label3,
+        'smell': label4,
+        'error': errorlabel5,
+    }, GUI_REFRESH_MS)
+    gui_renderer.start()
 
-def on_closing():
-    print("Closing app...")
+    timeline.mark('GUI ready')
 
-    stop_event.set()       # Stop sensor thread
+def request_close(power_off=False):
+    """Ask run() to close the app (on the event loop thread), power_off also shuts the Pi down."""
+    if close_requested is not None and not close_requested.done():
+        close_requested.set_result(power_off)
 
-    # Small shutdown animation
-    colorWipe(strip, Color(255, 0, 0))  # Red wipe
-    # Turn off all LEDs
-    for i in range(strip.numPixels()):
-        strip.setPixelColor(i, Color(0, 0, 0))
-    strip.show()
+def on_closing():
+    log.info("Closing app...")
+    request_close(False)
 
-    window.destroy()       # Close GUI
+def init_sensors():
+    # Sensor initialization (BME680 setup and SGP30 iaq_init)
+    sensor_backend.init()
+    return True
 
-def program_init():
-    global bme680_sensor
+def load_model():
     global runner
+    global model_input_count
 
-    GPIO.cleanup()
-    
-    # Sensor initialization
-    # BME680 setup
-    # Initialize the BME680 sensor
     try:
-        bme680_sensor = bme680.BME680(bme680.I2C_ADDR_PRIMARY)
-    except (RuntimeError, IOError): # If the primary address fails, try the secondary address
-        bme680_sensor = bme680.BME680(bme680.I2C_ADDR_SECONDARY)
-
-    # Oversampling & Filter Settings... for improved accuracy and noise reduction
-    bme680_sensor.set_humidity_oversample(bme680.OS_2X)
-    bme680_sensor.set_temperature_oversample(bme680.OS_8X)
-    bme680_sensor.set_filter(bme680.FILTER_SIZE_3)
-    bme680_sensor.set_gas_status(bme680.ENABLE_GAS_MEAS)
-
-    # Print all available sensor data fields immediately after startup, even if they’re uninitialized.
-    print('\n\nInitial reading:')
-    for name in dir(bme680_sensor.data):
-        value = getattr(bme680_sensor.data, name)
-        if not name.startswith('_'):
-            print('{}: {}'.format(name, value))
-
-    # Set up the gas sensor heater
-    # The heater profile is a list of tuples (temperature, duration)
-    bme680_sensor.set_gas_heater_temperature(320)
-    bme680_sensor.set_gas_heater_duration(150)
-    bme680_sensor.select_gas_heater_profile(0)
-
-    print('Initializing SGP30 sensors...')
-    for sensor in sgp30_sensors:
-        sensor.iaq_init()
-
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setup(27, GPIO.IN, pull_up_down=GPIO.PUD_UP)  # Shutdown trigger
-    GPIO.setup(17, GPIO.IN, pull_up_down=GPIO.PUD_UP)  # Button action unassigned
-    button_thread = threading.Thread(target=button_polling_loop, daemon=True)
-    button_thread.start()
-
-    if len(args) != 1:
-        print("No model file provided. Running without Edge Impulse model.")
-        runner = None
-    else:
+        if len(args) != 1:
+            log.info("No model file provided. Running without Edge Impulse model.")
+            return
+
         model = args[0]
         dir_path = os.path.dirname(os.path.realpath(__file__))
         modelfile = os.path.join(dir_path, model)
 
         try:
-            runner = ImpulseRunner(modelfile)
-            model_info = runner.init()
-            print("Model info:")
-            print(model_info['project']['owner'] + '/' + model_info['project']['name'])
-            print(model_info['model_parameters']['input_features_count'], "features expected")
+            classifier = load_classifier(modelfile) # Spawns the model process for .eim files
+            model_info = classifier.model_info
+            model_input_count = model_info['model_parameters']['input_features_count']
+            runner = classifier
+            log.info("Model info: %s/%s, %d features expected", model_info['project']['owner'],
+                     model_info['project']['name'], model_info['model_parameters']['input_features_count'])
         except Exception as e:
-            print(f"Error loading model: {e}")
+            log.error("Error loading model: %s", e)
             runner = None
+    finally:
+        model_ready.set()
+
+async def program_init(tasks):
+    """
+    Initialize the devices. The I2C sensors, the model process and the background image do not
+    depend on each other and are prepared in parallel while the LED ring plays its animation.
+    The sensor loop is added to `tasks` as soon as the sensors are ready.
+    Returns the resized background image (None if it could not be loaded).
+    """
+    global buttons
+    loop = asyncio.get_running_loop()
+
+    gpio.cleanup()
+
+    log.info('Testing LED ring functionality with a color wipe animation.')
+    led_renderer.start()
+    led_renderer.play(color_wipe_frames(COUNT, rgb(0, 255, 0)))  # Green wipe, runs in the background
+    timeline.mark('LED animation started')
+
+    # Edge-triggered buttons, the actions run on the event loop
+    gpio.setmode(gpio.BCM)
+    buttons = ButtonHandler(gpio, loop.call_soon_threadsafe)
+    buttons.add(27, on_shutdown_button)  # Shutdown trigger
+    buttons.add(17, on_unassigned_button)  # Button action unassigned
+    timeline.mark('GPIO ready')
+
+    async def start_sensors():
+        if await loop.run_in_executor(i2c_executor, timeline.run, 'sensors', init_sensors):
+            # Start reading right away, the model and the GUI catch up when they are ready
+            tasks.append(asyncio.create_task(sensor_loop()))
+        else:
+            gui_state.publish(error=("Sensor initialization failed.", "red"))
 
-    print ('Testing LED ring functionality with a color wipe animation.')
-    colorWipe(strip, Color(0, 255, 0))  # Green wipe
-
-def button_polling_loop():
-    global shutdown
-
-    prev_state_27 = GPIO.input(27)
-    prev_state_17 = GPIO.input(17)
-
-    while not stop_event.is_set():
-        curr_state_27 = GPIO.input(27)
-        curr_state_17 = GPIO.input(17)
-
-        if prev_state_27 == GPIO.HIGH and curr_state_27 == GPIO.LOW:
-            print("GPIO 27 pressed – triggering shutdown.")
-            shutdown = True
-            window.after(1, on_closing)
-
-        if prev_state_17 == GPIO.HIGH and curr_state_17 == GPIO.LOW:
-            print("GPIO 17 pressed – button action unassigned.")
-
-        prev_state_27 = curr_state_27
-        prev_state_17 = curr_state_17
-
-        time.sleep(0.05)  # 50ms polling delay
+    screen_width = window.winfo_screenwidth()
+    screen_height = window.winfo_screenheight()
+    _, _, bg_image = await asyncio.gather(
+        start_sensors(),
+        loop.run_in_executor(model_executor, timeline.run, 'model', load_model),
+        loop.run_in_executor(None, timeline.run, 'background image', prepare_background, screen_width, screen_height),
+    )
+    return bg_image
+
+def on_shutdown_button():
+    log.info("GPIO 27 pressed – triggering shutdown.")
+    request_close(True)
+
+def on_unassigned_button():
+    log.info("GPIO 17 pressed – button action unassigned.")
+
+def main(argv=None):
+    """Run the eNose program, argv defaults to the command line (sys.argv[1:])."""
+    global args, timeline, gpio, strip, led_renderer, sensor_backend, direction_estimator, metrics_port, logging_setup
+    global frame_aligner
+
+    timeline = StartupTimeline(IMPORT_START)
+    timeline.mark('module imported', at=IMPORT_END)
+    timeline.mark('main started')
+
+    # Logging options first, so the rest of the startup is already logged
+    log_options, argv = logging_args(sys.argv[1:] if argv is None else argv)
+    logging_setup = setup_logging(**log_options)
+
+    # Heavy, hardware specific imports, only needed when the program runs
+    from grove_ws2813_rgb_led_strip import GroveWS2813RgbStrip # For Grove WS2813 RGB LED Strip control
+    from direction_estimator import DirectionEstimator # Direction of the smell from the rise of the outer sensors
+    timeline.mark('imports done')
+
+    # The remaining argument (if any) is the model file
+    sensor_backend, args = backend_from_args(argv)
+    fake_gpio = False
+    metrics_port = METRICS_PORT
+    remaining = []
+    while args:
+        arg = args.pop(0)
+        if arg == '--fake-gpio': # Test the buttons off the Pi, see buttons.FakeGPIO
+            fake_gpio = True
+        elif arg == '--metrics-port':
+            metrics_port = int(args.pop(0))
+        elif arg == '--align':
+            frame_aligner = FrameAligner()
+        else:
+            remaining.append(arg)
+    args = remaining
+    gpio = load_gpio(fake_gpio)
 
-## MAIN == start ==
-# Initialize sensors
-program_init()
+    strip = GroveWS2813RgbStrip(PIN, COUNT)
+    led_renderer = LedRenderer(strip)
+    direction_estimator = DirectionEstimator([sensor_to_led_map[i] for i in range(4)], COUNT)
 
-# Start the sensor loop in a separate thread
-sensor_thread = threading.Thread(target=sensor_loop, daemon=True)
-sensor_thread.start()
+    timeline.mark('start')
+    try:
+        power_off = asyncio.run(run())
 
-# Start the GUI (main thread)
-start_gui()
+        if power_off:
+            log.info("Shutdown button was pressed. Shutting down...")
+        else:
+            log.info("Shutdown not triggered - on_closing() called, closing app without shutdown.")
+    except BaseException:
+        log.exception("eNose program stopped with an error")
+        raise
+    finally:
+        logging_setup.write_recent(RECENT_LOG) # What led up to the exit, DEBUG included
+        log.info(logging_setup.report())
+        logging_setup.close() # Writes the queued records
+
+    if power_off:
+        subprocess.run(["sudo", "shutdown", "now"])
+
+async def run():
+    """
+    The whole app on one asyncio event loop: the sensor loop, the pipeline stages and the Tk
+    event processing are tasks, blocking I2C and model calls run on the executors.
+    Returns True if the Pi should be shut down.
+    """
+    global i2c_executor, model_executor, close_requested
+
+    loop = asyncio.get_running_loop()
+    close_requested = loop.create_future()
+    i2c_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='i2c')
+    model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model')
+
+    create_pipeline()
+    create_window()
+    tasks = [asyncio.create_task(run_tk(window, GUI_TICK_MS))] # Tk stays responsive during the init
+    tasks += [asyncio.create_task(stage.run()) for stage in pipeline_stages] # They wait for the first frames
+    tasks.append(asyncio.create_task(dump_metrics()))
+    if metrics_port:
+        tasks.append(asyncio.create_task(serve_metrics(METRICS, '127.0.0.1', metrics_port)))
 
-# Wait for the sensor thread to finish after GUI closes
-sensor_thread.join(timeout=3)  # Wait for up to 3 seconds for the thread to finish, if it doesn't, just go on
+    try:
+        bg_image = await program_init(tasks)
+        start_gui(bg_image)
+        power_off = await close_requested
+    finally:
+        # Small shutdown animation (played by the LED thread, finished before the program exits)
+        if led_renderer.is_alive():
+            led_renderer.play(color_wipe_frames(COUNT, rgb(255, 0, 0)))  # Red wipe
+        # Turn off all LEDs afterwards
+        led_renderer.set_frame([BLACK] * COUNT)
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        window.destroy() # Close GUI
+
+        # A daemon client may be waiting for a frame or reconnecting on the I2C executor, let it return
+        if hasattr(sensor_backend, 'stop'):
+            sensor_backend.stop()
+        # Runs after a read that may still be in progress, the I2C executor has only one thread
+        await loop.run_in_executor(i2c_executor, sensor_backend.close) # Saves the SGP30 baselines
+        i2c_executor.shutdown()
+        model_executor.shutdown(wait=False) # Do not wait for a hanging classification
+
+        led_renderer.stop(timeout=3) # Let the shutdown animation finish
+        log.info(led_renderer.report())
+
+        if buttons is not None:
+            buttons.close()
+            log.info(buttons.report())
+
+        if scheduler is not None:
+            log.info(scheduler.report())
+        log.info(pipeline_report(pipeline_stages))
+        if getattr(sensor_backend, 'health', None) is not None: # Only the hardware backend has circuit breakers
+            log.info(sensor_backend.health.report())
+        if frame_aligner is not None:
+            log.info(frame_aligner.report())
+        try:
+            METRICS.write_json(METRICS_FILE)
+        except OSError as e:
+            log.warning("Could not write the metrics to %s: %s", METRICS_FILE, e)
 
-if sensor_thread.is_alive():
-    print("Sensor thread didn't exit in time. Forcing exit.")
-else:
-    print("Sensor thread stopped. Exiting cleanly.")
+    return power_off
 
-if shutdown:
-    print("Shutdown flag is set. Closing app and shutting down...")
-    label3.after(0, lambda: label3.config(
-            text=f"Closing app and shutting down...",
-            foreground="red"
-        ))
-    subprocess.run(["sudo", "shutdown", "now"])
-else:
-    label3.after(0, lambda: label3.config(
-            text=f"Closing app without shutdown...",
-            foreground="red"
-        ))
-    print("Shutdown not triggered - on_closing() called, closing app without shutdown.")
 
-## MAIN == end ==
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+"""Exports the collected CSVs as Edge Impulse data acquisition files.
+
+Every label.YYYYMMDD_HHMMSS.csv becomes one sample in the Edge Impulse data acquisition
+format (JSON, or CBOR with --cbor), with the sensors in the order of the headers in
+Data_Collection/csv_data_collecting.py (enose_functions.FEATURE_NAMES) and their units.
+The files are split into training/ and testing/ per label, round(count * test ratio) of the files of
+every label are test files. A file keeps the category of its first export (stored in the manifest),
+so uploaded training data never turns into test data; only the new files of a label are split,
+ordered by their content hash, to bring the label's share back to the test ratio. They can be
+uploaded later, e.g.:
+
+    python3 edge_impulse_export.py [folder] [--out DIR] [--cbor] [--raw] [--test-ratio 0.2] [--workers N]
+    edge-impulse-uploader --category split <DIR>/training/*.json <DIR>/testing/*.json
+
+The conversion runs on a process pool. A manifest in the output folder stores the content hash
+of every exported CSV: unchanged files (same size and mtime, or same content) are not converted
+again, duplicate CSVs are exported once and outputs of deleted CSVs are removed.
+
+--raw adds the raw H2/ethanol axes (RAW_FEATURE_NAMES, in the CSVs exported from raw mode
+recordings) after the 15 features, for models that take build_raw_features() too.
+"""
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import struct
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+from enose_functions import FEATURE_NAMES, RAW_FEATURE_NAMES
+from sensor_backends import recording_label
+from dataset_loader import file_start_time
+from recorder import write_json_atomic
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Assets", "Collected_Data")
+DEFAULT_OUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Edge_Impulse_Export")
+MANIFEST_FILE = 'export_manifest.json'
+MANIFEST_VERSION = 1
+DEVICE_TYPE = 'ONENOSE'
+DEFAULT_INTERVAL_MS = 1000  # one reading per second
+
+UNITS = {'BME680_temp': 'Cel', 'BME680_humidity': '%', 'BME680_gas': 'Ohm'}
+for _name in FEATURE_NAMES[3:]:
+    UNITS[_name] = 'ppm' if _name.endswith('_CO2') else 'ppb'
+for _name in RAW_FEATURE_NAMES:
+    UNITS[_name] = 'ticks'  # SGP30 raw signal
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def test_digests(label_digests, test_ratio, known=None):
+    '''
+    Stratified split that keeps the earlier categories.
+
+    Args:
+        label_digests(dict): label -> set of the distinct content hashes of its files
+        test_ratio(float): share of test files per label
+        known(dict): (label, digest) -> 'training' or 'testing' of the files exported before
+    Returns:
+        set of the (label, digest) test files: the known test files, plus the smallest hashes of
+        the new files until the label has round(n * test_ratio) test files (as far as possible)
+    '''
+    known = known or {}
+    testing = set()
+    for label, digests in label_digests.items():
+        known_testing = [digest for digest in digests if known.get((label, digest)) == 'testing']
+        new = sorted(digest for digest in digests if (label, digest) not in known)
+        count = max(0, round(len(digests) * test_ratio) - len(known_testing))
+        testing.update((label, digest) for digest in known_testing + new[:count])
+    return testing
+
+
+def read_sample(path, names=FEATURE_NAMES):
+    """(interval in ms, rows of `names` values) of one CSV, failed readings are 0 like for the model."""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None) or []
+        rows = [row for row in reader if row]
+    columns = [header.index(name) if name in header else None for name in names]
+    values = []
+    for row in rows:
+        values.append([float(row[column]) if column is not None and row[column].strip() else 0.0
+                       for column in columns])
+
+    interval = DEFAULT_INTERVAL_MS
+    if 'timestamp' in header and len(rows) > 1:
+        times = [float(row[header.index('timestamp')]) for row in rows]
+        steps = sorted(b - a for a, b in zip(times, times[1:]))
+        interval = max(1, round(steps[len(steps) // 2]))  # median, robust to a late reading
+    return interval, values
+
+
+def sample_document(path, device_name, raw=False):
+    """The Edge Impulse data acquisition document of one CSV (unsigned, alg 'none')."""
+    names = FEATURE_NAMES + RAW_FEATURE_NAMES if raw else FEATURE_NAMES
+    interval, values = read_sample(path, names)
+    return {
+        'protected': {'ver': 'v1', 'alg': 'none', 'iat': int(file_start_time(path))},  # recording time from the name
+        'signature': '0' * 64,
+        'payload': {
+            'device_name': device_name,
+            'device_type': DEVICE_TYPE,
+            'interval_ms': interval,
+            'sensors': [{'name': name, 'units': UNITS[name]} for name in names],
+            'values': values,
+        },
+    }
+
+
+def encode_cbor(value):
+    """Minimal CBOR encoder for the types of a data acquisition document."""
+    if value is None:
+        return b'\xf6'
+    if value is True:
+        return b'\xf5'
+    if value is False:
+        return b'\xf4'
+    if isinstance(value, int):
+        return _cbor_head(0, value) if value >= 0 else _cbor_head(1, -1 - value)
+    if isinstance(value, float):
+        return b'\xfb' + struct.pack('>d', value)
+    if isinstance(value, str):
+        data = value.encode('utf-8')
+        return _cbor_head(3, len(data)) + data
+    if isinstance(value, (list, tuple)):
+        return _cbor_head(4, len(value)) + b''.join(encode_cbor(item) for item in value)
+    if isinstance(value, dict):
+        return _cbor_head(5, len(value)) + b''.join(encode_cbor(k) + encode_cbor(v) for k, v in value.items())
+    raise TypeError(f"Cannot encode {type(value).__name__} as CBOR")
+
+
+def _cbor_head(major, length):
+    if length < 24:
+        return bytes((major << 5 | length,))
+    for info, fmt in ((24, '>B'), (25, '>H'), (26, '>I'), (27, '>Q')):
+        if length < 1 << (8 * struct.calcsize(fmt)):
+            return bytes((major << 5 | info,)) + struct.pack(fmt, length)
+    raise ValueError("CBOR length too large")
+
+
+def export_file(path, out_path, device_name, cbor=False, raw=False):
+    """Convert one CSV and write it to out_path (through a temporary file). Returns the number of rows."""
+    document = sample_document(path, device_name, raw)
+    data = encode_cbor(document) if cbor else json.dumps(document, separators=(',', ':')).encode()
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, out_path)
+    return len(document['payload']['values'])
+
+
+def _export_task(task):
+    return export_file(*task)
+
+
+def _load_manifest(out_dir, settings):
+    """
+    Returns (entries that can be reused, entries whose outputs are all outdated, the category of
+    every exported (label, digest), kept unless the test ratio changed).
+    """
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}, {}, {}
+    files = manifest.get('files', {})
+    known = {}
+    if manifest.get('settings', {}).get('test_ratio') == settings['test_ratio']:
+        for entry in files.values():
+            split, name = os.path.split(entry['output'])
+            known[(recording_label(name), entry['sha256'])] = split
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('settings') != settings:
+        return {}, files, known  # other format or split, everything is exported again
+    return files, {}, known
+
+
+def export_dataset(root=DEFAULT_DATA_DIR, out_dir=DEFAULT_OUT_DIR, cbor=False, test_ratio=0.2,
+                   device_name='onenose', workers=None, raw=False):
+    '''
+    Export every CSV below `root` to <out_dir>/training and <out_dir>/testing.
+
+    Args:
+        root(str): folder that is searched recursively
+        out_dir(str): output folder, also holds the manifest
+        cbor(bool): write CBOR instead of JSON
+        test_ratio(float): share of the files of every label that goes to testing/
+        device_name(str): device_name in the payload
+        workers(int): number of processes, default one per CPU core, 1 converts in this process
+        raw(bool): also export the raw signal axes
+    Returns:
+        dict with the counts of exported, unchanged, duplicate and removed files and the wall time
+    '''
+    start = time.perf_counter()
+    extension = '.cbor' if cbor else '.json'
+    settings = {'format': extension[1:], 'test_ratio': test_ratio, 'device_name': device_name, 'raw': raw}
+    old_files, outdated, known = _load_manifest(out_dir, settings)
+    for split in ('training', 'testing'):
+        os.makedirs(os.path.join(out_dir, split), exist_ok=True)
+
+    files = sorted(glob.glob(os.path.join(root, '**', '*.csv'), recursive=True))
+    scanned = []
+    label_digests = {}
+    for path in files:
+        relative = os.path.relpath(path, root)
+        stat = os.stat(path)
+        old = old_files.get(relative)
+        if old is not None and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+            digest = old['sha256']  # not touched since the last export, skip hashing it
+        else:
+            digest = file_hash(path)
+        label = recording_label(path)
+        label_digests.setdefault(label, set()).add(digest)
+        scanned.append((path, relative, stat, old, digest, label))
+    testing_files = test_digests(label_digests, test_ratio, known)
+
+    new_files = {}
+    outputs = set()  # output paths (relative to out_dir) of this export
+    tasks = []
+    unchanged = duplicates = 0
+    for path, relative, stat, old, digest, label in scanned:
+        split = 'testing' if (label, digest) in testing_files else 'training'
+        # The label is the part of the name before the first dot (Edge Impulse reads it from there),
+        # the content hash makes the name stable and identical CSVs end up in the same file
+        output = os.path.join(split, f"{label}.{digest[:16]}{extension}")
+        new_files[relative] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest, 'output': output}
+
+        if output in outputs:
+            duplicates += 1
+        elif old is not None and old['sha256'] == digest and os.path.exists(os.path.join(out_dir, output)):
+            unchanged += 1
+        else:
+            tasks.append((path, os.path.join(out_dir, output), device_name, cbor, raw))
+        outputs.add(output)
+
+    if len(tasks) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = sum(pool.map(_export_task, tasks, chunksize=32))
+    else:
+        rows = sum(_export_task(task) for task in tasks)
+
+    # Outputs of CSVs that were deleted or changed
+    removed = 0
+    for entry in list(old_files.values()) + list(outdated.values()):
+        if entry['output'] not in outputs:
+            try:
+                os.remove(os.path.join(out_dir, entry['output']))
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+    write_json_atomic(os.path.join(out_dir, MANIFEST_FILE),
+                      {'version': MANIFEST_VERSION, 'settings': settings, 'files': new_files})
+    testing = sum(1 for output in outputs if output.startswith('testing'))
+    return {
+        'files': len(files),
+        'exported': len(tasks),
+        'rows': rows,
+        'unchanged': unchanged,
+        'duplicates': duplicates,
+        'removed': removed,
+        'training': len(outputs) - testing,
+        'testing': testing,
+        'wall_s': time.perf_counter() - start,
+    }
+
+
+def report(result):
+    return ("{files} CSV files: {exported} exported ({rows} rows), {unchanged} unchanged, {duplicates} duplicates, "
+            "{removed} old outputs removed. {training} training / {testing} testing samples, {wall_s:.2f} s").format(**result)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {}
+    positional = []
+    while args:
+        arg = args.pop(0)
+        if arg == '--out':
+            options['out_dir'] = args.pop(0)
+        elif arg == '--cbor':
+            options['cbor'] = True
+        elif arg == '--raw':
+            options['raw'] = True
+        elif arg == '--test-ratio':
+            options['test_ratio'] = float(args.pop(0))
+        elif arg == '--device-name':
+            options['device_name'] = args.pop(0)
+        elif arg == '--workers':
+            options['workers'] = int(args.pop(0))
+        else:
+            positional.append(arg)
+
+    root = positional[0] if positional else DEFAULT_DATA_DIR
+    print(report(export_dataset(root, **options)))
@@ -0,0 +1,169 @@
+"""Converts the classifier exported from Edge Impulse to the .npz weights of DenseNetworkClassifier.
+
+Takes the float32 export of the classifier block (Dashboard -> Download block output, or the
+"TensorFlow Lite (float32)" deployment): a .tflite file, or a Keras model (.h5 / SavedModel)
+with the dense layers. The labels come from the .eim of the same impulse (or --labels, in the
+order of the output layer, Edge Impulse sorts them alphabetically), --scale is the "scale axes"
+of the raw data block.
+
+    python3 edge_impulse_model.py model.tflite model.npz --eim model.eim [--scale 1]
+    python3 edge_impulse_model.py model.h5 model.npz --labels blueberry,cinnamon,empty [--scale 1]
+
+Hidden layers have to use ReLU and the last one softmax, like the default classifier of
+Edge Impulse. The int8 (quantized) export cannot be converted, its weights are not floats;
+a .eim built with the quantized model gives scores that differ by up to a few percent from
+the converted float32 weights (see Benchmarks/classifier_benchmark.py).
+"""
+import os
+import sys
+
+import numpy as np
+
+# Layers without weights that do not change the values of a dense classifier
+PASS_THROUGH_OPS = ('RESHAPE', 'SOFTMAX')
+PASS_THROUGH_LAYERS = ('InputLayer', 'Dropout', 'Flatten', 'Reshape')
+
+
+def tflite_dense_layers(interpreter):
+    '''
+    (weights, bias) of every FULLY_CONNECTED op of an allocated TFLite interpreter.
+
+    Args:
+        interpreter: tflite_runtime / tf.lite Interpreter of the float32 model
+    '''
+    if interpreter.get_input_details()[0]['dtype'] != np.float32:
+        raise ValueError("The model is quantized (int8), download the float32 model instead")
+    layers = []
+    ops = interpreter._get_ops_details()
+    # The fused ReLU of the hidden layers is not in the op details, only the softmax can be checked
+    if ops[-1]['op_name'] != 'SOFTMAX':
+        raise ValueError("The last layer has to use softmax")
+    for op in ops:
+        if op['op_name'] in PASS_THROUGH_OPS:
+            continue
+        if op['op_name'] != 'FULLY_CONNECTED':
+            raise ValueError(f"{op['op_name']} layers are not supported, only dense layers")
+        weights_index, bias_index = op['inputs'][1], op['inputs'][2]
+        weights = interpreter.get_tensor(weights_index)
+        if weights.dtype != np.float32:
+            raise ValueError("The model is quantized (int8), download the float32 model instead")
+        # TFLite stores the kernel as (units, inputs), the bias is optional
+        bias = interpreter.get_tensor(bias_index) if bias_index >= 0 else np.zeros(weights.shape[0], np.float32)
+        layers.append((weights.T, bias))
+    return layers
+
+
+def load_tflite(path):
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:  # the full TensorFlow has it too
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    interpreter = Interpreter(model_path=path)
+    interpreter.allocate_tensors()
+    return tflite_dense_layers(interpreter)
+
+
+def keras_dense_layers(model):
+    '''
+    (weights, bias) of the Dense layers of a Keras model, checks the activations.
+
+    Args:
+        model: the loaded Keras model
+    '''
+    layers = []
+    activations = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in PASS_THROUGH_LAYERS:
+            continue
+        if kind != 'Dense':
+            raise ValueError(f"{kind} layers are not supported, only dense layers")
+        weights = layer.get_weights()
+        bias = weights[1] if len(weights) > 1 else np.zeros(weights[0].shape[1], np.float32)
+        layers.append((weights[0], bias))
+        activations.append(layer.get_config()['activation'])
+    if activations and (any(a != 'relu' for a in activations[:-1]) or activations[-1] != 'softmax'):
+        raise ValueError(f"Hidden layers have to use relu and the last one softmax (got {activations})")
+    return layers
+
+
+def load_keras(path):
+    import tensorflow as tf  # only needed for Keras models
+    return keras_dense_layers(tf.keras.models.load_model(path, compile=False))
+
+
+def eim_labels(eim_path):
+    """Labels and model type ('int8', 'float32' or None) from the .eim of the same impulse."""
+    from classifier_backends import EimClassifier
+    eim = EimClassifier(os.path.abspath(eim_path))
+    try:
+        parameters = eim.model_info['model_parameters']
+        return list(parameters['labels']), parameters.get('model_type')
+    finally:
+        eim.close()
+
+
+def convert(model_path, out_path, labels, scale=None):
+    '''
+    Writes the .npz file for DenseNetworkClassifier, returns the loaded classifier.
+
+    Args:
+        model_path(str): .tflite file or Keras model exported from Edge Impulse
+        out_path(str): .npz file to write
+        labels(list): class names in the order of the output layer
+        scale(float): "scale axes" of the raw data block, None when it is 1
+    '''
+    from classifier_backends import DenseNetworkClassifier
+
+    if model_path.endswith('.tflite'):
+        layers = load_tflite(model_path)
+    else:
+        layers = load_keras(model_path)
+    if not layers:
+        raise ValueError(f"No dense layers found in {model_path}")
+
+    arrays = {'labels': np.array(labels)}
+    if scale is not None and scale != 1:
+        arrays['input_scale'] = np.float32(scale)
+    for i, (weights, bias) in enumerate(layers):
+        arrays[f'layer{i}_weights'] = np.asarray(weights, dtype=np.float32)
+        arrays[f'layer{i}_bias'] = np.asarray(bias, dtype=np.float32)
+    with open(out_path, 'wb') as f:  # np.savez would add .npz to other names
+        np.savez(f, **arrays)
+    return DenseNetworkClassifier(out_path)  # checks the layers against the labels
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    labels = None
+    eim_path = None
+    scale = None
+    positional = []
+    while args:
+        arg = args.pop(0)
+        if arg == '--labels':
+            labels = args.pop(0).split(',')
+        elif arg == '--eim':
+            eim_path = args.pop(0)
+        elif arg == '--scale':
+            scale = float(args.pop(0))
+        else:
+            positional.append(arg)
+
+    if len(positional) != 2 or (labels is None and eim_path is None):
+        print(__doc__)
+        sys.exit(1)
+
+    model_type = None
+    if labels is None:
+        labels, model_type = eim_labels(eim_path)
+    try:
+        classifier = convert(positional[0], positional[1], labels, scale)
+    except ValueError as e:
+        print(f"Could not convert {positional[0]}: {e}")
+        sys.exit(1)
+    sizes = [classifier.input_features_count] + [weights.shape[1] for weights, _ in classifier.layers]
+    print(f"{positional[1]}: dense network {' -> '.join(map(str, sizes))}, labels {', '.join(classifier.labels)}")
+    if model_type == 'int8':
+        print("The .eim uses the quantized model, its scores differ slightly from these float32 weights")
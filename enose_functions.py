@@ -1,5 +1,16 @@
 import time
-from rpi_ws281x import Color
+
+# Names of the values returned by build_features(), same order as the CSV headers
+FEATURE_NAMES = ['BME680_temp', 'BME680_humidity', 'BME680_gas']
+for _i in range(5, 11):
+    FEATURE_NAMES.append(f'SGP30_{_i}_CO2')
+    FEATURE_NAMES.append(f'SGP30_{_i}_TVOC')
+
+# Names of the values returned by build_raw_features() (raw mode), same as the recorder's raw channels
+RAW_FEATURE_NAMES = []
+for _i in range(5, 11):
+    RAW_FEATURE_NAMES.append(f'SGP30_{_i}_H2')
+    RAW_FEATURE_NAMES.append(f'SGP30_{_i}_Ethanol')
 
 def normalize(value, min_val, max_val):
     return max(0.0, min(1.0, (value - min_val) / (max_val - min_val)))
@@ -10,4 +21,55 @@ def colorWipe(strip, color, wait_ms=50):
     for i in range(strip.numPixels()):
         strip.setPixelColor(i, color)
         strip.show()
-        time.sleep(wait_ms/1000.0)
\ No newline at end of file
+        time.sleep(wait_ms/1000.0)
+
+def build_features(frame, missing=0.0):
+    """
+    Feature vector for the Edge Impulse model from a SensorFrame (15 floats, see FEATURE_NAMES):
+    BME680 temperature, humidity, gas resistance and CO2/TVOC of SGP30_5 to SGP30_10.
+    Failed readings (and an unstable gas reading) are replaced by `missing` (0.0 like the model was trained with).
+    """
+    features = []
+
+    bme680_data = frame.bme680
+    if bme680_data is not None:
+        features.append(float(bme680_data['temperature']))
+        features.append(float(bme680_data['humidity']))
+        if bme680_data['heat_stable']:
+            features.append(float(bme680_data['gas_resistance']))
+        else:
+            features.append(missing)  # Add 0.0 if gas reading not stable
+    else:
+        features.extend([missing, missing, missing])  # Add zeros if BME680 reading fails
+
+    for i in range(4, 10):  # SGP30_5 to SGP30_10 (indexes 4-9)
+        if i not in frame.errors and frame.co2[i] is not None and frame.tvoc[i] is not None:
+            features.append(float(frame.co2[i]))
+            features.append(float(frame.tvoc[i]))
+        else:
+            features.extend([missing, missing])  # Add zeros if sensor reading fails
+
+    return features
+
+def build_raw_features(frame, missing=0.0):
+    """
+    Raw H2 and ethanol signals of SGP30_5 to SGP30_10 (12 floats, see RAW_FEATURE_NAMES), appended to the
+    build_features() values for models trained on raw mode data. `missing` for sensors without a raw reading.
+    """
+    if frame.h2 is None:
+        return [missing] * len(RAW_FEATURE_NAMES)
+    features = []
+    for i in range(4, 10):
+        if frame.h2[i] is not None and frame.ethanol[i] is not None:
+            features.append(float(frame.h2[i]))
+            features.append(float(frame.ethanol[i]))
+        else:
+            features.extend([missing, missing])
+    return features
+
+def top_class(res):
+    """Label with the highest score in a classification result, None if the result has no classification."""
+    if 'result' in res and 'classification' in res['result']:
+        classifications = res['result']['classification']
+        return max(classifications, key=classifications.get)
+    return None
@@ -0,0 +1,287 @@
+"""Logging for the eNose: levels, per-message rate limits, a ring buffer and batched writes.
+
+The modules log through the standard `logging` loggers (logging.getLogger(__name__)),
+setup_logging() connects them to:
+
+- a BatchingHandler: the calling thread only puts the record on a queue, a background thread
+  formats and writes everything that piled up in one write() and one flush(), so the sensor
+  loop never waits for the console, journald or the SD card
+- a RateLimitFilter: the same message (same logger and format string) is written at most once
+  per `rate_limit` seconds, the number of suppressed copies is added to the next one
+- a RingBufferHandler: the last few hundred records, DEBUG included, kept in memory and written
+  to a file on exit, so there is detail to look at after a problem without logging it all the time
+
+The full per-cycle output (every SGP30 value, the BME680 line and the feature vector) goes to
+the CYCLE_LOGGER logger, which is only enabled with "--verbose"; callers check
+CYCLE_LOG.isEnabledFor(logging.DEBUG) before they build the text.
+
+Records can carry structured fields: log.info("Classified", extra={'fields': {'smell': smell}})
+prints "Classified smell=coffee", or a JSON object per line with "--log-json".
+"""
+import sys
+import json
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+CYCLE_LOGGER = 'enose.cycle'  # full per-cycle detail, off unless enabled
+CYCLE_LOG = logging.getLogger(CYCLE_LOGGER)
+
+TEXT_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Text lines with the record's `fields` dict appended as key=value pairs."""
+    def __init__(self, fmt=TEXT_FORMAT):
+        super(KeyValueFormatter, self).__init__(fmt)
+
+    def format(self, record):
+        text = super(KeyValueFormatter, self).format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and the record's `fields`."""
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    '''
+    Lets the same message through at most once per interval.
+
+    Messages are told apart by logger, level and format string (not the arguments), so
+    "Error reading SGP30_%d" is limited per call site. The interval is the record's
+    `rate_limit` attribute (log.warning(..., extra={'rate_limit': 30})) or `default_interval`.
+    The first record after a suppressed run gets `suppressed` added to its fields.
+
+    Args:
+        default_interval(float): seconds, 0 = no limit for records without `rate_limit`
+        clock: time source, default time.monotonic
+    '''
+    def __init__(self, default_interval=0.0, clock=time.monotonic):
+        super(RateLimitFilter, self).__init__()
+        self.default_interval = default_interval
+        self.clock = clock
+        self.suppressed_total = 0
+        self._lock = threading.Lock()
+        self._state = {}  # key -> [time of the last record that passed, suppressed since]
+
+    def filter(self, record):
+        interval = getattr(record, 'rate_limit', self.default_interval)
+        if not interval:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = self.clock()
+        with self._lock:
+            state = self._state.get(key)
+            if state is not None and now - state[0] < interval:
+                state[1] += 1
+                self.suppressed_total += 1
+                return False
+            suppressed = state[1] if state is not None else 0
+            self._state[key] = [now, 0]
+        if suppressed:
+            record.fields = dict(getattr(record, 'fields', None) or {}, suppressed=suppressed)
+        return True
+
+
+class RingBufferHandler(logging.Handler):
+    '''
+    Keeps the last `capacity` records in memory (formatted only when they are read).
+
+    Args:
+        capacity(int): number of records kept
+    '''
+    def __init__(self, capacity=500, level=logging.DEBUG):
+        super(RingBufferHandler, self).__init__(level)
+        self.records = deque(maxlen=capacity)
+        self.setFormatter(KeyValueFormatter())
+
+    def emit(self, record):
+        self.records.append(record)  # deque.append is thread safe
+
+    def recent(self, count=None):
+        """The last `count` records (all by default) as formatted lines."""
+        records = list(self.records)
+        if count is not None:
+            records = records[-count:]
+        return [self.format(record) for record in records]
+
+    def write(self, path):
+        """Write the buffered records to `path` (overwritten)."""
+        with open(path, 'w') as f:
+            f.write('\n'.join(self.recent()) + '\n')
+
+
+class BatchingHandler(logging.Handler):
+    '''
+    Writes records from a background thread, in batches.
+
+    emit() only puts the record on a bounded queue. The writer thread waits for the first
+    record, collects whatever else arrives within `flush_interval` (at most `batch_size`
+    records) and writes them with one write() and one flush(). When the queue is full the
+    record is dropped and counted instead of blocking the caller.
+
+    Args:
+        stream: text stream to write to, default sys.stderr (journald picks it up under systemd)
+        flush_interval(float): seconds a batch may wait for more records
+        batch_size(int): records per write at most
+        maxsize(int): queue length
+    '''
+    def __init__(self, stream=None, flush_interval=0.5, batch_size=256, maxsize=10000, level=logging.NOTSET):
+        super(BatchingHandler, self).__init__(level)
+        self.stream = stream if stream is not None else sys.stderr
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.batches = 0
+        self._queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                return
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    record = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        try:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+        except (OSError, ValueError):  # closed or broken stream, nothing sensible left to do
+            pass
+        self.batches += 1
+
+    def close(self):
+        """Write what is still queued and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)  # blocking, so the marker is not lost on a full queue
+            self._thread.join(timeout=5)
+        super(BatchingHandler, self).close()
+
+
+class LoggingSetup:
+    """What setup_logging() installed, so the app can read the ring buffer and shut it down."""
+    def __init__(self, writer, ring, rate_limit):
+        self.writer = writer
+        self.ring = ring
+        self.rate_limit = rate_limit
+
+    def report(self):
+        return (f"Logging: {self.writer.batches} batches written, {self.writer.dropped} records dropped, "
+                f"{self.rate_limit.suppressed_total} rate limited")
+
+    def write_recent(self, path):
+        try:
+            self.ring.write(path)
+        except OSError as e:
+            logging.getLogger(__name__).warning("Could not write the recent log to %s: %s", path, e)
+
+    def close(self):
+        root = logging.getLogger()
+        for handler in (self.writer, self.ring):
+            root.removeHandler(handler)
+            handler.close()
+
+
+def setup_logging(level='INFO', verbose=False, json_lines=False, stream=None, ring_capacity=500,
+                  default_rate_limit=0.0):
+    '''
+    Connect the root logger to a BatchingHandler (with a RateLimitFilter) and a RingBufferHandler.
+
+    Args:
+        level(str): lowest level that is written, e.g. 'INFO' or 'WARNING'
+        verbose(bool): also write the full per-cycle detail (CYCLE_LOGGER) and all DEBUG records
+        json_lines(bool): one JSON object per line instead of text
+        stream: where the records are written, default sys.stderr
+        ring_capacity(int): records kept in the ring buffer
+        default_rate_limit(float): seconds between copies of messages without their own `rate_limit`
+    Returns:
+        LoggingSetup
+    '''
+    writer = BatchingHandler(stream, level=logging.DEBUG if verbose else getattr(logging, level.upper()))
+    writer.setFormatter(JsonFormatter() if json_lines else KeyValueFormatter())
+    rate_limit = RateLimitFilter(default_rate_limit)
+    writer.addFilter(rate_limit)
+    ring = RingBufferHandler(ring_capacity)
+
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG)  # the handlers decide, the ring buffer wants the DEBUG records too
+    root.addHandler(writer)
+    root.addHandler(ring)
+    # Building the per-cycle text costs more than the rest of the logging together
+    CYCLE_LOG.setLevel(logging.DEBUG if verbose else logging.CRITICAL + 1)
+    return LoggingSetup(writer, ring, rate_limit)
+
+
+def logging_args(args):
+    """
+    Take the logging options out of the command line: `--log-level LEVEL`, `--verbose` and
+    `--log-json`. Returns (dict of setup_logging() arguments, remaining args).
+    """
+    args = list(args)
+    options = {}
+    remaining = []
+    while args:
+        arg = args.pop(0)
+        if arg == '--log-level':
+            level = args.pop(0).upper()
+            if level not in LEVELS:
+                raise ValueError(f"Unknown log level {level}, use one of {', '.join(LEVELS)}")
+            options['level'] = level
+        elif arg == '--verbose':
+            options['verbose'] = True
+        elif arg == '--log-json':
+            options['json_lines'] = True
+        else:
+            remaining.append(arg)
+    return options, remaining
@@ -0,0 +1,91 @@
+"""Time alignment of the sensor readings.
+
+The SGP30 sensors and the BME680 are read one after the other, so the readings of one frame
+are taken tens to hundreds of milliseconds apart (SensorFrame.sample_times). That does not
+matter much at 1 Hz, but with faster or asynchronous sampling the sensors at the end of the
+read order would always look "later" than the first ones, which skews the features and the
+direction estimate (a sensor that is read later sees a rising source earlier).
+
+FrameAligner resamples every channel onto the frame's grid time (SensorFrame.timestamp, the
+start of the cycle): each reading is linearly interpolated between the sensor's previous and
+current sample. Readings without sample times (replays) are used as they are. The raw H2/ethanol
+signals (raw mode) are aligned the same way, and values the backend held from an earlier cycle
+(the same sample time again) keep the result they were aligned to then.
+"""
+from sensor_backends import SensorFrame
+
+NS = 1000000000
+
+BME680_FIELDS = ('temperature', 'humidity', 'pressure', 'gas_resistance')
+
+
+def _interpolate(t, t0, v0, t1, v1):
+    if t1 == t0:
+        return v1
+    return v0 + (v1 - v0) * (t - t0) / (t1 - t0)
+
+
+class FrameAligner:
+    '''
+    Args:
+        max_gap(float): seconds, a previous sample older than this is not interpolated from
+            (e.g. after a failed read), the current reading is used as it is
+    '''
+    def __init__(self, max_gap=3.0):
+        self.max_gap_ns = int(max_gap * NS)
+        self._last = {}  # channel -> (sample time ns, values tuple, aligned values, grid time ns)
+        self.aligned = 0
+        self.max_skew_ms = 0.0  # largest distance of a sample from its grid time
+
+    def _resample(self, channel, grid_ns, sample_ns, values):
+        """(values of `channel` at grid_ns from its previous and this sample, the grid time they belong to)."""
+        previous = self._last.get(channel)
+        if previous is not None and sample_ns == previous[0]:  # held value, already aligned
+            return previous[2], previous[3]
+        self.max_skew_ms = max(self.max_skew_ms, abs(sample_ns - grid_ns) / 1e6)
+        if previous is None or sample_ns - previous[0] > self.max_gap_ns or sample_ns < previous[0]:
+            aligned = values
+        else:
+            t0, old = previous[:2]
+            aligned = tuple(None if a is None or b is None else _interpolate(grid_ns, t0, a, sample_ns, b)
+                            for a, b in zip(old, values))
+        self._last[channel] = (sample_ns, values, aligned, grid_ns)
+        return aligned, grid_ns
+
+    def _align_pairs(self, prefix, grid_ns, times, first, second, skip=()):
+        """Align two integer channels per sensor (eCO2/TVOC or H2/ethanol). Returns (first, second, times)."""
+        first = list(first)
+        second = list(second)
+        aligned_times = [grid_ns if t is not None else None for t in times]
+        for i, sample_ns in enumerate(times):
+            if sample_ns is None or i in skip or first[i] is None or second[i] is None:
+                continue
+            (a, b), aligned_times[i] = self._resample((prefix, i), grid_ns, sample_ns, (first[i], second[i]))
+            first[i] = int(round(a))  # The SGP30 reports whole numbers
+            second[i] = int(round(b))
+        return first, second, aligned_times
+
+    def align(self, frame):
+        """Return a new SensorFrame with all readings at frame.timestamp (the input is not changed)."""
+        grid_ns = int(frame.timestamp * NS)
+        co2, tvoc, sample_times = self._align_pairs('iaq', grid_ns, frame.sample_times or [None] * len(frame.co2),
+                                                    frame.co2, frame.tvoc, frame.errors)
+
+        bme680 = frame.bme680
+        bme680_time = None
+        if bme680 is not None and frame.bme680_time is not None:
+            values, bme680_time = self._resample('bme680', grid_ns, frame.bme680_time,
+                                                 tuple(bme680.get(f) for f in BME680_FIELDS))
+            bme680 = dict(bme680, **dict(zip(BME680_FIELDS, values)))
+
+        h2, ethanol, raw_times = frame.h2, frame.ethanol, frame.raw_times
+        if h2 is not None and raw_times is not None:
+            h2, ethanol, raw_times = self._align_pairs('raw', grid_ns, raw_times, h2, ethanol)
+
+        self.aligned += 1
+        return SensorFrame(frame.timestamp, co2, tvoc, bme680, dict(frame.errors), frame.label,
+                           sample_times if frame.sample_times else None, bme680_time,
+                           h2, ethanol, raw_times, frame.iaq_fresh)
+
+    def report(self):
+        return f"Alignment: {self.aligned} frames, largest sample offset from the grid {self.max_skew_ms:.1f} ms"
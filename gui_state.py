@@ -0,0 +1,85 @@
+"""Snapshot based GUI updates.
+
+The sensor side publishes what the GUI should show into a StateStore (an immutable
+GuiState that is swapped as a whole), and the Tk main thread reads the newest snapshot
+on a fixed-rate `after` tick. Only labels whose text or color changed are redrawn, so
+the Tk event queue stays empty and the GUI cost does not depend on the data rate.
+
+Instead of Tk's mainloop(), run_tk() lets an asyncio event loop drive Tk with periodic
+update() calls, so the GUI, the sensor loop and the classification share one loop.
+"""
+import asyncio
+import threading
+from collections import namedtuple
+
+# Every field is a (text, color) tuple for one label
+GuiState = namedtuple('GuiState', ['direction', 'smell', 'error'])
+
+
+class StateStore:
+    """Thread-safe holder of the latest GuiState, publish() can be called from any thread."""
+    def __init__(self, initial):
+        self._state = initial
+        self._lock = threading.Lock()
+        self.version = 0  # increased on every change
+
+    def publish(self, **changes):
+        """Replace some fields, e.g. publish(smell=("Smell: coffee", "black"))."""
+        with self._lock:
+            state = self._state._replace(**changes)
+            if state != self._state:
+                self._state = state
+                self.version += 1
+
+    def snapshot(self):
+        """Return (version, state), the state is immutable and safe to keep."""
+        with self._lock:
+            return self.version, self._state
+
+
+class SnapshotRenderer:
+    '''
+    Redraws Tk labels from a StateStore on the Tk main thread.
+
+    Args:
+        window: the Tk root (used for `after`)
+        store(StateStore): where the state comes from
+        labels(dict): GuiState field name -> tk.Label
+        interval_ms(int): refresh period
+    '''
+    def __init__(self, window, store, labels, interval_ms=100):
+        self.window = window
+        self.store = store
+        self.labels = labels
+        self.interval_ms = interval_ms
+        self._drawn_version = None
+        self._drawn = {}  # field -> (text, color) currently shown
+        self.redraws = 0
+
+    def start(self):
+        self._tick()
+
+    def _tick(self):
+        version, state = self.store.snapshot()
+        if version != self._drawn_version:
+            for field, label in self.labels.items():
+                value = getattr(state, field)
+                if self._drawn.get(field) != value:
+                    text, color = value
+                    label.config(text=text, foreground=color)
+                    self._drawn[field] = value
+                    self.redraws += 1
+            self._drawn_version = version
+        self.window.after(self.interval_ms, self._tick)
+
+
+async def run_tk(window, interval_ms=20):
+    """Process the Tk events every `interval_ms` until the window is destroyed (or the task is cancelled)."""
+    import tkinter as tk
+
+    while True:
+        try:
+            window.update()
+        except tk.TclError:  # the window was destroyed
+            return
+        await asyncio.sleep(interval_ms / 1000.0)
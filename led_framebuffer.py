@@ -0,0 +1,195 @@
+"""Framebuffer and animation thread for the WS2813 LED ring.
+
+Writing the strip directly costs a full DMA push per show() call, and the old loop did two
+of them every cycle (all black, then the highlight), which flickers even when nothing
+changed. LedRenderer keeps the last pushed frame, only calls show() when the new frame is
+different (and at most max_fps times per second), and plays animations as frame
+generators on its own thread so callers never block on time.sleep().
+
+Frames are lists with one color per pixel, colors are the 24 bit ints used by
+rpi_ws281x.Color, see rgb().
+"""
+import time
+import threading
+from collections import deque
+
+from metrics import METRICS
+
+LED_SHOW_SECONDS = METRICS.histogram('enose_led_show_seconds', 'Time of one strip.show() push')
+
+
+def rgb(red, green, blue):
+    """Same encoding as rpi_ws281x.Color (without needing the hardware library)."""
+    return (red << 16) | (green << 8) | blue
+
+
+BLACK = rgb(0, 0, 0)
+
+
+class LedRenderer(threading.Thread):
+    '''
+    Render thread that owns the LED strip.
+
+    The strip shows the "base" frame (set_frame) whenever no animation is playing.
+    Animations (play) are queued and played one after the other.
+
+    Args:
+        strip: a started GroveWS2813RgbStrip / PixelStrip (anything with numPixels, setPixelColor and show)
+        max_fps(int): upper limit for strip.show() calls per second
+    '''
+    def __init__(self, strip, max_fps=30):
+        super(LedRenderer, self).__init__(name='leds', daemon=True)
+        self.strip = strip
+        self.count = strip.numPixels()
+        self.min_interval = 1.0 / max_fps
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._animations = deque()
+        self._base = None  # None = keep whatever is shown right now
+
+        self._pushed = None      # frame currently on the strip
+        self._last_push = 0.0
+        self.pushes = 0          # strip.show() calls
+        self.unchanged = 0       # frames that were skipped because they were already shown
+
+    def set_frame(self, pixels):
+        """Set the static frame (e.g. the direction highlight), never blocks."""
+        with self._lock:
+            self._base = list(pixels)
+        self._wake.set()
+
+    def play(self, frames):
+        """Queue an animation, `frames` yields (pixels, wait_ms) tuples. Never blocks."""
+        with self._lock:
+            self._animations.append(iter(frames))
+        self._wake.set()
+
+    def busy(self):
+        """True while animations are playing or queued."""
+        with self._lock:
+            return bool(self._animations)
+
+    def stop(self, timeout=None):
+        """Let the queued animations finish, show the base frame and end the thread."""
+        with self._lock:
+            self._stopping = True
+        self._wake.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        while True:
+            with self._lock:
+                animation = self._animations[0] if self._animations else None
+                base = self._base
+                stopping = self._stopping
+
+            if animation is not None:
+                frame = next(animation, None)
+                if frame is None:  # animation finished
+                    with self._lock:
+                        self._animations.popleft()
+                    continue
+                pixels, wait_ms = frame
+                self._show(pixels)
+                time.sleep(wait_ms / 1000.0)
+                continue
+
+            if base is not None:
+                self._show(base)
+            if stopping:
+                break
+
+            self._wake.wait()
+            self._wake.clear()
+
+    def _show(self, pixels):
+        if pixels == self._pushed:
+            self.unchanged += 1
+            return
+
+        # Cap the push rate, the newest frame is shown once the interval has passed
+        delay = self._last_push + self.min_interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        for i, color in enumerate(pixels):
+            if self._pushed is None or self._pushed[i] != color:
+                self.strip.setPixelColor(i, color)
+        with LED_SHOW_SECONDS.time():
+            self.strip.show()
+        self._pushed = list(pixels)
+        self._last_push = time.monotonic()
+        self.pushes += 1
+
+    def report(self):
+        return f"LEDs: {self.pushes} pushes, {self.unchanged} unchanged frames skipped"
+
+
+def single_pixel_frame(count, index, color, background=BLACK):
+    """Frame with one lit pixel (index None = all background)."""
+    pixels = [background] * count
+    if index is not None:
+        pixels[index] = color
+    return pixels
+
+
+def bearing_frame(count, position, red, green, blue, intensity=1.0, background=BLACK):
+    """
+    Frame for a fractional LED position: the light is split between the two nearest LEDs,
+    so a direction between two LEDs is shown between them.
+    """
+    pixels = [background] * count
+    first = int(position) % count
+    fraction = position - int(position)
+    for index, share in ((first, 1.0 - fraction), ((first + 1) % count, fraction)):
+        level = share * intensity
+        if level > 0.02:
+            pixels[index] = rgb(int(red * level), int(green * level), int(blue * level))
+    return pixels
+
+
+# Frame generators of the animations in grove_ws2813_rgb_led_strip.py
+
+def color_wipe_frames(count, color, wait_ms=50, start=None):
+    """Wipe color across display a pixel at a time."""
+    pixels = list(start) if start is not None else [BLACK] * count
+    for i in range(count):
+        pixels[i] = color
+        yield list(pixels), wait_ms
+
+
+def theater_chase_frames(count, color, wait_ms=50, iterations=10):
+    """Movie theater light style chaser animation."""
+    for j in range(iterations):
+        for q in range(3):
+            pixels = [BLACK] * count
+            for i in range(q, count, 3):
+                pixels[i] = color
+            yield pixels, wait_ms
+
+
+def wheel(pos):
+    """Generate rainbow colors across 0-255 positions."""
+    if pos < 85:
+        return rgb(pos * 3, 255 - pos * 3, 0)
+    elif pos < 170:
+        pos -= 85
+        return rgb(255 - pos * 3, 0, pos * 3)
+    else:
+        pos -= 170
+        return rgb(0, pos * 3, 255 - pos * 3)
+
+
+def rainbow_frames(count, wait_ms=20, iterations=1):
+    """Draw rainbow that fades across all pixels at once."""
+    for j in range(256 * iterations):
+        yield [wheel((i + j) & 255) for i in range(count)], wait_ms
+
+
+def rainbow_cycle_frames(count, wait_ms=20, iterations=5):
+    """Draw rainbow that uniformly distributes itself across all pixels."""
+    for j in range(256 * iterations):
+        yield [wheel((int(i * 256 / count) + j) & 255) for i in range(count)], wait_ms
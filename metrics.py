@@ -0,0 +1,228 @@
+"""Runtime metrics: counters, gauges and latency histograms.
+
+The modules record into the shared registry METRICS (e.g. the SGP30 read latency per mux
+channel in sensor_backends.py), which can be exported as Prometheus text or as JSON:
+
+    curl http://127.0.0.1:9108/metrics        # Prometheus text format
+    curl http://127.0.0.1:9108/metrics.json   # same values as JSON
+
+serve_metrics() is the HTTP endpoint as an asyncio task (no extra thread), write_json()
+dumps the registry to a file. Recording a value is a dict lookup, a bisect and a few
+additions under a lock (about a microsecond), so a few dozen observations per 1 s cycle
+stay far below 1 % of the cycle budget.
+"""
+import time
+import asyncio
+import logging
+import threading
+from bisect import bisect_left
+
+log = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from a fast I2C transfer to a slow model call
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # label values tuple -> value
+
+    def _label_text(self, labels, extra=None):
+        pairs = list(zip(self.labelnames, labels))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name + self._label_text(labels), value) for labels, value in self._values.items()]
+
+    def to_dict(self):
+        with self._lock:
+            return {','.join(map(str, labels)): value for labels, value in self._values.items()}
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, labels=()):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    '''
+    Latency histogram with fixed buckets (cumulative in the Prometheus output).
+
+    Args:
+        buckets(tuple): upper bounds in seconds, sorted
+    '''
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0, 0.0]  # bucket counts, count, sum
+            entry[0][index] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    def time(self, labels=()):
+        """Context manager that observes the duration of the with block."""
+        return _Timer(self, labels)
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            values = [(labels, list(counts), count, total) for labels, (counts, count, total) in self._values.items()]
+        for labels, counts, count, total in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append((self.name + '_bucket' + self._label_text(labels, ('le', le)), cumulative))
+            lines.append((self.name + '_count' + self._label_text(labels), count))
+            lines.append((self.name + '_sum' + self._label_text(labels), total))
+        return lines
+
+    def to_dict(self):
+        with self._lock:
+            return {','.join(map(str, labels)): {
+                'count': count,
+                'sum': total,
+                'buckets': dict(zip([str(b) for b in self.buckets] + ['inf'], counts)),
+            } for labels, (counts, count, total) in self._values.items()}
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """All metrics of the process, plus collectors that refresh gauges right before an export."""
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:  # e.g. a module imported twice, keep the first one
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._add(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def add_collector(self, func):
+        """func() is called before every export, e.g. to copy the scheduler statistics into gauges."""
+        self.collectors.append(func)
+
+    def _collect(self):
+        for func in self.collectors:
+            try:
+                func()
+            except Exception as e:
+                log.warning("Metrics collector failed: %s", e, extra={'rate_limit': 60})
+
+    def render_prometheus(self):
+        self._collect()
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, value in metric.samples():
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        self._collect()
+        return {'time': time.time(), 'metrics': {metric.name: metric.to_dict() for metric in list(self.metrics.values())}}
+
+    def write_json(self, path):
+        from recorder import write_json_atomic  # imported here, recorder.py needs NumPy
+
+        write_json_atomic(path, self.to_dict())
+
+
+METRICS = MetricsRegistry()
+
+
+async def serve_metrics(registry=METRICS, host='127.0.0.1', port=9108):
+    """
+    Minimal HTTP endpoint on the running event loop: GET /metrics (Prometheus text) and
+    GET /metrics.json. Runs until the task is cancelled, returns right away (with an error
+    logged) if the port can not be opened.
+    """
+    import json
+
+    async def handle(reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):  # skip the headers
+                pass
+            parts = request.decode('latin-1').split()
+            path = parts[1] if len(parts) > 1 else '/'
+            if path == '/metrics':
+                status, content_type, body = '200 OK', 'text/plain; version=0.0.4', registry.render_prometheus()
+            elif path == '/metrics.json':
+                status, content_type, body = '200 OK', 'application/json', json.dumps(registry.to_dict())
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain', 'Try /metrics or /metrics.json\n'
+            data = body.encode()
+            writer.write((f'HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\n'
+                          f'Content-Length: {len(data)}\r\nConnection: close\r\n\r\n').encode() + data)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    try:
+        server = await asyncio.start_server(handle, host, port)
+    except OSError as e:  # e.g. the port is taken, the program runs on without the endpoint
+        log.error("Could not serve the metrics on %s:%d: %s", host, port, e)
+        return
+    log.info("Metrics on http://%s:%d/metrics", host, port)
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,128 @@
+"""Small asyncio pipeline used to split the sensor loop into stages.
+
+Every stage is a task on the event loop and takes its work from a bounded AsyncDropOldestQueue.
+When a stage falls behind, the oldest waiting item is thrown away instead of blocking the
+producer, so sensor acquisition never has to wait for classification or the LEDs/GUI.
+Blocking work is moved to executors by the stage function itself (see eNose_Program.py).
+Queues and stages count depth, drops and latencies so slow stages are easy to spot.
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+
+class AsyncDropOldestQueue:
+    '''
+    Bounded FIFO queue that drops the oldest item instead of blocking when full.
+    put() and get_async() have to be called on the event loop thread.
+
+    Args:
+        maxsize(int): maximum number of waiting items
+        name(str): used in the statistics
+    '''
+    def __init__(self, maxsize=1, name='queue'):
+        self.maxsize = maxsize
+        self.name = name
+        self._items = deque()
+        self._ready = asyncio.Event()
+
+        self.put_count = 0
+        self.dropped = 0    # items thrown away because the consumer was too slow
+        self.max_depth = 0
+
+    def put(self, item):
+        """Add an item, never blocks."""
+        if len(self._items) >= self.maxsize:
+            self._items.popleft()
+            self.dropped += 1
+        self._items.append((time.monotonic(), item))
+        self.put_count += 1
+        self.max_depth = max(self.max_depth, len(self._items))
+        self._ready.set()
+
+    async def get_async(self):
+        """Return (time the item was put, item), waits until there is one."""
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._items.popleft()
+
+    def depth(self):
+        return len(self._items)
+
+    def stats(self):
+        return {
+            'depth': self.depth(),
+            'max_depth': self.max_depth,
+            'put': self.put_count,
+            'dropped': self.dropped,
+        }
+
+
+class AsyncStage:
+    '''
+    run() is a coroutine that calls `func(item)` for every item taken from `inbox` until the
+    task is cancelled. `func` may be a plain function (runs on the event loop, keep it short)
+    or a coroutine function. It passes its results on by putting them into the next queue
+    itself. Exceptions are logged and counted, they do not stop the stage.
+
+    Args:
+        name(str): stage name
+        func: called with every item
+        inbox(AsyncDropOldestQueue): where the items come from
+        window(int): number of recent items the latency statistics are taken over
+    '''
+    def __init__(self, name, func, inbox, window=100):
+        self.name = name
+        self.func = func
+        self.inbox = inbox
+        self.processed = 0
+        self.errors = 0
+        self.recent_wait = deque(maxlen=window)     # seconds an item waited in the inbox
+        self.recent_service = deque(maxlen=window)  # seconds spent in func
+
+    async def run(self):
+        while True:
+            put_time, item = await self.inbox.get_async()
+
+            start = time.monotonic()
+            try:
+                result = self.func(item)
+                if asyncio.iscoroutine(result):
+                    await result
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                log.warning("Error in pipeline stage '%s': %s", self.name, e, extra={'rate_limit': 10})
+            self._record(put_time, start, time.monotonic())
+
+    def _record(self, put_time, start, end):
+        self.processed += 1
+        self.recent_wait.append(start - put_time)
+        self.recent_service.append(end - start)
+
+    def stats(self):
+        """Queue and latency counters of this stage (times in milliseconds)."""
+        stats = {'processed': self.processed, 'errors': self.errors}
+        stats.update({'queue_' + key: value for key, value in self.inbox.stats().items()})
+        for key, values in (('wait', self.recent_wait), ('service', self.recent_service)):
+            values = list(values)
+            stats[key + '_mean_ms'] = sum(values) / len(values) * 1000 if values else 0.0
+            stats[key + '_max_ms'] = max(values) * 1000 if values else 0.0
+        return stats
+
+
+def pipeline_report(stages):
+    """One line per stage for the console."""
+    lines = []
+    for stage in stages:
+        s = stage.stats()
+        lines.append(('Stage {name}: {processed} done, {errors} errors, queue {queue_depth}/{maxsize} '
+                      '(max {queue_max_depth}, {queue_dropped} dropped), wait {wait_mean_ms:.1f}/{wait_max_ms:.1f} ms, '
+                      'service {service_mean_ms:.1f}/{service_max_ms:.1f} ms (mean/max)').format(
+                          name=stage.name, maxsize=stage.inbox.maxsize, **s))
+    return '\n'.join(lines)
@@ -0,0 +1,321 @@
+"""Append-only binary recorder for sensor data.
+
+Instead of a new CSV file every 10 rows, every reading is appended as one fixed-width
+record (time + 16 float channels) to a preallocated, memory-mapped segment file. A small
+index.json next to the segments stores how many records each segment holds and where the
+labels change (the segment markers). Reading hours of data back is a zero-copy numpy.memmap,
+and fixed-length windows can be cut from the continuous stream and exported in the old CSV
+format on demand:
+
+    python3 recorder.py <recording folder> <csv output folder> [rows per file] [--step N] [--skip N]
+
+`--step` is the distance between the window starts (default: rows per file, no overlap), `--skip`
+leaves out the first readings after every label change, while the sensors still settle.
+
+Missing readings are stored as NaN. Recordings in raw mode also store the raw H2/ethanol signals
+(RAW_CHANNELS) and have one record per raw cycle, e.g. 4 per second, which the window lengths count in.
+"""
+import os
+import sys
+import csv
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+
+# Same names as the CSV headers in Data_Collection/csv_data_collecting.py (plus the pressure of the older recordings)
+CHANNELS = ['BME680_temp', 'BME680_pressure', 'BME680_humidity', 'BME680_gas']
+for _i in range(5, 11):
+    CHANNELS.append(f'SGP30_{_i}_CO2')
+    CHANNELS.append(f'SGP30_{_i}_TVOC')
+
+# Raw signals of SGP30_5 to SGP30_10 (raw mode, see sensor_backends.py), same names as enose_functions.RAW_FEATURE_NAMES
+RAW_CHANNELS = []
+for _i in range(5, 11):
+    RAW_CHANNELS.append(f'SGP30_{_i}_H2')
+    RAW_CHANNELS.append(f'SGP30_{_i}_Ethanol')
+
+
+def record_dtype(channels):
+    return np.dtype([('time', '<f8')] + [(name, '<f4') for name in channels])  # time = unix time in seconds
+
+
+RECORD_DTYPE = record_dtype(CHANNELS)
+
+INDEX_FILE = 'index.json'
+INDEX_VERSION = 1
+SEGMENT_RECORDS = 3600  # records per segment file, one hour at 1 Hz (~250 kB)
+
+
+def write_json_atomic(path, data):
+    """Write JSON so that readers (and power cuts) only ever see the old or the new file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def frame_values(frame):
+    """Channel values of a SensorFrame as a dict (NaN for missing readings)."""
+    values = dict.fromkeys(CHANNELS, np.nan)
+    bme680 = frame.bme680
+    if bme680 is not None:
+        values['BME680_temp'] = bme680['temperature']
+        values['BME680_humidity'] = bme680['humidity']
+        if bme680.get('pressure') is not None:
+            values['BME680_pressure'] = bme680['pressure']
+        if bme680['heat_stable']:
+            values['BME680_gas'] = bme680['gas_resistance']
+    for i in range(4, 10):  # SGP30_5 to SGP30_10
+        if frame.co2[i] is not None and frame.tvoc[i] is not None:
+            values[f'SGP30_{i+1}_CO2'] = frame.co2[i]
+            values[f'SGP30_{i+1}_TVOC'] = frame.tvoc[i]
+    if frame.h2 is not None:
+        for i in range(4, 10):
+            if frame.h2[i] is not None and frame.ethanol[i] is not None:
+                values[f'SGP30_{i+1}_H2'] = frame.h2[i]
+                values[f'SGP30_{i+1}_Ethanol'] = frame.ethanol[i]
+    return values
+
+
+class Recorder:
+    '''
+    Appends records to the segment files of one recording folder.
+
+    An existing recording is continued, a new one is created otherwise.
+
+    Args:
+        path(str): recording folder
+        segment_records(int): capacity of a segment file, a new segment is started when it is full
+        flush_every(int): records between flushes of the memory map and the index
+        channels(list): channels of a new recording, CHANNELS + RAW_CHANNELS for raw mode
+    '''
+    def __init__(self, path, segment_records=SEGMENT_RECORDS, flush_every=10, channels=CHANNELS):
+        self.path = path
+        self.channels = list(channels)
+        self.dtype = record_dtype(self.channels)
+        self.segment_records = segment_records
+        self.flush_every = flush_every
+        os.makedirs(path, exist_ok=True)
+
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.index = json.load(f)
+            if self.index['channels'] != self.channels:
+                raise ValueError(f"Recording in {path} has different channels, use a new folder")
+        else:
+            self.index = {
+                'version': INDEX_VERSION,
+                'channels': self.channels,
+                'record_size': self.dtype.itemsize,
+                'segments': [],  # {'file', 'records', 'capacity'}
+                'labels': [],    # {'label', 'record', 'time'}: label is valid from this record number on
+            }
+
+        self._segment = None
+        self._unflushed = 0
+        if self.index['segments'] and self.index['segments'][-1]['records'] < self.index['segments'][-1]['capacity']:
+            self._open_segment(self.index['segments'][-1])
+
+    @property
+    def total_records(self):
+        return sum(segment['records'] for segment in self.index['segments'])
+
+    def _open_segment(self, segment):
+        self._segment_info = segment
+        self._segment = np.memmap(os.path.join(self.path, segment['file']), dtype=self.dtype,
+                                  mode='r+', shape=(segment['capacity'],))
+
+    def _new_segment(self):
+        if self._segment is not None:
+            self._segment.flush()
+        segment = {'file': 'segment_{:05d}.bin'.format(len(self.index['segments'])),
+                   'records': 0, 'capacity': self.segment_records}
+        filename = os.path.join(self.path, segment['file'])
+
+        # Preallocate the whole segment up front, so appending never grows the file on the SD card
+        with open(filename, 'wb') as f:
+            size = self.segment_records * self.dtype.itemsize
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(f.fileno(), 0, size)
+            else:
+                f.truncate(size)
+
+        self.index['segments'].append(segment)
+        self._open_segment(segment)
+        self._write_index()
+
+    def set_label(self, label, timestamp=None):
+        """All following records belong to `label` (None: unlabelled, e.g. while changing the sample)."""
+        self.index['labels'].append({
+            'label': label,
+            'record': self.total_records,
+            'time': timestamp if timestamp is not None else time.time(),
+        })
+        self._write_index()
+
+    def append(self, values, timestamp=None):
+        """Append one record, `values` maps channel names to numbers (missing channels are NaN)."""
+        if self._segment is None or self._segment_info['records'] >= self._segment_info['capacity']:
+            self._new_segment()
+
+        record = [timestamp if timestamp is not None else time.time()]
+        for name in self.channels:
+            value = values.get(name)
+            record.append(np.nan if value is None else value)
+        self._segment[self._segment_info['records']] = tuple(record)
+        self._segment_info['records'] += 1
+
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.flush()
+
+    def append_frame(self, frame, timestamp=None):
+        self.append(frame_values(frame), timestamp)
+
+    def flush(self):
+        """Write the mapped pages and the record counts to disk."""
+        if self._segment is not None:
+            self._segment.flush()
+        self._write_index()
+        self._unflushed = 0
+
+    def _write_index(self):
+        write_json_atomic(os.path.join(self.path, INDEX_FILE), self.index)
+
+    def close(self):
+        self.flush()
+        self._segment = None
+
+
+class Recording:
+    """Read access to a recording folder written by Recorder."""
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self.channels = self.index['channels']
+        self.dtype = record_dtype(self.channels)
+
+    def segments(self):
+        """Read-only memmaps of the segments, trimmed to the written records (no copies)."""
+        arrays = []
+        for segment in self.index['segments']:
+            if segment['records'] == 0:
+                continue
+            data = np.memmap(os.path.join(self.path, segment['file']), dtype=self.dtype,
+                             mode='r', shape=(segment['capacity'],))
+            arrays.append(data[:segment['records']])
+        return arrays
+
+    def records(self):
+        """All records as one array (copies if there is more than one segment)."""
+        arrays = self.segments()
+        if not arrays:
+            return np.zeros(0, dtype=self.dtype)
+        return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+
+    def label_ranges(self):
+        """List of (label, first record, end record) for the labelled parts of the recording."""
+        total = sum(segment['records'] for segment in self.index['segments'])
+        labels = self.index['labels']
+        ranges = []
+        for i, entry in enumerate(labels):
+            end = labels[i + 1]['record'] if i + 1 < len(labels) else total
+            if entry['label'] is not None and end > entry['record']:
+                ranges.append((entry['label'], entry['record'], end))
+        return ranges
+
+    def windows(self, length, step=None, skip=0, partial=False):
+        '''
+        Fixed-length windows cut from the labelled parts, a window never spans a label change.
+
+        Args:
+            length(int): records per window
+            step(int): records between two window starts, default `length` (no overlap)
+            skip(int): records left out after every label change
+            partial(bool): also return the shorter last window of a labelled part
+        Returns:
+            list of (label, first record, end record)
+        '''
+        step = step or length
+        windows = []
+        for label, start, end in self.label_ranges():
+            for window_start in range(start + skip, end, step):
+                window_end = min(window_start + length, end)
+                if window_end - window_start == length or partial:
+                    windows.append((label, window_start, window_end))
+        return windows
+
+    def export_csv(self, out_dir, rows_per_file=10, include_pressure=False, step=None, skip=0):
+        """
+        Write the windows of the recording (see windows()) as label.YYYYMMDD_HHMMSS.csv files in
+        the format of csv_data_collecting.py. Windows that start in the same second as another one
+        (raw mode, or a short `step`) get the milliseconds too: label.YYYYMMDD_HHMMSS_mmm.csv.
+        Files already in `out_dir` are never overwritten: FileExistsError (before anything is
+        written) if a name is taken. Without `step` the last, shorter window of
+        every label is written too (like the collector did), with `step` only complete windows.
+        Returns the list of written files.
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        channels = [channel for channel in self.channels if include_pressure or channel != 'BME680_pressure']
+        records = self.records()
+        written = []
+
+        # All names first, so a conflict stops the export before anything is written
+        planned = []
+        names = set()
+        existing = set(os.listdir(out_dir))
+        for label, start, end in self.windows(rows_per_file, step, skip, partial=step is None):
+            start_time = datetime.fromtimestamp(float(records['time'][start]))
+            name = f"{label}.{start_time.strftime('%Y%m%d_%H%M%S')}.csv"
+            if name in names:  # another window of this export started in the same second
+                name = f"{label}.{start_time.strftime('%Y%m%d_%H%M%S')}_{start_time.microsecond // 1000:03d}.csv"
+            if name in names or name in existing:
+                raise FileExistsError(f"{os.path.join(out_dir, name)} exists, export to an empty folder")
+            names.add(name)
+            planned.append((os.path.join(out_dir, name), start, end))
+
+        for filename, start, end in planned:
+            chunk = records[start:end]
+            file_start = float(chunk['time'][0])
+            with open(filename, mode='x', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['timestamp'] + channels)
+                for record in chunk:
+                    row = [round((float(record['time']) - file_start) * 1000)]
+                    for channel in channels:
+                        value = float(record[channel])
+                        if np.isnan(value):
+                            row.append(None)
+                        elif channel.startswith('SGP30'):
+                            row.append(int(value))
+                        else:
+                            row.append(round(value, 2))
+                    writer.writerow(row)
+            written.append(filename)
+        return written
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    options = {}
+    for option in ('--step', '--skip'):
+        if option in argv:
+            index = argv.index(option)
+            options[option[2:]] = int(argv[index + 1])
+            del argv[index:index + 2]
+    if len(argv) < 2:
+        print("Usage: python3 recorder.py <recording folder> <csv output folder> [rows per file] [--step N] [--skip N]")
+        sys.exit(1)
+    rows = int(argv[2]) if len(argv) > 2 else 10
+    try:
+        files = Recording(argv[0]).export_csv(argv[1], rows_per_file=rows, **options)
+    except FileExistsError as e:
+        print(e)
+        sys.exit(1)
+    print(f"Exported {len(files)} CSV files to {argv[1]}")
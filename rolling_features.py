@@ -0,0 +1,162 @@
+"""Streaming window features for the classifier.
+
+Every channel keeps its last `window` samples in a ring buffer together with running sums,
+so mean, variance, slope, min/max and an EWMA are updated in O(1) per sample (min/max are
+amortized O(1) with monotonic queues) instead of re-scanning the history every cycle.
+
+RollingFeatureEngine produces two kinds of model inputs:
+- timeseries_window(): the raw window, sample by sample with all channels interleaved,
+  the layout of an Edge Impulse time-series impulse (window = window size / interval)
+- summary_features(): mean, std, slope, min, max and EWMA of every channel
+"""
+import math
+from collections import deque
+
+SUMMARY_NAMES = ['mean', 'std', 'slope', 'min', 'max', 'ewma']
+
+
+class RollingChannel:
+    '''
+    Rolling statistics of one channel over the last `window` samples.
+
+    Args:
+        window(int): number of samples in the window
+        alpha(float): EWMA smoothing factor (0-1, higher reacts faster)
+        recompute_every(int): the running sums are recomputed from the buffer every this many
+            samples to stop floating point errors from building up (amortized O(1))
+    '''
+    def __init__(self, window, alpha=0.3, recompute_every=1000):
+        self.window = window
+        self.alpha = alpha
+        self.recompute_every = recompute_every
+
+        self.buffer = [0.0] * window  # ring buffer
+        self.start = 0                # position of the oldest sample
+        self.count = 0
+        self.total = 0
+        self.sum = 0.0                # sum of x
+        self.sum_sq = 0.0             # sum of x^2
+        self.sum_ix = 0.0             # sum of i * x, i = 0 for the oldest sample in the window
+        self.ewma = None
+        self._min = deque()           # (sample number, value), increasing values
+        self._max = deque()           # (sample number, value), decreasing values
+
+    def push(self, x):
+        n = self.window
+        if self.count == n:
+            oldest = self.buffer[self.start]
+            # Dropping the oldest sample shifts every other index down by one
+            self.sum_ix -= self.sum - oldest
+            self.sum -= oldest
+            self.sum_sq -= oldest * oldest
+            self.buffer[self.start] = x
+            self.start = (self.start + 1) % n
+            self.sum_ix += (n - 1) * x
+        else:
+            self.buffer[(self.start + self.count) % n] = x
+            self.sum_ix += self.count * x
+            self.count += 1
+        self.sum += x
+        self.sum_sq += x * x
+        self.ewma = x if self.ewma is None else self.ewma + self.alpha * (x - self.ewma)
+
+        # Monotonic queues for the window min/max
+        number = self.total
+        while self._min and self._min[-1][1] >= x:
+            self._min.pop()
+        self._min.append((number, x))
+        while self._max and self._max[-1][1] <= x:
+            self._max.pop()
+        self._max.append((number, x))
+        first_in_window = number - self.count + 1
+        if self._min[0][0] < first_in_window:
+            self._min.popleft()
+        if self._max[0][0] < first_in_window:
+            self._max.popleft()
+
+        self.total += 1
+        if self.total % self.recompute_every == 0:
+            self._recompute()
+
+    def _recompute(self):
+        values = self.values()
+        self.sum = sum(values)
+        self.sum_sq = sum(v * v for v in values)
+        self.sum_ix = sum(i * v for i, v in enumerate(values))
+
+    def values(self):
+        """Samples in the window, oldest first (O(window), only for output)."""
+        return [self.buffer[(self.start + i) % self.window] for i in range(self.count)]
+
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def variance(self):
+        if not self.count:
+            return 0.0
+        mean = self.sum / self.count
+        return max(0.0, self.sum_sq / self.count - mean * mean)
+
+    def slope(self):
+        """Least squares slope per sample over the window."""
+        n = self.count
+        if n < 2:
+            return 0.0
+        sum_i = n * (n - 1) / 2.0
+        sum_ii = (n - 1) * n * (2 * n - 1) / 6.0
+        return (n * self.sum_ix - sum_i * self.sum) / (n * sum_ii - sum_i * sum_i)
+
+    def minimum(self):
+        return self._min[0][1] if self._min else 0.0
+
+    def maximum(self):
+        return self._max[0][1] if self._max else 0.0
+
+    def summary(self):
+        """[mean, std, slope, min, max, ewma], see SUMMARY_NAMES."""
+        return [self.mean(), math.sqrt(self.variance()), self.slope(),
+                self.minimum(), self.maximum(), self.ewma if self.ewma is not None else 0.0]
+
+
+class RollingFeatureEngine:
+    '''
+    Rolling statistics for a fixed list of channels (e.g. the 15 model features).
+
+    Missing values (None or NaN) repeat the last valid value of that channel, so the
+    windows always stay complete and evenly spaced.
+
+    Args:
+        channel_names(list): names of the channels, in the order of push()
+        window(int): samples per window
+        alpha(float): EWMA smoothing factor
+    '''
+    def __init__(self, channel_names, window=10, alpha=0.3):
+        self.channel_names = list(channel_names)
+        self.window = window
+        self.channels = [RollingChannel(window, alpha) for _ in self.channel_names]
+        self.missing = [0] * len(self.channel_names)  # number of held values per channel
+
+    def push(self, values):
+        for i, (channel, value) in enumerate(zip(self.channels, values)):
+            if value is None or value != value:  # None or NaN
+                self.missing[i] += 1
+                value = channel.buffer[(channel.start + channel.count - 1) % self.window] if channel.count else 0.0
+            channel.push(float(value))
+
+    def ready(self):
+        """True once a full window has been collected."""
+        return self.channels[0].count == self.window
+
+    def timeseries_window(self):
+        """Raw window in Edge Impulse order: sample 0 of every channel, then sample 1, ..."""
+        columns = [channel.values() for channel in self.channels]
+        return [column[i] for i in range(len(columns[0])) for column in columns]
+
+    def summary_features(self):
+        features = []
+        for channel in self.channels:
+            features.extend(channel.summary())
+        return features
+
+    def summary_names(self):
+        return [f'{name}_{stat}' for name in self.channel_names for stat in SUMMARY_NAMES]
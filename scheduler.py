@@ -0,0 +1,138 @@
+"""Fixed-rate cycle scheduler for the sensor loops.
+
+Sleeping a fixed second after the work makes every cycle last 1 s plus the work, so the
+rate drifts below the 1 Hz the SGP30 IAQ algorithm needs. FixedRateScheduler instead
+wakes up on a fixed grid of deadlines on the monotonic clock (start + n * period), so
+slow cycles do not shift the following ones. Late wake-ups (jitter), overruns and ticks
+that had to be skipped are counted so the real rate can be checked on the device.
+"""
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+
+
+class FixedRateScheduler:
+    '''
+    Deadline based scheduler, call start() once and wait() (or wait_async() in an asyncio
+    task) at the end of every cycle.
+
+    Args:
+        period(float): cycle length in seconds, 0 runs the cycles back to back
+        stop_event(threading.Event): optional, wait() returns False as soon as it is set
+        window(int): number of recent cycles kept for the jitter percentiles
+        clock: time source, default time.monotonic
+    '''
+    def __init__(self, period, stop_event=None, window=300, clock=time.monotonic):
+        self.period = period
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
+        self.clock = clock
+
+        self.cycles = 0    # completed cycles
+        self.overruns = 0  # cycles that were still busy when their deadline had passed
+        self.skipped = 0   # whole ticks dropped because a cycle took longer than a period
+
+        # Running jitter statistics (Welford), jitter = how late we woke up after the deadline
+        self._jitter_count = 0
+        self._jitter_mean = 0.0
+        self._jitter_m2 = 0.0
+        self.jitter_max = 0.0
+        self.recent_jitter = deque(maxlen=window)
+        self.recent_durations = deque(maxlen=window)  # time spent working in each cycle
+
+        self.next_deadline = None
+        self._cycle_start = None
+
+    def start(self):
+        """Start the grid at the current time."""
+        self.next_deadline = self.clock()
+        self._cycle_start = self.next_deadline
+
+    def wait(self):
+        """Sleep until the next deadline. Returns False if the stop event was set."""
+        delay = self._end_cycle()
+        if delay is not None:
+            if delay > 0 and self.stop_event.wait(delay):
+                return False
+            self._begin_cycle()
+        return not self.stop_event.is_set()
+
+    async def wait_async(self):
+        """wait() for asyncio tasks: the loop keeps running while waiting, cancel the task to stop it."""
+        delay = self._end_cycle()
+        if delay is None:
+            await asyncio.sleep(0)  # still let the other tasks run
+        else:
+            await asyncio.sleep(delay)
+            self._begin_cycle()
+        return not self.stop_event.is_set()
+
+    def _end_cycle(self):
+        """Count the finished cycle and move the deadline, returns the seconds to sleep (None = no pacing)."""
+        if self.next_deadline is None:
+            self.start()
+
+        now = self.clock()
+        self.recent_durations.append(now - self._cycle_start)
+        self.cycles += 1
+
+        if self.period <= 0:  # no pacing, e.g. replays as fast as possible
+            self._cycle_start = now
+            return None
+
+        self.next_deadline += self.period
+        if now > self.next_deadline:
+            # The cycle was longer than a period: run the next one right away, but drop the
+            # ticks that were missed completely instead of bursting to catch up with them
+            self.overruns += 1
+            missed = math.floor((now - self.next_deadline) / self.period)
+            if missed:
+                self.skipped += missed
+                self.next_deadline += missed * self.period
+            return 0.0
+        return self.next_deadline - now
+
+    def _begin_cycle(self):
+        self._cycle_start = self.clock()
+        self._record_jitter(max(0.0, self._cycle_start - self.next_deadline))
+
+    def _record_jitter(self, jitter):
+        self.recent_jitter.append(jitter)
+        self.jitter_max = max(self.jitter_max, jitter)
+        self._jitter_count += 1
+        delta = jitter - self._jitter_mean
+        self._jitter_mean += delta / self._jitter_count
+        self._jitter_m2 += delta * (jitter - self._jitter_mean)
+
+    def stats(self):
+        """Return the telemetry as a dict (times in milliseconds)."""
+        recent = sorted(self.recent_jitter)
+        durations = self.recent_durations
+        return {
+            'period_ms': self.period * 1000,
+            'cycles': self.cycles,
+            'overruns': self.overruns,
+            'skipped_ticks': self.skipped,
+            'jitter_mean_ms': self._jitter_mean * 1000,
+            'jitter_std_ms': math.sqrt(self._jitter_m2 / self._jitter_count) * 1000 if self._jitter_count else 0.0,
+            'jitter_max_ms': self.jitter_max * 1000,
+            'jitter_p50_ms': _percentile(recent, 50) * 1000,
+            'jitter_p99_ms': _percentile(recent, 99) * 1000,
+            'cycle_mean_ms': sum(durations) / len(durations) * 1000 if durations else 0.0,
+            'cycle_max_ms': max(durations) * 1000 if durations else 0.0,
+        }
+
+    def report(self):
+        """One line summary for the console."""
+        s = self.stats()
+        return ('Scheduler: {cycles} cycles, {overruns} overruns, {skipped_ticks} skipped ticks, '
+                'jitter mean {jitter_mean_ms:.2f} ms / p99 {jitter_p99_ms:.2f} ms / max {jitter_max_ms:.2f} ms, '
+                'work mean {cycle_mean_ms:.1f} ms / max {cycle_max_ms:.1f} ms').format(**s)
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percent / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
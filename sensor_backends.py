@@ -0,0 +1,622 @@
+"""Sensor backends for the eNose.
+
+A backend owns the sensors and returns one SensorFrame per read_frame() call.
+HardwareSensorBackend talks to the real SGP30/BME680 array through the two TCA9548A muxes,
+ReplaySensorBackend streams frames from the recorded CSVs in Assets/Collected_Data so the
+programs can run (and be load tested) on a normal Linux box without the Pi, and
+DaemonSensorBackend receives the frames of acquisition_daemon.py, so several programs can
+share the sensors.
+
+With a raw rate (`--raw`) the hardware backend also reads the raw H2 and ethanol signals of the
+six classifier sensors (SGP30_5 to SGP30_10) several times per second. iaq_measure() is still
+called once per second: the frames in between carry the last eCO2/TVOC values (iaq_fresh=False)
+and new raw signals.
+"""
+import os
+import csv
+import glob
+import time
+import logging
+
+from metrics import METRICS
+from sgp30_baselines import BaselineStore, sensor_key
+from sensor_health import SensorHealth, CIRCUIT_OPEN
+
+log = logging.getLogger(__name__)
+
+SGP30_COUNT = 10
+SAMPLE_PERIOD = 1.0  # seconds, iaq_measure() has to be called once per second
+RAW_RATE = 4.0  # default raw signal reads per second with --raw
+RAW_SGP30 = range(4, SGP30_COUNT)  # the sensors of the model features (SGP30_5 to SGP30_10)
+
+# (mux address, mux channel) for every SGP30, index 0 = SGP30_1
+SGP30_CHANNELS = [
+    (0x70, 0),  # SGP30_1
+    (0x70, 1),  # SGP30_2
+    (0x70, 2),  # SGP30_3
+    (0x70, 3),  # SGP30_4
+    (0x70, 4),  # SGP30_5
+    (0x70, 5),  # SGP30_6
+    (0x70, 6),  # SGP30_7
+    (0x70, 7),  # SGP30_8
+    (0x71, 0),  # SGP30_9
+    (0x71, 1),  # SGP30_10
+]
+
+MUX_ADDRESSES = (0x70, 0x71)  # Note: 0x71 needs the two A0 pads on the module shorted
+
+# Labels (device, mux, channel) for the metrics
+SGP30_LABELS = [(f'SGP30_{i + 1}', f'0x{address:02x}', str(channel)) for i, (address, channel) in enumerate(SGP30_CHANNELS)]
+BME680_LABELS = ('BME680', '', '')
+
+SENSOR_READ_SECONDS = METRICS.histogram('enose_sensor_read_seconds', 'Time to read one sensor', ('device', 'mux', 'channel'))
+SENSOR_ERRORS = METRICS.counter('enose_sensor_errors_total', 'Failed sensor reads', ('device', 'mux', 'channel'))
+SENSOR_CIRCUIT_OPEN = METRICS.gauge('enose_sensor_circuit_open', '1 while the sensor is skipped after repeated failures', ('device', 'mux', 'channel'))
+
+
+class SensorFrame:
+    """One reading of the whole sensor array."""
+    def __init__(self, timestamp, co2, tvoc, bme680=None, errors=None, label=None, sample_times=None,
+                 bme680_time=None, h2=None, ethanol=None, raw_times=None, iaq_fresh=True):
+        self.timestamp = timestamp  # seconds on the backend clock (recording time for replays), start of the cycle
+        self.co2 = co2              # 10 eCO2 values in ppm, None where the sensor was not read
+        self.tvoc = tvoc            # 10 TVOC values in ppb, None where the sensor was not read
+        self.bme680 = bme680        # dict with temperature, humidity, pressure, gas_resistance, heat_stable (or None)
+        self.errors = errors if errors is not None else {}  # sensor index -> error message (CIRCUIT_OPEN if skipped)
+        self.label = label          # label of the recording for replayed frames
+        # time.monotonic_ns() when every SGP30 (None where not read) and the BME680 were read,
+        # None for replays; see frame_alignment.py
+        self.sample_times = sample_times
+        self.bme680_time = bme680_time
+        # Raw signals (SGP30 ticks, lower = more gas) of the sensors read in raw mode, None where not read,
+        # and time.monotonic_ns() of their reads. None without raw mode
+        self.h2 = h2
+        self.ethanol = ethanol
+        self.raw_times = raw_times
+        self.iaq_fresh = iaq_fresh  # False: co2, tvoc and bme680 are held from the last iaq_measure() cycle
+
+
+class HardwareSensorBackend:
+    '''
+    The real sensor array: 10 SGP30 behind two TCA9548A muxes plus the BME680.
+
+    Args:
+        used_sgp30(iterable): indexes of the SGP30 sensors to initialize and read, default all 10
+        baselines(BaselineStore): where the SGP30 IAQ baselines are restored from and saved to,
+            None to start every sensor from scratch
+        health(SensorHealth): circuit breakers of the SGP30 sensors, default one with the standard backoff
+        raw_rate(float): frames per second with raw H2/ethanol reads of the used RAW_SGP30 sensors
+            (between the once per second IAQ cycles), None for the plain 1 Hz IAQ readings
+        sgp30_sensors(list): the SGP30 sensor objects in SGP30_CHANNELS order instead of the ones
+            on the muxes, e.g. fakes for tests and benchmarks off the Pi
+        bme680_sensor: configured BME680 sensor object, None to set up the real one in init()
+    '''
+    period = SAMPLE_PERIOD
+    raw_sgp30 = []
+
+    def __init__(self, used_sgp30=range(SGP30_COUNT), baselines=None, health=None, raw_rate=None,
+                 sgp30_sensors=None, bme680_sensor=None):
+        if sgp30_sensors is None:
+            # Hardware libraries are only imported here so the module can be used off the Pi
+            import board
+            import adafruit_tca9548a
+            import adafruit_sgp30
+
+            self.i2c = board.I2C()  # uses board.SCL and board.SDA
+            self.muxes = {address: adafruit_tca9548a.TCA9548A(self.i2c, address=address) for address in MUX_ADDRESSES}
+
+            # For each sensor, create it using the TCA9548A channel instead of the I2C object
+            sgp30_sensors = [adafruit_sgp30.Adafruit_SGP30(self.muxes[address][channel])
+                             for address, channel in SGP30_CHANNELS]
+        else:
+            self.i2c = None
+            self.muxes = {}
+        if len(sgp30_sensors) != SGP30_COUNT:
+            raise ValueError(f"Expected {SGP30_COUNT} SGP30 sensors, got {len(sgp30_sensors)}")
+        self.sgp30_sensors = list(sgp30_sensors)
+        self.used_sgp30 = list(used_sgp30)
+        self.bme680_sensor = bme680_sensor  # initialized in init() if not given
+        self.bme680_time = None    # time.monotonic_ns() of the last BME680 read
+        self.baselines = baselines
+        if health is None:
+            health = SensorHealth(self.used_sgp30, names={i: f'SGP30_{i + 1}' for i in self.used_sgp30})
+        self.health = health
+        if raw_rate:
+            self.period = 1.0 / raw_rate
+            self.raw_sgp30 = [i for i in self.used_sgp30 if i in RAW_SGP30]
+        self._iaq_frame = None  # last IAQ frame, held by the raw cycles
+        self._iaq_ns = 0
+        self._h2 = [None] * SGP30_COUNT
+        self._ethanol = [None] * SGP30_COUNT
+        self._raw_times = [None] * SGP30_COUNT
+
+    def init(self):
+        """Configure the BME680 (unless one was given) and start the IAQ algorithm on the used SGP30 sensors."""
+        if self.bme680_sensor is None:
+            self.start_bme680()
+
+        log.info('Initializing SGP30 sensors...')
+        restored = 0
+        for i in self.used_sgp30:
+            try:
+                restored += self.start_sgp30(i)
+            except Exception as e:  # Runs without it, the circuit breaker tries again later
+                self.health.trip(i, e)
+                SENSOR_CIRCUIT_OPEN.set(1, SGP30_LABELS[i])
+        if self.baselines is not None:
+            log.info('Restored the saved baseline of %d of %d SGP30 sensors.', restored, len(self.used_sgp30))
+
+    def start_bme680(self):
+        """Initialize the BME680 and set up its oversampling, filter and gas heater."""
+        import bme680
+
+        # Initialize the BME680 sensor
+        try:
+            self.bme680_sensor = bme680.BME680(bme680.I2C_ADDR_PRIMARY)
+        except (RuntimeError, IOError):  # If the primary address fails, try the secondary address
+            self.bme680_sensor = bme680.BME680(bme680.I2C_ADDR_SECONDARY)
+
+        # Oversampling & Filter Settings... for improved accuracy and noise reduction
+        self.bme680_sensor.set_humidity_oversample(bme680.OS_2X)
+        self.bme680_sensor.set_temperature_oversample(bme680.OS_8X)
+        self.bme680_sensor.set_filter(bme680.FILTER_SIZE_3)
+        self.bme680_sensor.set_gas_status(bme680.ENABLE_GAS_MEAS)
+
+        # Print all available sensor data fields immediately after startup, even if they're uninitialized.
+        log.debug('Initial reading: %s', ', '.join('{}: {}'.format(name, getattr(self.bme680_sensor.data, name))
+                                                    for name in dir(self.bme680_sensor.data) if not name.startswith('_')))
+
+        # Set up the gas sensor heater
+        self.bme680_sensor.set_gas_heater_temperature(320)
+        self.bme680_sensor.set_gas_heater_duration(150)
+        self.bme680_sensor.select_gas_heater_profile(0)
+
+    def start_sgp30(self, i):
+        """iaq_init() on SGP30 `i` and write back its saved baseline. Returns True if a baseline was restored."""
+        self.sgp30_sensors[i].iaq_init()
+        # The saved baseline has to be written right after iaq_init()
+        if self.baselines is not None:
+            try:
+                return self.baselines.restore(sensor_key(*SGP30_CHANNELS[i]), self.sgp30_sensors[i])
+            except Exception as e:
+                log.warning("SGP30_%d: could not restore the baseline: %s", i + 1, e)
+        return False
+
+    def save_baselines(self):
+        """Save the IAQ baselines of the used SGP30 sensors (the ones that have a valid baseline and answer)."""
+        if self.baselines is None:
+            return 0
+        return self.baselines.save({sensor_key(*SGP30_CHANNELS[i]): self.sgp30_sensors[i]
+                                    for i in self.used_sgp30 if not self.health.is_open(i)})
+
+    def read_bme680(self):
+        """Return the BME680 reading as a dict, or None if no new data was available."""
+        start = time.monotonic_ns()
+        new_data = self.bme680_sensor.get_sensor_data()
+        end = time.monotonic_ns()
+        SENSOR_READ_SECONDS.observe((end - start) / 1e9, BME680_LABELS)
+        self.bme680_time = (start + end) // 2
+        if not new_data:
+            return None
+        data = self.bme680_sensor.data
+        return {
+            'temperature': data.temperature,
+            'humidity': data.humidity,
+            'pressure': data.pressure,
+            'gas_resistance': data.gas_resistance,
+            'heat_stable': data.heat_stable,
+        }
+
+    def read_frame(self):
+        timestamp_ns = time.monotonic_ns()
+        if self.raw_sgp30 and not self._iaq_due(timestamp_ns):
+            return self.read_raw_frame(timestamp_ns)
+        frame = self.read_iaq_frame(timestamp_ns)
+        if self.raw_sgp30:
+            self._iaq_frame = frame
+            self._iaq_ns = timestamp_ns
+            # The raw signals of the last raw cycle, the IAQ cycle has no time left for them
+            frame.h2, frame.ethanol, frame.raw_times = list(self._h2), list(self._ethanol), list(self._raw_times)
+
+        # About once an hour, takes one extra I2C read per sensor
+        if self.baselines is not None and self.baselines.due():
+            self.save_baselines()
+        return frame
+
+    def _iaq_due(self, timestamp_ns):
+        # By time instead of counting cycles, so an overrun (skipped tick) does not shift the IAQ cadence
+        return self._iaq_frame is None or timestamp_ns - self._iaq_ns >= (SAMPLE_PERIOD - self.period / 2) * 1e9
+
+    def read_iaq_frame(self, timestamp_ns):
+        """iaq_measure() on the used SGP30 sensors and the BME680 reading."""
+        co2 = [None] * SGP30_COUNT
+        tvoc = [None] * SGP30_COUNT
+        sample_times = [None] * SGP30_COUNT
+        errors = {}
+        probed = False
+
+        for i in self.used_sgp30:
+            sensor = self.sgp30_sensors[i]
+            if self.health.is_open(i):
+                # Failing sensors are skipped, at most one of them is probed per cycle
+                errors[i] = CIRCUIT_OPEN
+                if probed or not self.health.probe_due(i):
+                    self.health.skip(i)
+                    continue
+                probed = True
+                try:
+                    # Start it again in case it lost power, the readings are valid from the next cycle on
+                    self.start_sgp30(i)
+                    self.health.record_success(i)
+                    SENSOR_CIRCUIT_OPEN.set(0, SGP30_LABELS[i])
+                except Exception as e:
+                    self.health.record_failure(i, e)
+                continue
+
+            start = time.monotonic_ns()
+            try:
+                sensor.iaq_measure()  # Must call this every second
+                co2[i] = sensor.eCO2
+                tvoc[i] = sensor.TVOC
+                self.health.record_success(i)
+            except Exception as e:
+                errors[i] = str(e)
+                SENSOR_ERRORS.inc(SGP30_LABELS[i])
+                self.health.record_failure(i, e)
+                if self.health.is_open(i):
+                    SENSOR_CIRCUIT_OPEN.set(1, SGP30_LABELS[i])
+            end = time.monotonic_ns()
+            sample_times[i] = (start + end) // 2  # the middle of the I2C transaction
+            SENSOR_READ_SECONDS.observe((end - start) / 1e9, SGP30_LABELS[i])
+
+        bme680 = self.read_bme680()
+        frame = SensorFrame(timestamp_ns / 1e9, co2, tvoc, bme680, errors, sample_times=sample_times,
+                            bme680_time=self.bme680_time if bme680 is not None else None)
+        return frame
+
+    def read_raw_frame(self, timestamp_ns):
+        """raw_measure() on the raw sensors, with the eCO2/TVOC and BME680 values of the last IAQ cycle."""
+        for i in self.raw_sgp30:
+            if self.health.is_open(i):  # probed on the IAQ cycles
+                self._h2[i] = self._ethanol[i] = None
+                continue
+            start = time.monotonic_ns()
+            try:
+                self._h2[i], self._ethanol[i] = self.sgp30_sensors[i].raw_measure()
+                self._raw_times[i] = (start + time.monotonic_ns()) // 2
+                self.health.record_success(i)
+            except Exception as e:
+                self._h2[i] = self._ethanol[i] = None
+                SENSOR_ERRORS.inc(SGP30_LABELS[i])
+                self.health.record_failure(i, e)
+                if self.health.is_open(i):
+                    SENSOR_CIRCUIT_OPEN.set(1, SGP30_LABELS[i])
+
+        held = self._iaq_frame
+        return SensorFrame(timestamp_ns / 1e9, held.co2, held.tvoc, held.bme680, held.errors,
+                           sample_times=held.sample_times, bme680_time=held.bme680_time,
+                           h2=list(self._h2), ethanol=list(self._ethanol), raw_times=list(self._raw_times),
+                           iaq_fresh=False)
+
+    def close(self):
+        self.save_baselines()
+
+
+class ReplaySensorBackend:
+    '''
+    Streams frames from recorded label.YYYYMMDD_HHMMSS.csv files.
+
+    Both CSV schemas are understood (with and without the BME680_pressure column).
+    Frames are returned without waiting, the caller paces itself with `period`.
+
+    Args:
+        path(str): a CSV file or a directory that is searched recursively for CSV files
+        speed(float): replay speed, 1 = real time, 10 = ten times faster, 0 = as fast as possible
+        loop(bool): start again from the first file when the last one is finished
+        labels(iterable): optional, only replay files with these labels
+    '''
+    raw_sgp30 = []  # raw signal columns (SGP30_5_H2, ...) are replayed when a recording has them
+
+    def __init__(self, path, speed=1.0, loop=False, labels=None):
+        if os.path.isdir(path):
+            files = glob.glob(os.path.join(path, '**', '*.csv'), recursive=True)
+        else:
+            files = [path]
+        if labels is not None:
+            labels = set(labels)
+            files = [f for f in files if recording_label(f) in labels]
+        # Replay in recording order, the timestamp is the part of the file name after the label
+        self.files = sorted(files, key=lambda f: (os.path.basename(f).split('.')[-2], f))
+        if not self.files:
+            raise FileNotFoundError(f"No CSV recordings found in {path}")
+
+        self.speed = speed
+        self.period = SAMPLE_PERIOD / speed if speed > 0 else 0.0
+        self.loop = loop
+        self.used_sgp30 = list(range(4, SGP30_COUNT))  # the recordings only contain SGP30_5 to SGP30_10
+        self._frames = self._iter_frames()
+
+    def init(self):
+        log.info("Replaying %d recorded files at %sx speed.", len(self.files), self.speed)
+
+    def _iter_frames(self):
+        clock = 0.0  # recording time, keeps increasing across files
+        while True:
+            for filename in self.files:
+                label = recording_label(filename)
+                file_start = clock
+                with open(filename, newline='') as f:
+                    for row in csv.DictReader(f):
+                        clock = file_start + _to_float(row.get('timestamp'), 0.0) / 1000.0
+                        yield frame_from_row(row, clock, label)
+                clock += SAMPLE_PERIOD
+            if not self.loop:
+                return
+
+    def read_frame(self):
+        """Return the next recorded frame, or None when the replay is finished."""
+        return next(self._frames, None)
+
+    def close(self):
+        self._frames.close()
+
+
+class DaemonSensorBackend:
+    '''
+    Frames from a running acquisition_daemon.py (over its Unix domain socket).
+
+    The daemon paces the readings, read_frame() waits for the next one, so `period` is 0.
+    When the daemon goes away the backend tries to connect again for `reconnect_timeout` seconds,
+    unless stop() was called. A daemon with another protocol version is refused.
+
+    Frames pile up in the socket while the program does not read (e.g. while the collector waits
+    for a label). read_frame() then only returns the newest frame that is already there and skips
+    frames older than two daemon periods (at least 1 s), the skipped ones count as `missed`.
+
+    Args:
+        path(str): socket of the daemon, default acquisition_daemon.DEFAULT_SOCKET
+        reconnect_timeout(float): seconds to wait for the daemon (also when starting)
+    '''
+    period = 0.0
+
+    def __init__(self, path=None, reconnect_timeout=30.0):
+        import threading
+        from acquisition_daemon import DEFAULT_SOCKET
+
+        self.path = path if path is not None else DEFAULT_SOCKET
+        self.reconnect_timeout = reconnect_timeout
+        self.used_sgp30 = list(range(SGP30_COUNT))  # updated from the daemon's hello
+        self.raw_sgp30 = []
+        self.sock = None
+        self.last_sequence = None
+        self.missed = 0  # frames the daemon dropped for us or that were skipped as stale (gaps in the sequence numbers)
+        self.stale_after = 1.0  # seconds, from the daemon's period (hello)
+        self._stopped = threading.Event()
+
+    def init(self):
+        if not self._connect():
+            raise ConnectionError(f"No acquisition daemon on {self.path}")
+
+    def _connect(self):
+        import json
+        import socket
+        from acquisition_daemon import read_message, PROTOCOL_VERSION
+
+        deadline = time.monotonic() + self.reconnect_timeout
+        while not self._stopped.is_set():
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+                hello = read_message(sock)
+                if hello is not None:
+                    break
+            except OSError:
+                pass
+            sock.close()
+            if time.monotonic() >= deadline:
+                return False
+            self._stopped.wait(1.0)
+        else:
+            return False
+        hello = json.loads(hello)
+        if hello.get('version') != PROTOCOL_VERSION:
+            sock.close()
+            log.error("The acquisition daemon on %s speaks protocol version %s, this program needs version %d. "
+                      "Restart the daemon from the same checkout.", self.path, hello.get('version'), PROTOCOL_VERSION)
+            raise ConnectionError(f"Acquisition daemon protocol version {hello.get('version')} is not supported")
+        self.sock = sock
+        self.used_sgp30 = hello['used_sgp30']
+        self.raw_sgp30 = hello.get('raw_sgp30', [])
+        self.stale_after = max(2 * hello.get('period', 1.0), 1.0)
+        self.last_sequence = None
+        log.info("Receiving sensor frames from the acquisition daemon on %s", self.path)
+        return True
+
+    def read_frame(self):
+        """Wait for the next recent frame of the daemon, None if the daemon stopped and did not come back."""
+        from acquisition_daemon import decode_frame
+
+        while True:
+            payload = self._read_payload()
+            if payload is None:
+                return None
+            # Frames that queued up while nobody read: only the newest one that is already here is used
+            while self._pending():
+                newer = self._read_payload()
+                if newer is None:
+                    return None
+                payload = newer
+
+            sequence, wall_time, frame = decode_frame(payload)
+            if time.time() - wall_time > self.stale_after:  # still old, wait for a fresh one
+                continue
+            if self.last_sequence is not None and sequence > self.last_sequence + 1:
+                self.missed += sequence - self.last_sequence - 1
+            self.last_sequence = sequence
+            return frame
+
+    def _pending(self):
+        """True if data of the next message is already waiting in the socket."""
+        import select
+
+        return self.sock is not None and bool(select.select([self.sock], [], [], 0)[0])
+
+    def _read_payload(self):
+        """Next message from the daemon (reconnects if needed), None if there is no daemon any more."""
+        from acquisition_daemon import read_message
+
+        while True:
+            payload = None
+            if self.sock is not None:
+                try:
+                    payload = read_message(self.sock)
+                except OSError:
+                    pass
+            if payload is not None:
+                break
+            self._close_socket()
+            if self._stopped.is_set():
+                return None
+            log.warning("Lost the connection to the acquisition daemon, reconnecting...")
+            try:
+                if not self._connect():
+                    return None
+            except ConnectionError:  # a daemon of another version came up, already logged
+                return None
+        return payload
+
+    def stop(self):
+        """Make a waiting read_frame() return None and stop reconnecting, may be called from any thread."""
+        import socket
+
+        self._stopped.set()
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)  # wakes up a blocked recv()
+            except OSError:
+                pass
+
+    def _close_socket(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def close(self):
+        self._stopped.set()
+        self._close_socket()
+
+
+def recording_label(filename):
+    """'chocolate.20250807_162632.csv' -> 'chocolate'"""
+    return os.path.basename(filename).rsplit('.', 2)[0]
+
+
+def _to_float(value, default=None):
+    if value is None or value.strip() == '':
+        return default
+    return float(value)
+
+
+def frame_from_row(row, timestamp, label=None):
+    """Build a SensorFrame from one CSV row (a dict keyed by the CSV header)."""
+    co2 = [None] * SGP30_COUNT
+    tvoc = [None] * SGP30_COUNT
+    errors = {}
+    for i in range(SGP30_COUNT):
+        c = _to_float(row.get(f'SGP30_{i+1}_CO2'))
+        t = _to_float(row.get(f'SGP30_{i+1}_TVOC'))
+        if c is not None and t is not None:
+            co2[i] = int(c)
+            tvoc[i] = int(t)
+        elif f'SGP30_{i+1}_CO2' in row:
+            errors[i] = 'missing in recording'
+
+    bme680 = None
+    temperature = _to_float(row.get('BME680_temp'))
+    humidity = _to_float(row.get('BME680_humidity'))
+    if temperature is not None and humidity is not None:
+        gas = _to_float(row.get('BME680_gas'))
+        bme680 = {
+            'temperature': temperature,
+            'humidity': humidity,
+            'pressure': _to_float(row.get('BME680_pressure')),  # only in the older recordings
+            'gas_resistance': gas if gas is not None else 0.0,
+            'heat_stable': gas is not None,
+        }
+
+    # Raw signals, only in recordings made in raw mode
+    h2 = ethanol = None
+    if any(f'SGP30_{i+1}_H2' in row for i in RAW_SGP30):
+        h2 = [None] * SGP30_COUNT
+        ethanol = [None] * SGP30_COUNT
+        for i in RAW_SGP30:
+            h = _to_float(row.get(f'SGP30_{i+1}_H2'))
+            e = _to_float(row.get(f'SGP30_{i+1}_Ethanol'))
+            if h is not None and e is not None:
+                h2[i] = int(h)
+                ethanol[i] = int(e)
+
+    return SensorFrame(timestamp, co2, tvoc, bme680, errors, label, h2=h2, ethanol=ethanol)
+
+
+def backend_from_args(args, used_sgp30=range(SGP30_COUNT)):
+    """
+    Pick the sensor backend from the command line.
+
+    `--replay PATH` replays recordings instead of reading the hardware, `--speed N` sets the
+    replay speed and `--loop` repeats the recordings forever. The hardware backend restores and
+    saves the SGP30 baselines in sgp30_baselines.json, `--baselines PATH` uses another file and
+    `--no-baselines` starts the sensors from scratch. `--daemon` takes the frames from a running
+    acquisition_daemon.py instead (`--socket PATH` if it does not use the default socket).
+    `--raw` adds the raw H2/ethanol reads of the hardware backend at RAW_RATE frames per second,
+    `--raw-rate N` at N per second (a whole number, at least 2).
+    Returns (backend, remaining args).
+    """
+    args = list(args)
+    replay_path = None
+    baseline_path = None
+    use_baselines = True
+    speed = 1.0
+    loop = False
+    daemon = False
+    socket_path = None
+    raw_rate = None
+    remaining = []
+    while args:
+        arg = args.pop(0)
+        if arg == '--replay':
+            replay_path = args.pop(0)
+        elif arg == '--speed':
+            speed = float(args.pop(0))
+        elif arg == '--loop':
+            loop = True
+        elif arg == '--baselines':
+            baseline_path = args.pop(0)
+        elif arg == '--no-baselines':
+            use_baselines = False
+        elif arg == '--daemon':
+            daemon = True
+        elif arg == '--socket':
+            daemon = True
+            socket_path = args.pop(0)
+        elif arg == '--raw':
+            raw_rate = RAW_RATE
+        elif arg == '--raw-rate':
+            raw_rate = float(args.pop(0))
+        else:
+            remaining.append(arg)
+
+    if raw_rate is not None and (raw_rate < 2 or raw_rate != int(raw_rate)):
+        # iaq_measure() has to run once per second, on every raw_rate-th frame
+        raise ValueError(f"--raw-rate must be a whole number of frames per second, at least 2 (got {raw_rate:g})")
+    if raw_rate is not None and (daemon or replay_path is not None):
+        log.warning("The raw signals are only read from the hardware (start the daemon with --raw), ignoring the raw rate.")
+    if daemon:
+        return DaemonSensorBackend(socket_path), remaining
+    if replay_path is not None:
+        return ReplaySensorBackend(replay_path, speed=speed, loop=loop), remaining
+    baselines = None
+    if use_baselines:
+        baselines = BaselineStore(baseline_path) if baseline_path is not None else BaselineStore()
+    return HardwareSensorBackend(used_sgp30, baselines, raw_rate=raw_rate), remaining
@@ -0,0 +1,113 @@
+"""Circuit breakers for the SGP30 channels.
+
+A sensor that stopped answering (unplugged, a loose cable on the mux channel) makes every
+read wait for the I2C error, every cycle. SensorHealth counts the consecutive failures per
+sensor and opens its circuit after `failure_threshold` of them: the sensor is not read for
+`base_backoff` seconds, doubled for every further failed probe up to `max_backoff`. When the
+time is up the backend probes the sensor once (at most one probe per cycle, see
+HardwareSensorBackend.read_frame()), a successful probe closes the circuit again.
+
+While a circuit is open the sensor is reported in SensorFrame.errors with the CIRCUIT_OPEN
+message, so its features are missing exactly like after a failed read.
+"""
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+CIRCUIT_OPEN = 'circuit open'  # SensorFrame.errors message of sensors that were skipped
+
+CLOSED = 'closed'  # read every cycle
+OPEN = 'open'      # skipped until the retry time
+
+
+class _Channel:
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0       # consecutive failed reads or probes
+        self.backoff = 0.0      # seconds of the current open interval
+        self.retry_at = 0.0     # clock value from which a probe is due
+        self.opened = 0         # times the circuit was opened
+        self.last_error = None
+
+
+class SensorHealth:
+    '''
+    Args:
+        keys(iterable): the sensors, e.g. the SGP30 indexes
+        failure_threshold(int): consecutive failures that open the circuit
+        base_backoff(float): seconds the circuit stays open the first time
+        max_backoff(float): upper limit of the doubling open interval
+        names(dict): optional key -> name for the log messages
+        clock: time source, default time.monotonic
+    '''
+    def __init__(self, keys, failure_threshold=3, base_backoff=2.0, max_backoff=300.0, names=None,
+                 clock=time.monotonic):
+        self.channels = {key: _Channel() for key in keys}
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.names = names or {}
+        self.clock = clock
+        self.skipped = 0  # reads saved by open circuits
+        self.probes = 0
+
+    def is_open(self, key):
+        return self.channels[key].state == OPEN
+
+    def probe_due(self, key):
+        channel = self.channels[key]
+        return channel.state == OPEN and self.clock() >= channel.retry_at
+
+    def skip(self, key):
+        """Count a read that was not done because the circuit is open."""
+        self.skipped += 1
+
+    def record_success(self, key):
+        channel = self.channels[key]
+        if channel.failures == 0:  # the usual case, nothing to reset
+            return
+        if channel.state == OPEN:
+            self.probes += 1
+            log.info("%s answers again, circuit closed after %d failures.", self._name(key), channel.failures)
+        channel.state = CLOSED
+        channel.failures = 0
+        channel.backoff = 0.0
+        channel.last_error = None
+
+    def record_failure(self, key, error):
+        channel = self.channels[key]
+        channel.failures += 1
+        channel.last_error = str(error)
+        if channel.state == OPEN:  # failed probe, wait twice as long
+            self.probes += 1
+            channel.backoff = min(channel.backoff * 2, self.max_backoff)
+            channel.retry_at = self.clock() + channel.backoff
+            log.debug("%s probe failed, next one in %.0f s: %s", self._name(key), channel.backoff, error)
+        elif channel.failures >= self.failure_threshold:
+            channel.state = OPEN
+            channel.opened += 1
+            channel.backoff = self.base_backoff
+            channel.retry_at = self.clock() + channel.backoff
+            log.warning("%s failed %d times in a row, skipping it for %.0f s: %s",
+                        self._name(key), channel.failures, channel.backoff, error)
+
+    def trip(self, key, error):
+        """Open the circuit right away, e.g. for a sensor that failed to start."""
+        channel = self.channels[key]
+        channel.failures = max(channel.failures, self.failure_threshold - 1)
+        if channel.state != OPEN:
+            self.record_failure(key, error)
+
+    def open_keys(self):
+        return [key for key, channel in self.channels.items() if channel.state == OPEN]
+
+    def _name(self, key):
+        return self.names.get(key, str(key))
+
+    def report(self):
+        open_keys = self.open_keys()
+        text = f"Sensor health: {len(open_keys)} open circuits, {self.skipped} reads skipped, {self.probes} probes"
+        if open_keys:
+            text += ' (' + ', '.join(f'{self._name(key)}: {self.channels[key].last_error}' for key in open_keys) + ')'
+        return text
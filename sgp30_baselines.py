@@ -0,0 +1,116 @@
+"""Saved IAQ baselines of the SGP30 sensors.
+
+iaq_init() resets the baseline the SGP30 uses to compensate its own drift. Without a stored
+baseline the readings are meaningless for the first 15 s and the algorithm needs about 12 h
+to learn a good baseline again. Sensirion recommends saving the baseline regularly and
+writing it back with set_iaq_baseline() right after iaq_init() if it is less than a week old.
+
+BaselineStore keeps the baselines in a small JSON file, one entry per sensor keyed by the
+mux address and channel (so a sensor keeps its baseline when the used sensors change):
+
+    {"0x70/4": {"eCO2": 35187, "TVOC": 36214, "saved": 1754574392.1}, ...}
+"""
+import os
+import json
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+DEFAULT_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sgp30_baselines.json")
+MAX_AGE = 7 * 24 * 3600     # seconds, older baselines are not restored (Sensirion: one week)
+LEARNING_TIME = 12 * 3600   # seconds, a fresh baseline is only saved after the sensor ran this long
+SAVE_INTERVAL = 3600        # seconds between two saves
+
+
+def sensor_key(address, channel):
+    """(0x70, 4) -> '0x70/4'"""
+    return f'0x{address:02x}/{channel}'
+
+
+class BaselineStore:
+    '''
+    Restores and periodically saves the IAQ baselines of a set of SGP30 sensors.
+
+    Args:
+        path(str): the JSON state file
+        max_age(float): seconds after which a saved baseline is too old to be restored
+        learning_time(float): seconds a sensor has to run after iaq_init() without a restored
+            baseline before its baseline is worth saving
+        save_interval(float): seconds between two saves
+    '''
+    def __init__(self, path=DEFAULT_STATE_FILE, max_age=MAX_AGE, learning_time=LEARNING_TIME,
+                 save_interval=SAVE_INTERVAL):
+        self.path = path
+        self.max_age = max_age
+        self.learning_time = learning_time
+        self.save_interval = save_interval
+        self.entries = self._load()
+        self._valid_from = {}    # key -> monotonic time from which the sensor baseline is worth saving
+        self._last_save = time.monotonic()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            log.warning("Ignoring unreadable SGP30 baseline file %s: %s", self.path, e)
+            return {}
+
+    def restore(self, key, sensor):
+        """
+        Call right after sensor.iaq_init(). Writes the saved baseline back if it is fresh enough.
+        Returns True if a baseline was restored.
+        """
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        age = time.time() - entry['saved'] if entry is not None else None
+        if entry is None or age > self.max_age or age < 0:
+            # Learn a new baseline first, the one after iaq_init() is not valid yet
+            self._valid_from[key] = now + self.learning_time
+            return False
+
+        sensor.set_iaq_baseline(entry['eCO2'], entry['TVOC'])
+        self._valid_from[key] = now
+        log.info("SGP30 %s: restored baseline eCO2=0x%04x TVOC=0x%04x (%.1f h old)", key, entry['eCO2'], entry['TVOC'], age / 3600)
+        return True
+
+    def due(self):
+        """True when the save interval has passed (cheap, call it every cycle)."""
+        return time.monotonic() - self._last_save >= self.save_interval
+
+    def save(self, sensors):
+        '''
+        Read the current baselines and write the state file.
+
+        Args:
+            sensors(dict): key -> SGP30 sensor; sensors that are still learning or fail to
+                answer keep their previously saved entry
+        Returns:
+            number of sensors whose baseline was saved
+        '''
+        now = time.monotonic()
+        self._last_save = now
+        saved = 0
+        for key, sensor in sensors.items():
+            if now < self._valid_from.get(key, float('inf')):
+                continue
+            try:
+                eco2, tvoc = sensor.get_iaq_baseline()  # same as the baseline_eCO2 / baseline_TVOC properties, one I2C read
+            except Exception as e:
+                log.warning("SGP30 %s: could not read the baseline: %s", key, e)
+                continue
+            self.entries[key] = {'eCO2': int(eco2), 'TVOC': int(tvoc), 'saved': time.time()}
+            saved += 1
+
+        if saved:
+            from recorder import write_json_atomic  # imported here, recorder.py needs NumPy
+
+            try:
+                write_json_atomic(self.path, self.entries)
+            except OSError as e:
+                log.warning("Could not write the SGP30 baseline file %s: %s", self.path, e)
+                return 0
+        return saved
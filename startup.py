@@ -0,0 +1,64 @@
+"""Startup timeline: records when the init tasks (run in parallel by the caller) started and finished.
+
+Every event is stored with the seconds since the timeline was created (monotonic clock) and
+the thread it ran on. report() prints the timeline, write() appends it as one JSON line to a
+log file, so the time to the first reading can be compared between boots:
+
+    {"boot": "2025-08-07T16:26:32", "events": [[0.0, "MainThread", "start"], ...]}
+"""
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+
+class StartupTimeline:
+    '''
+    Args:
+        start(float): time.monotonic() value to count from, default now
+    '''
+    def __init__(self, start=None):
+        self.start = start if start is not None else time.monotonic()
+        self.boot = datetime.now().isoformat(timespec='seconds')
+        self.events = []  # (seconds since start, thread name, event)
+        self._lock = threading.Lock()
+
+    def mark(self, event, at=None):
+        """Record an event now, or at the time.monotonic() value `at`."""
+        elapsed = (at if at is not None else time.monotonic()) - self.start
+        with self._lock:
+            self.events.append((elapsed, threading.current_thread().name, event))
+
+    def run(self, name, func, *args):
+        """Run func(*args) and record its start and end. Errors are logged and recorded, returns None then."""
+        self.mark(f'{name} started')
+        start = time.monotonic()
+        try:
+            result = func(*args)
+        except Exception as e:
+            self.mark(f'{name} failed after {time.monotonic() - start:.3f} s: {e}')
+            log.error("Startup task '%s' failed: %s", name, e)
+            return None
+        self.mark(f'{name} finished ({time.monotonic() - start:.3f} s)')
+        return result
+
+    def report(self):
+        with self._lock:
+            events = sorted(self.events)
+        lines = [f"Startup timeline ({self.boot}):"]
+        for elapsed, thread, event in events:
+            lines.append(f"  {elapsed:8.3f} s  [{thread}] {event}")
+        return '\n'.join(lines)
+
+    def write(self, path):
+        """Append the timeline as one JSON line to `path`."""
+        with self._lock:
+            events = sorted(self.events)
+        try:
+            with open(path, 'a') as f:
+                f.write(json.dumps({'boot': self.boot, 'events': [[round(e, 4), t, n] for e, t, n in events]}) + '\n')
+        except OSError as e:
+            log.warning("Could not write the startup timeline to %s: %s", path, e)